@@ -15,29 +15,54 @@
 
 import logging
 import time
+import math
 from datetime import datetime
-import LM75
 import sys
-import requests
-from microdotphat import write_string, set_decimal, clear, show
 import os
 import subprocess
-from gpiozero import CPUTemperature
-import RPi.GPIO as GPIO
 import argparse
-import serial
+import multiprocessing
 
 # import sensor interface functions for TBD...
 
 # Import sensor interface functions for RPICT3V1
-#import RPICT3V1
+import RPICT3V1
 
-# Import Domoticz logging functions
-import domoticz
+# Import output backends (Domoticz, MQTT)
+import outputs
 
 # Import sensor configurations
 import sensors
 
+# Import sysfs sensor backend (thermal zones, hwmon, IIO)
+import sysfs
+
+# Import shared-memory ring buffer used by the multi-process mode
+import ringbuffer
+
+# Import compressed segment storage
+import segment
+
+# Import adaptive sampling intervals
+import adaptive
+
+# Import per-sensor health tracking (circuit breakers)
+import health
+
+# Import memory self-reporting
+import memory
+import tracemalloc
+
+# Import clocks and replay sources (replay mode)
+import clock
+import replay
+
+# Import the log record format
+import logreader
+
+# Import GPIO pulse counters
+import counters
+
 # Import authentication keys
 from key import IFTTT_KEY
 
@@ -62,8 +87,75 @@ parser.add_argument('-DebugLevel', action='store', dest='DebugLevel', default=0,
 parser.add_argument('-LogLevel', action='store', dest='LogLevel', default=0,
                     help='Configures log functions (0 = no logging)')
 
+parser.add_argument('-SegmentFile', action='store', dest='SegmentFile', default='',
+                    help='Store readings in a compressed segment file instead of the text log (e.g. logs/history.seg)')
+
+parser.add_argument('-SegmentFlush', action='store', dest='SegmentFlush', default=600,
+                    help='Write the readings held in memory to the segment file at least this often (seconds)')
+
+parser.add_argument('-Adaptive', action='store', dest='Adaptive', default=0,
+                    help='Adapt each sensor\'s measurement interval to its activity (0 = fixed MeasurementInterval)')
+
+parser.add_argument('-MultiProcess', action='store', dest='MultiProcess', default=0,
+                    help='Run uploader, storage, display & alerting in separate processes (0 = single process)')
+
+parser.add_argument('-HealthFile', action='store', dest='HealthFile', default='logs/health.json',
+                    help='File for the sensor health snapshot (JSON), written every LogInterval or MeasurementInterval, if longer (\'\' = none)')
+
+parser.add_argument('-LogMaxBytes', action='store', dest='LogMaxBytes', default=16000000,
+                    help='Start a new log file when the current one reaches this size in bytes (0 = never)')
+
+parser.add_argument('-MemoryReport', action='store', dest='MemoryReport', default=3600,
+                    help='Memory self-report interval in seconds (0 = none)')
+
+parser.add_argument('-TraceMalloc', action='store', dest='TraceMalloc', default=0,
+                    help='Trace Python heap allocations (tracemalloc) for the memory self-report (0 = off)')
+
+parser.add_argument('-MemoryLog', action='store', dest='MemoryLog', default='',
+                    help='Append every memory self-report to this file as a JSON line (\'\' = none)')
+
+parser.add_argument('-Replay', action='store', dest='Replay', default='',
+                    help='Replay a recorded or synthetic trace (log or segment file) on a virtual clock')
+
+parser.add_argument('-ReplayPulses', action='store', dest='ReplayPulses', default='',
+                    help='GPIO pulse file to replay with the trace ("<time>;<pin>" lines)')
+
+parser.add_argument('-ReplayRPICT3V1', action='store', dest='ReplayRPICT3V1', default='',
+                    help='RPICT3V1 frame file to replay with the trace ("<time>;<frame>" lines)')
+
+parser.add_argument('-ReplayOutput', action='store', dest='ReplayOutput', default='logs/replay.log',
+                    help='Log file written by a replay')
+
+parser.add_argument('-TZ', action='store', dest='TZ', default='',
+                    help='Time zone for local times (daily resets, T1, log timestamps), e.g. Europe/London (\'\' = the system\'s)')
+
+parser.add_argument('-Config', action='store', dest='Config', default='',
+                    help='Python file of sensor settings applied over sensors.py (e.g. for a second logger or a test)')
+
+parser.add_argument('-ReplayUpload', action='store', dest='ReplayUpload', default=0,
+                    help='Send a replay\'s readings to the output backends too, e.g. test servers (0 = no uploads)')
+
 arguments = parser.parse_args()
 
+# Time zone...
+# Local time decides the daily resets, so a replay is only repeatable with a fixed time zone
+if arguments.TZ != '':
+	os.environ['TZ'] = arguments.TZ
+	time.tzset()
+
+# Sensor configuration overrides...
+# Settings in the -Config file replace those of sensors.py; ActiveSensors follows SensorName
+# unless the file sets it
+if arguments.Config != '':
+	Config = {}
+	with open(arguments.Config) as f:
+		exec(compile(f.read(), arguments.Config, 'exec'), Config)
+	if 'SensorName' in Config and 'ActiveSensors' not in Config:
+		Config['ActiveSensors'] = len(Config['SensorName'])
+	for Name in Config:
+		if not Name.startswith('__'):
+			setattr(sensors, Name, Config[Name])
+
 # Read arguments...
 NumReadings = int(arguments.NumReadings)
 LogInterval = int(arguments.LogInterval)
@@ -71,25 +163,82 @@ NumAverages = int(arguments.NumAverages)
 DisplayInterval = int(arguments.DisplayInterval)
 DebugLevel = int(arguments.DebugLevel)
 LogLevel = int(arguments.LogLevel)
-
-def DebugLog(logString, DebugThreshold = 0, LogThreshold = 0):
+MultiProcess = int(arguments.MultiProcess)
+SegmentFile = arguments.SegmentFile
+SegmentFlush = float(arguments.SegmentFlush)
+Adaptive = int(arguments.Adaptive)
+HealthFile = arguments.HealthFile
+LogMaxBytes = int(arguments.LogMaxBytes)
+MemoryReport = int(arguments.MemoryReport)
+TraceMalloc = int(arguments.TraceMalloc)
+MemoryLog = arguments.MemoryLog
+Replay = arguments.Replay
+ReplayPulses = arguments.ReplayPulses
+ReplayRPICT3V1 = arguments.ReplayRPICT3V1
+ReplayUpload = int(arguments.ReplayUpload)
+
+# Replay mode...
+# The main loop runs on a virtual clock that only advances when the logger sleeps. Sensors
+# read their values from the trace, GPIO pulses are fed to the real pulse handlers at their
+# recorded times, and nothing is displayed or (unless -ReplayUpload 1) uploaded, so a
+# replay runs far faster than real time and always produces the same log.
+if Replay != '':
+	Trace = replay.Trace(Replay, sensors.SensorName)
+	Clock = clock.VirtualClock(Trace.Start)
+	Hardware = False
+	DisplayInterval = 0
+	MultiProcess = 0
+else:
+	Clock = clock.Clock()
+	Hardware = True
+
+# Hardware interfaces (display, GPIO, serial) - not imported in replay mode, so a replay runs
+# on any machine
+if Hardware:
+	import requests
+	from microdotphat import write_string, set_decimal, clear, show
+	import RPi.GPIO as GPIO
+	import serial
+
+# Any Values are appended to logString, only when the message is actually printed or logged
+def DebugLog(logString, DebugThreshold = 0, LogThreshold = 0, *Values):
+    if DebugLevel < DebugThreshold and LogLevel < LogThreshold: return
+    if Values: logString = logString + ''.join(str(Value) for Value in Values)
     if DebugLevel >= DebugThreshold: print(logString)
     if LogLevel >= LogThreshold: logger.info(logString)
 
+# Define a log filter that timestamps log records from the (possibly virtual) clock...
+def ClockTimestamp(record):
+	record.created = Clock.time()
+	record.msecs = (record.created - int(record.created)) * 1000
+	return True
+
 # Setup Log to file function
-timestr = 'logs/' + time.strftime("%B-%dth--%I-%M-%S%p") + '.log'
+def LogFileHandler(timestr, mode='a'):
+	hdlr = logging.FileHandler(timestr, mode=mode)
+	hdlr.setFormatter(formatter)
+	hdlr.addFilter(ClockTimestamp)
+	return hdlr
+
 logger = logging.getLogger('myapp')
-hdlr = logging.FileHandler(timestr)
 formatter = logging.Formatter('%(asctime)s %(levelname)s %(message)s')
-hdlr.setFormatter(formatter)
+if Replay != '':
+	timestr = arguments.ReplayOutput
+	hdlr = LogFileHandler(timestr, mode='w')
+else:
+	timestr = 'logs/' + time.strftime("%B-%dth--%I-%M-%S%p") + '.log'
+	hdlr = LogFileHandler(timestr)
 logger.addHandler(hdlr) 
 logger.setLevel(logging.INFO)
+SamplerPID = os.getpid()
+LogName = None
 
 # Setup serial
-try:
-    ser = serial.Serial('/dev/ttyAMA0', 38400)
-except:
-    ser = serial.Serial('/dev/ttyS0', 38400)
+if Hardware:
+	try:
+	    ser = serial.Serial('/dev/ttyAMA0', 38400, timeout=1)
+	except:
+	    ser = serial.Serial('/dev/ttyS0', 38400, timeout=1)
 
 # Miscellaneous definitions
 DailyReset = False
@@ -99,14 +248,10 @@ throttle_uv_level = 0
 throttle_readings = 0
 throttle_uv_num = 0
 
-#Electricity Import (usage)
-Electric_kWhrs_import_total = 0
-Electric_kWhrs_import_T1 = 0
-prev_Electric_kWhrs_import_total = Electric_kWhrs_import_total
-Electric_kWhrs_import_today = 0
-Electric_kW_import_now = 0
-prev_Electric_kW_import_now = 0
-prev_Electric_Time = 0
+# Throttle level is measured over the last ThrottleWindow throttle readings (one every 0.2s)
+ThrottleWindow = 3000
+throttle_history = bytearray(ThrottleWindow)
+throttle_index = 0
 
 #Electricity Export
 Electric_kWhrs_exported_total = 0
@@ -114,22 +259,17 @@ Electric_kWhrs_exported_today = 0
 
 #RPICT3V1
 RPICT3V1_data = ""
+RPICT3V1_interval = {}
+RPICT3V1_Whrs_import_today = {}
+RPICT3V1_Whrs_export_today = {}
+prev_RPICT3V1_Time = 0
+RPICT3V1Board = None
 
-# Solar PV
-SolarPV_kWhrs_gen_total = 56.000
-prev_SolarPV_kWhrs_gen_total = SolarPV_kWhrs_gen_total
-SolarPV_kWhrs_gen_today = 0
-SolarPV_kW_gen_now = 0
-prev_SolarPV_kW_gen_now = 0
-prev_SolarPV_Time = 0
-
-#RPM
-RPM_now = 0
-prev_RPM_Time = 0
-Dist_m_today = 0
-prev_Dist_m_today = 0
+# GPIO pulse counters (electricity and solar PV meters, RPM, triggers), one per counted pin
+Counters = counters.CounterBank(Clock)
 
-GPIO.setmode(GPIO.BCM)
+if Hardware:
+	GPIO.setmode(GPIO.BCM)
 
 # Sensor configuration...
 LogTitles = sensors.SensorName
@@ -138,15 +278,37 @@ SensorLoc = sensors.SensorLoc
 Sensor_A = sensors.Sensor_A
 Sensor_B = sensors.Sensor_B
 Sensor_C = sensors.Sensor_C
+Thermistor_R0 = sensors.Thermistor_R0
+Thermistor_T0 = sensors.Thermistor_T0
+Thermistor_Beta = sensors.Thermistor_Beta
+Thermistor_SH = sensors.Thermistor_SH
+LDR_R10 = sensors.LDR_R10
+LDR_Gamma = sensors.LDR_Gamma
+SeriesResistor = sensors.SeriesResistor
+TimingCapacitor = sensors.TimingCapacitor
+ADC_FullScale = sensors.ADC_FullScale
 TPins = sensors.SensorLoc
 HighWarning = sensors.HighWarning
 HighReset = sensors.HighReset
 LowWarning = sensors.LowWarning
 LowReset = sensors.LowReset
 DomoticzIDX = sensors.DomoticzIDX
+OutputBackends = sensors.OutputBackends
+if Replay != '' and ReplayUpload == 0:
+	OutputBackends = []
+Outputs = None
+Segment = None
+SegmentMaxBlocks = 1024 # Blocks of 256 readings per segment file
 ActiveSensors = sensors.ActiveSensors
 DisplaySensor1 = sensors.DisplaySensor1
 MeasurementInterval = sensors.MeasurementInterval
+MinInterval = sensors.MinInterval
+MaxInterval = sensors.MaxInterval
+AdaptiveThreshold = sensors.AdaptiveThreshold
+FailureThreshold = sensors.FailureThreshold
+FailureBackoff = sensors.FailureBackoff
+MaxFailureBackoff = sensors.MaxFailureBackoff
+StaleAge = sensors.StaleAge
 
 # Sensor initialisation...
 # Note - supports up to 16 sensors. If more are needed then these arrays need extending
@@ -154,6 +316,12 @@ SensorReading = [0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0]
 LowWarningIssued = [False, False, False, False, False, False, False, False, False, False, False, False, False, False, False, False]
 HighWarningIssued = [False, False, False, False, False, False, False, False, False, False, False, False, False, False, False, False]
 
+# Bit mask of the sensors read since the last upload
+SensorUpdated = 0
+
+# Bit mask of the sensors reporting their last good reading (quality stale, see health.py)
+SensorStale = 0
+
 print("""RasPi Multi-Function Data Monitor / Logger
 By Mark Cantrill @AstroDesignsLtd
 Measure and logs data from a variety of sensors and functions
@@ -177,48 +345,162 @@ DebugLog ("Starting Logger...", 0, 1)
 
 # Define a function to monitor the throttle status...
 def ThrottleMonitor():
-	global throttle_readings, throttle_uv_num, throttle_uv, throttle_uv_level
+	global throttle_readings, throttle_uv_num, throttle_uv, throttle_uv_level, throttle_index
 	throttle_output = subprocess.check_output(GET_THROTTLED_CMD, shell=True)
 	if DebugLevel > 3: print("throttle_output: ", throttle_output)
 	throttle_status_str = throttle_output.decode().split('=')
 	if DebugLevel > 3: print("throttle_status_str: ", throttle_status_str)
 	throttle_status = int(throttle_status_str[1].strip(), 0)
 	if DebugLevel > 3: print("throttle_status: ", throttle_status)
-	throttle_readings = throttle_readings + 1
-	if throttle_status & 1:
-		throttle_uv = 1
-		throttle_uv_num = throttle_uv_num + 1
-		throttle_uv_level = round(100 * (throttle_uv_num / throttle_readings),0)
+	throttle_readings = min(throttle_readings + 1, ThrottleWindow)
+	throttle_uv = throttle_status & 1
+	throttle_uv_num = throttle_uv_num - throttle_history[throttle_index] + throttle_uv
+	throttle_history[throttle_index] = throttle_uv
+	throttle_index = (throttle_index + 1) % ThrottleWindow
+	throttle_uv_level = round(100 * (throttle_uv_num / throttle_readings),0)
+
+
+# Define function to upload data...
+# Only the sensors flagged in Updated (bit mask) are sent, and only if they aren't stale
+def UploadData(logTitleString, logString, SensorVal, Updated, Stale):
+	# Log to webhook...
+	#DebugLog ("Logging to webhook...", 1, 1)
+	#r = requests.post('https://maker.ifttt.com/trigger/RasPi_LogTemp/with/key/'+IFTTT_KEY, params={"value1":logTitleString,"value2":logString,"value3":"none"})
+
+	# Log to output backends (Domoticz server, MQTT broker)...
+	# Backends are opened on first use so that each uploader process has its own connections
+	global Outputs
+	if Outputs is None:
+		Outputs = outputs.Open(OutputBackends)
+	DebugLog ("Logging to output backends...", 1, 1)
+	for Output in Outputs:
+		Output.Log(SensorVal, Updated, Stale)
+
+# Define function to store data...
+# Segment files hold numbers only, so stale and held readings are stored as NaN, as they
+# are read back from a text log
+def StoreData(TimeNow, logString, SensorVal, Stale, Held=0):
+	global Segment
+	if SegmentFile != '':
+		# Log to compressed segment file (written a block at a time)...
+		# The segment is opened on first use so that it belongs to the storage process
+		if Segment is None:
+			Segment = segment.SegmentWriter(SegmentFile, LogTitles[0:ActiveSensors], FlushInterval=SegmentFlush)
+		if Stale or Held:
+			SensorVal = [float('nan') if ((Stale | Held) >> x) & 1 else SensorVal[x] for x in range(0, ActiveSensors)]
+		Segment.append(TimeNow, SensorVal)
+		# A full segment is moved aside so that its block index (held in memory) stays bounded
+		if Segment.blocks() >= SegmentMaxBlocks:
+			Segment.close()
+			Segment = None
+			segment.Rollover(SegmentFile, TimeNow)
 	else:
-		throttle_uv = 0
-		throttle_uv_num = max(0, throttle_uv_num - 1)
-		throttle_uv_level = round(100 * (throttle_uv_num / throttle_readings),0)
-
-
-# Define function to log data...
-def LogData(NextLogTime, logTitleString, logString, SensorVal):
-	TimeNow = time.time()
+		# Log to file...
+		DebugLog (logString, 999, 1)
+		RotateLog()
+
+# Define function to start a new log file once the current one reaches LogMaxBytes...
+# Earlier log files are kept - backfill.py, report.py and replay.py read them all
+# Only the sampler process rotates the log; in multi-process mode it publishes the new file
+# name in LogName and the consumer processes follow it (see FollowLog)
+def RotateLog():
+	if LogMaxBytes <= 0 or Replay != '' or os.getpid() != SamplerPID or hdlr.stream is None:
+		return
+	if os.fstat(hdlr.stream.fileno()).st_size < LogMaxBytes:
+		return
+	OpenLog('logs/' + time.strftime("%B-%dth--%I-%M-%S%p") + '.log')
+	if LogName is not None:
+		LogName.value = timestr.encode()
+	DebugLog ("Log file: " + timestr, 0, 1)
+	DebugLog (logTitleString, 1, 1)
+
+def OpenLog(filename):
+	global hdlr, timestr
+	logger.removeHandler(hdlr)
+	hdlr.close()
+	timestr = filename
+	hdlr = LogFileHandler(timestr)
+	logger.addHandler(hdlr)
+
+# Define a log filter that moves a consumer process over to the sampler's current log file...
+def FollowLog(record):
+	if LogName is not None and LogName.value != timestr.encode():
+		OpenLog(LogName.value.decode())
+	return True
+
+def CloseStorage():
+	global Segment
+	if Segment is not None:
+		Segment.close()
+		Segment = None
+
+# Define function to check if a set of readings is due to be logged...
+# Every LogInterval, and in adaptive mode also whenever a sensor has a new reading, so that
+# every reading taken between log points (e.g. a transient caught by faster sampling) is
+# stored and uploaded
+def LogDue(TimeNow, NextLogTime, Updated):
 	if TimeNow > NextLogTime:
-		NextLogTime = NextLogTime + LogInterval
-		
-        # Log to webhook...
-		#DebugLog ("Logging to webhook...", 1, 1)
-		#r = requests.post('https://maker.ifttt.com/trigger/RasPi_LogTemp/with/key/'+IFTTT_KEY, params={"value1":logTitleString,"value2":logString,"value3":"none"})
-		
-		# Log to Domiticz server...
-		DebugLog ("Logging to Domoticz...", 1, 1)
+		return True, NextLogTime + LogInterval
+	return Adaptive > 0 and Updated != 0, NextLogTime
+
+# Define function to find the held readings in a set of readings...
+# In adaptive mode a sensor that hasn't been read since the last log point keeps its last
+# reading; stale readings and sensors with no reading (NaN) keep their own marking
+def HeldMask(SensorVal, Updated, Stale):
+	Held = 0
+	if Adaptive > 0:
 		for x in range(0, ActiveSensors):
-			if DomoticzIDX[x] != 'x':
-				domoticz.LogToDomoticz(DomoticzIDX[x], SensorVal[x])
+			if not ((Updated | Stale) >> x) & 1 and not math.isnan(SensorVal[x]):
+				Held = Held | (1 << x)
+	return Held
 
-		# Log to file...
-		DebugLog (logString, 999, 1)
+# Define function to log data...
+# The log string is only built when it's time to log
+def LogData(NextLogTime, logTitleString, Reading, SensorVal):
+	global SensorUpdated
+	TimeNow = Clock.time()
+	Due, NextLogTime = LogDue(TimeNow, NextLogTime, SensorUpdated)
+	if Due:
+		Held = HeldMask(SensorVal, SensorUpdated, SensorStale)
+		logString = LogString(TimeNow, Reading, SensorVal, SensorStale, Held)
+		UploadData(logTitleString, logString, SensorVal, SensorUpdated, SensorStale)
+		SensorUpdated = 0
+		StoreData(TimeNow, logString, SensorVal, SensorStale, Held)
 	
 	return NextLogTime
 
+# Define function to build the log string for one set of readings...
+# Stale readings (bit set in Stale) are marked with logreader.StaleMark and held readings
+# (bit set in Held) with logreader.HeldMark
+def LogString(TimeNow, Reading, SensorVal, Stale, Held=0):
+	logTime = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(TimeNow))
+	return logTime + ";" + str(Reading) + ";" + "".join([str(SensorVal[x]) + (logreader.StaleMark if (Stale >> x) & 1 else logreader.HeldMark if (Held >> x) & 1 else "") + ";" for x in range(0, ActiveSensors)])
+
+# Define function to check for warnings...
+def CheckWarnings(SensorVal):
+	for x in range(0, ActiveSensors):
+		# Check for low warning
+		if SensorVal[x] < LowWarning[x]:
+			if LowWarningIssued[x] == False:
+				DebugLog("Low warning!",999,1)
+				# Issue Warning via IFTTT...
+				#r = requests.post('https://maker.ifttt.com/trigger/Water_low_temp/with/key/' + IFTTT_KEY, params={"value1":"none","value2":"none","value3":"none"})
+				LowWarningIssued[x] = True
+		if SensorVal[x] > LowReset[x]:
+			LowWarningIssued[x] = False
+		# Check for high warning
+		if SensorVal[x] > HighWarning[x]:
+			if HighWarningIssued[x] == False:
+				DebugLog("High warning!",999,1)
+				# Issue Warning via IFTTT...
+				#r = requests.post('https://maker.ifttt.com/trigger/Water_low_temp/with/key/' + IFTTT_KEY, params={"value1":"none","value2":"none","value3":"none"})
+				HighWarningIssued[x] = True
+		if SensorVal[x] < HighReset[x]:
+			HighWarningIssued[x] = False
+
 # Define function to display temperature on MicroDot Phat...
 def DisplayData(NextDisplayTime, SensorVal, unitstr):
-	TimeNow = time.time()
+	TimeNow = Clock.time()
 	if TimeNow > NextDisplayTime:
 		NextDisplayTime = NextDisplayTime + DisplayInterval
 		DebugLog ("Displaying Temperature on MicroDot Phat...", 1, 1)
@@ -228,30 +510,44 @@ def DisplayData(NextDisplayTime, SensorVal, unitstr):
 	return NextDisplayTime
 
 def read_temp_CPU():
-	measurement = CPUTemperature()
+	measurement = CPUTempChannel.read()
 	measurement = round(measurement, 1)
 	return measurement
 
+# Define function to read sysfs channels (DHTxx, Vi, Hwmon)...
+# The kernel DHT11 driver fails a read now and again (EIO / ETIMEDOUT). Failures are not retried here:
+# the circuit breaker retries the sensor after a backoff, which also gets past a transient EBUSY
+def read_sysfs(SensorID):
+	try:
+		measurement = SensorChannels[SensorID].read()
+	except OSError as e:
+		raise IOError("Sysfs read error on " + SensorChannels[SensorID].Path + ": " + str(e))
+	
+	measurement = round(measurement, 3)
+	return measurement
+
 # Define function to read one-wire temperature sensors...
 def read_temp_T1w(SensorID):
     # Read one-wire device
+    # The first line ends in YES if the CRC check passed - retry a few times before giving up
     device_file = base_dir + SensorLoc[SensorID] + '/w1_slave'
-    f = open(device_file, 'r')
-    lines = f.readlines()
-
-    # Extract temperature data
-    while lines[0].strip()[-3:] != 'YES':
+    for attempt in range(0, 3):
+        with open(device_file, 'r') as f:
+            lines = f.readlines()
+        if len(lines) > 1 and lines[0].strip()[-3:] == 'YES':
+            break
         time.sleep(0.2)
-        lines = f.readlines()
-    f.close()
+    else:
+        raise IOError("1-Wire CRC error on " + SensorLoc[SensorID])
 
     # Format temperature data
     equals_pos = lines[1].find('t=')
-    if equals_pos != -1:
-        temp_string = lines[1][equals_pos+2:]
-        measurement = float(temp_string) / 1000.0
-        measurement = round(measurement,1)
-        return measurement
+    if equals_pos == -1:
+        raise IOError("1-Wire no temperature data on " + SensorLoc[SensorID])
+    temp_string = lines[1][equals_pos+2:]
+    measurement = float(temp_string) / 1000.0
+    measurement = round(measurement,1)
+    return measurement
 
 def read_temp_LM75(SensorID):
 	clear()
@@ -264,12 +560,29 @@ def read_temp_LM75(SensorID):
 	measurement = round(measurement, 1)
 	return measurement
 
+# Define function to read analogue sensors (thermistor & LDR)...
+# A burst of NumAverages samples is taken and converted in one go
 def read_temp_TPin(SensorID):
-	measurement = 22.2
+	measurement = AnalogSensors[SensorID].read(NumAverages)
+	measurement = round(measurement, 1)
+	return measurement
+
+def read_LDRPin(SensorID):
+	measurement = AnalogSensors[SensorID].read(NumAverages)
+	measurement = round(measurement, 1)
 	return measurement
 
 def read_Trig(SensorID):
-	measurement = 100
+	x = SensorCounter(SensorID)
+
+	if DailyReset:
+		Counters.reset_today(x)
+
+	measurement = Counters.today(x)
+	measurement = round(measurement, 3)
+
+	DebugLog ("Triggers today: ", 1, 1, measurement)
+
 	return measurement
 
 def read_throttle(Mode = 0):
@@ -287,7 +600,7 @@ def read_throttle(Mode = 0):
 def read_ping(SensorID):
 	global SensorReading
 	address = SensorLoc[SensorID]
-	res = subprocess.Popen(['ping', '-c1', address], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+	res = subprocess.Popen(['ping', '-c1', '-W1', address], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
 
 	out, err = res.communicate()
 
@@ -301,192 +614,155 @@ def read_ping(SensorID):
 	
 	return measurement
 
-# Interrupt callback routine for increasing Electric import count
-def Electric_import_pulse(channel):
-	global Electric_kWhrs_import_T1, Electric_kWhrs_import_total, prev_Electric_kWhrs_import_total, Electric_kWhrs_import_today, Electric_kW_import_now, prev_Electric_kW_import_now, prev_Electric_Time
-	
-	Electric_kWhrs_import_total = round(Electric_kWhrs_import_total + 0.001,3)
-	Electric_kWhrs_import_today = round(Electric_kWhrs_import_today + 0.001,3)
-	Electric_Time = time.time()
+# Define function to check for a change of local day between pulses...
+# Compares local dates rather than hours so that the DST change back an hour doesn't reset the daily totals
+def NewDay(TimeNow, prev_Time):
+	if prev_Time <= 0:
+		return False
+	return Clock.localtime(TimeNow)[0:3] != Clock.localtime(prev_Time)[0:3]
 
-	# Track daily total untip 6AM to measure 
-	if time.localtime(Electric_Time).tm_hour < 6:
-		Electric_kWhrs_import_T1 = Electric_kWhrs_import_today
-	
-	# Reset daily total
-	if time.localtime(Electric_Time).tm_hour < time.localtime(prev_Electric_Time).tm_hour:
-		Electric_kWhrs_import_today = 0
-		Electric_kWhrs_import_T1 = 0
+# Define function to find the pulse counter of a sensor...
+def SensorCounter(SensorID):
+	x = SensorCounters[SensorID]
+	if x is None:
+		raise IOError("No " + counters.TYPES[SensorType[SensorID]] + " counter configured")
+	return x
 
-	if prev_Electric_Time > 0:
-		Electric_kW_import_now = (Electric_kWhrs_import_total - prev_Electric_kWhrs_import_total) / ((Electric_Time - prev_Electric_Time) / 3600)
+def read_Electric_kWhrs_import_today(SensorID):
+	x = SensorCounter(SensorID)
 	
-	prev_Electric_kWhrs_import_total = Electric_kWhrs_import_total
-	prev_Electric_Time = Electric_Time
+	if DailyReset:
+		Counters.reset_today(x)
 
-	DebugLog ("Electric import/export pulse detected", 1, 1)
+	measurement = Counters.today(x)
+	measurement = round(measurement, 3)
 
-# Interrupt callback routine for increasing SolarPV count
-def SolarPV_gen_pulse(channel):
-	global SolarPV_kWhrs_gen_total, prev_SolarPV_kWhrs_gen_total, SolarPV_kWhrs_gen_today, SolarPV_kW_gen_now, prev_SolarPV_Time
+	DebugLog ("Read kWhrs imported today: ", 1, 1, measurement)
 	
-	SolarPV_kWhrs_gen_total = round(SolarPV_kWhrs_gen_total + 0.001,3)
-	SolarPV_kWhrs_gen_today = round(SolarPV_kWhrs_gen_today + 0.001,3)
-	SolarPV_Time = time.time()
-	
-	# Reset daily total
-	if time.localtime(SolarPV_Time).tm_hour < time.localtime(prev_SolarPV_Time).tm_hour:
-		SolarPV_kWhrs_gen_today = 0
+	return measurement
 
-	if prev_SolarPV_Time > 0:
-		SolarPV_kW_gen_now = (SolarPV_kWhrs_gen_total - prev_SolarPV_kWhrs_gen_total) / ((SolarPV_Time - prev_SolarPV_Time) / 3600)
-	
-	prev_SolarPV_kWhrs_gen_total = SolarPV_kWhrs_gen_total
-	prev_SolarPV_Time = SolarPV_Time
-	
-	DebugLog ("SolarPV gen pulse detected", 1, 1)
-		
-def read_Electric_kWhrs_import_today(SensorID):
-	global Electric_kWhrs_import_today
-	
-	if DailyReset:
-		Electric_kWhrs_import_today = 0
+def read_Electric_kWhrs_import_total(SensorID):
+	x = SensorCounter(SensorID)
 
-	measurement = Electric_kWhrs_import_today
+	measurement = Counters.total(x)
 	measurement = round(measurement, 3)
 
-	logString = "Read kWhrs imported today: " + str(measurement)
-	DebugLog (logString, 1, 1)
+	DebugLog ("Read kWhrs imported total: ", 1, 1, measurement)
 	
 	return measurement
 
 def read_Electric_Whrs_import_today(SensorID):
-	global Electric_kWhrs_import_today
+	x = SensorCounter(SensorID)
 	
 	if DailyReset:
-		Electric_kWhrs_import_today = 0
+		Counters.reset_today(x)
 
-	measurement = Electric_kWhrs_import_today * 1000
+	measurement = Counters.today(x) * 1000
 	measurement = round(measurement, 0)
 
-	logString = "Read Whrs imported today: " + str(measurement)
-	DebugLog (logString, 1, 1)
+	DebugLog ("Read Whrs imported today: ", 1, 1, measurement)
 	
 	return measurement
 
 def read_Electric_Whrs_import_T1(SensorID):
-	global Electric_kWhrs_import_T1
+	x = SensorCounter(SensorID)
 	
 	if DailyReset:
-		Electric_kWhrs_import_T1 = 0
+		Counters.reset_today(x)
 
-	measurement = Electric_kWhrs_import_T1 * 1000
+	measurement = Counters.t1(x) * 1000
 	measurement = round(measurement, 0)
 
-	logString = "Read Whrs imported today: " + str(measurement)
-	DebugLog (logString, 1, 1)
+	DebugLog ("Read Whrs imported today: ", 1, 1, measurement)
 	
 	return measurement
 
 def read_Electric_kW_import_now(SensorID):
-	global Electric_kW_import_now, prev_Electric_kW_import_now
-	
-	if Electric_kW_import_now == prev_Electric_kW_import_now:
-		Electric_kW_import_now = 0
-		prev_Electric_kW_import_now = 0
+	x = SensorCounter(SensorID)
 
-	measurement = Electric_kW_import_now
-	prev_Electric_kW_import_now = Electric_kW_import_now
+	measurement = Counters.rate(x)
 	
-	logString = "Electric_kW_import_now: " + str(measurement)
-	DebugLog (logString, 1, 1)
+	DebugLog ("Electric_kW_import_now: ", 1, 1, measurement)
 	
 	return measurement
 	
 def read_SolarPV_kWhrs_gen_today(SensorID):
-	global SolarPV_kWhrs_gen_today
+	x = SensorCounter(SensorID)
 	
 	if DailyReset:
-		SolarPV_kWhrs_gen_today = 0
+		Counters.reset_today(x)
+
+	measurement = Counters.today(x)
+	measurement = round(measurement, 3)
+
+	DebugLog ("SolarPV_kWhrs_gen_today: ", 1, 1, measurement)
+	
+	return measurement
+	
+def read_SolarPV_kWhrs_gen_total(SensorID):
+	x = SensorCounter(SensorID)
 
-	measurement = SolarPV_kWhrs_gen_today
+	measurement = Counters.total(x)
 	measurement = round(measurement, 3)
 
-	logString = "SolarPV_kWhrs_gen_today: " + str(measurement)
-	DebugLog (logString, 1, 1)
+	DebugLog ("SolarPV_kWhrs_gen_total: ", 1, 1, measurement)
 	
 	return measurement
 	
 def read_SolarPV_Whrs_gen_today(SensorID):
-	global SolarPV_kWhrs_gen_today
+	x = SensorCounter(SensorID)
 	
 	if DailyReset:
-		SolarPV_kWhrs_gen_today = 0
+		Counters.reset_today(x)
 
-	measurement = SolarPV_kWhrs_gen_today * 1000
+	measurement = Counters.today(x) * 1000
 	measurement = round(measurement, 0)
 
-	logString = "SolarPV_Whrs_gen_today: " + str(measurement)
-	DebugLog (logString, 1, 1)
+	DebugLog ("SolarPV_Whrs_gen_today: ", 1, 1, measurement)
 	
 	return measurement
 	
 def read_SolarPV_kW_gen_now(SensorID):
-	global SolarPV_kW_gen_now, prev_SolarPV_kW_gen_now
-	
-	if SolarPV_kW_gen_now == prev_SolarPV_kW_gen_now:
-		SolarPV_kW_gen_now = 0
-		prev_SolarPV_kW_gen_now = 0
+	x = SensorCounter(SensorID)
 
-	measurement = SolarPV_kW_gen_now
-	prev_SolarPV_kW_gen_now = SolarPV_kW_gen_now
+	measurement = Counters.rate(x)
 	measurement = round(measurement, 3)
 	
-	logString = "SolarPV_kW_gen_now: " + str(measurement)
-	DebugLog (logString, 1, 1)
+	DebugLog ("SolarPV_kW_gen_now: ", 1, 1, measurement)
 	
 	return measurement
 
 def read_RPICT3V1_MainsElectricityVoltage(SensorID):
     
-    global RPICT3V1_data
-    
-    # Buffer is capturing constantly so mush be flushed before reading the next line
-    # in order to ensure we capture the latest data
-    ser.flushInput()
+    global RPICT3V1_data, RPICT3V1_interval, prev_RPICT3V1_Time
     
-    # Read line from serial (assumes RPICT3V1 is running and 
+    # The frame reader thread reads every frame the RPICT3V1 sends; the latest frame is the
+    # data set for all the RPICT3V1 sensors this cycle. Read once per cycle, as interval()
+    # takes the statistics since the last call.
+    # Any failure raises with the data set cleared so the other RPICT3V1 sensors fail too
     RPICT3V1_data = ""
-    NodeID = 0
-    timeout = 10
-    while (len(RPICT3V1_data) < 16 or NodeID != '11') and timeout > 0: 
-        RPICT3V1_data = ser.readline()
-        logString = "RPICT3V1 RX Data: " + str(RPICT3V1_data)
-        DebugLog (logString, 2, 2)
+    RPICT3V1_interval = {}
+    data = RPICT3V1Board.latest()
+    if data is None:
+        raise IOError("RPICT3V1 no data received for " + str(RPICT3V1Board.MaxAge) + "s")
+    RPICT3V1_data = data
+    DebugLog ("RPICT3V1 RX Data: ", 2, 2, RPICT3V1_data)
+
+    # Energy and power statistics integrated from every frame since the last cycle
+    RPICT3V1_interval = RPICT3V1Board.interval()
+    RPICT3V1_Time = Clock.time()
+    if NewDay(RPICT3V1_Time, prev_RPICT3V1_Time):
+        RPICT3V1_Whrs_import_today.clear()
+        RPICT3V1_Whrs_export_today.clear()
+    for Field in RPICT3V1_interval:
+        RPICT3V1_Whrs_import_today[Field] = RPICT3V1_Whrs_import_today.get(Field, 0) + RPICT3V1_interval[Field]['import_wh']
+        RPICT3V1_Whrs_export_today[Field] = RPICT3V1_Whrs_export_today.get(Field, 0) + RPICT3V1_interval[Field]['export_wh']
+    prev_RPICT3V1_Time = RPICT3V1_Time
 
-        # Remove the trailing carriage return line feed...
-        RPICT3V1_data = RPICT3V1_data[:-2]
-
-        # Decode data...
-        RPICT3V1_data = RPICT3V1_data.decode().split(' ')
-
-        # Extract NodeID for to validate dataset...
-        NodeID = RPICT3V1_data[0]
-        
-        timeout = timeout - 1
-
-    #print("RPICT3V1_data length: ", len(RPICT3V1_data))
-    
-    # Check that a read error or timeout hasn't occured
-    if (len(RPICT3V1_data) == 16 and NodeID == '11') and timeout > 0:
-        measurement = float(RPICT3V1_data[int(SensorLoc[SensorID])])
-    else:
-        measurement = 0.0
-        
+    measurement = float(RPICT3V1_data[int(SensorLoc[SensorID])])
     measurement = round(measurement, 0)
     
-    logString = "Mains Electricity Voltage (V): " + str(measurement)
-    DebugLog (logString, 1, 1)
+    DebugLog ("Mains Electricity Voltage (V): ", 1, 1, measurement)
 
     return measurement
 
@@ -497,8 +773,7 @@ def read_RPICT3V1_SCT013_100A_1(SensorID):
     measurement = float(RPICT3V1_data[int(SensorLoc[SensorID])])
     measurement = round(measurement, 3)
     
-    logString = "Mains Electricity Current (A): " + str(measurement)
-    DebugLog (logString, 1, 1)
+    DebugLog ("Mains Electricity Current (A): ", 1, 1, measurement)
     
     return measurement
 	
@@ -513,8 +788,7 @@ def read_RPICT3V1_ActiveImport(SensorID):
         measurement = 0
     measurement = round(measurement, 3)
     
-    logString = "Mains Electricity Import (W): " + str(measurement)
-    DebugLog (logString, 1, 1)
+    DebugLog ("Mains Electricity Import (W): ", 1, 1, measurement)
     
     return measurement
 	
@@ -532,8 +806,7 @@ def read_RPICT3V1_ActiveExport(SensorID):
         measurement = 0 - measurement
     measurement = round(measurement, 3)
     
-    logString = "Mains Electricity Export (W): " + str(measurement)
-    DebugLog (logString, 1, 1)
+    DebugLog ("Mains Electricity Export (W): ", 1, 1, measurement)
     
     return measurement
 	
@@ -544,63 +817,93 @@ def read_RPICT3V1_PowerFactor(SensorID):
     measurement = float(RPICT3V1_data[int(SensorLoc[SensorID])])
     measurement = round(measurement, 3)
     
-    logString = "Mains Electricity PowerFactor: " + str(measurement)
-    DebugLog (logString, 1, 1)
+    DebugLog ("Mains Electricity PowerFactor: ", 1, 1, measurement)
+    
+    return measurement
+
+# Energy (Wh) imported / exported today, integrated from every frame
+def read_RPICT3V1_Whrs_import_today(SensorID):
+    
+    measurement = RPICT3V1_Whrs_import_today[int(SensorLoc[SensorID])]
+    measurement = round(measurement, 1)
+    
+    DebugLog ("Mains Electricity Imported today (Wh): ", 1, 1, measurement)
+    
+    return measurement
+
+def read_RPICT3V1_Whrs_export_today(SensorID):
+    
+    measurement = RPICT3V1_Whrs_export_today[int(SensorLoc[SensorID])]
+    measurement = round(measurement, 1)
+    
+    DebugLog ("Mains Electricity Exported today (Wh): ", 1, 1, measurement)
+    
+    return measurement
+
+# Peak / minimum import power (W) and time-averaged power factor over all frames since the last cycle
+def read_RPICT3V1_PeakImport(SensorID):
+    
+    measurement = RPICT3V1_interval[int(SensorLoc[SensorID])]['peak_import']
+    measurement = round(measurement, 3)
+    
+    DebugLog ("Mains Electricity Peak Import (W): ", 1, 1, measurement)
+    
+    return measurement
+
+def read_RPICT3V1_MinImport(SensorID):
+    
+    measurement = RPICT3V1_interval[int(SensorLoc[SensorID])]['min_import']
+    measurement = round(measurement, 3)
+    
+    DebugLog ("Mains Electricity Min Import (W): ", 1, 1, measurement)
+    
+    return measurement
+
+def read_RPICT3V1_AvgPowerFactor(SensorID):
+    
+    measurement = RPICT3V1_interval[int(SensorLoc[SensorID])]['mean']
+    measurement = round(measurement, 3)
+    
+    DebugLog ("Mains Electricity Average PowerFactor: ", 1, 1, measurement)
     
     return measurement
 
 def read_RPM_now(SensorID):
-	global RPM_now, Dist_m_today, prev_Dist_m_today
-	
-	if Dist_m_today == prev_Dist_m_today:
-		RPM_now = 0
+	x = SensorCounter(SensorID)
 
-	measurement = RPM_now
-	prev_Dist_m_today = Dist_m_today
+	measurement = Counters.rate(x)
 	measurement = round(measurement, 3)
 	
-	logString = "RPM_now: " + str(measurement)
-	DebugLog (logString, 1, 1)
-	print(logString)
-    
+	DebugLog ("RPM_now: ", 1, 1, measurement)
+	
 	return measurement
 
 def read_Dist_m(SensorID):
-	global RPM_now, Dist_m_today, prev_Dist_m_today
+	x = SensorCounter(SensorID)
 	
-	measurement = Dist_m_today
+	measurement = Counters.today(x)
 	measurement = round(measurement, 3)
 	
-	logString = "Dist_m: " + str(measurement)
-	DebugLog (logString, 1, 1)
-	print(logString)
+	DebugLog ("Dist_m: ", 1, 1, measurement)
 	
 	return measurement
 
-# Interrupt callback routine for RPM & Dist_m
-def RPM_pulse(channel):
-	global Dist_m_today, RPM_now, prev_RPM_Time
-	
-	Dist_m_today = Dist_m_today + 1
-	RPM_Time = time.time()
-	
-	# Reset daily total
-	if time.localtime(RPM_Time).tm_hour < time.localtime(prev_RPM_Time).tm_hour:
-		Dist_m_today = 0
+# Sensor types derived from GPIO pulses - these run through the real pulse handlers in replay mode
+PulseTypes = list(counters.TYPES)
 
-	if prev_RPM_Time > 0:
-		RPM_now = 60 / (RPM_Time - prev_RPM_Time) 
-	
-	prev_RPM_Time = RPM_Time
-	
-	DebugLog ("RPM gen pulse detected", 1, 1)
-		
 def read_sensor(SensorID):
 	measurement = -999
 
+	# Replay: traced values are already calibrated
+	# Pulse types, and RPICT3V1 types with replayed frames, are read through their real handlers
+	if Replay != '' and SensorType[SensorID] not in PulseTypes and not (RPICT3V1Board is not None and SensorType[SensorID].startswith('RPICT3V1_')):
+		return Trace.value(SensorID)
+
 	if SensorType[SensorID] == 'CPU_Temp':
-		cpu = read_temp_CPU()
-		measurement = cpu.temperature
+		measurement = read_temp_CPU()
+
+	if SensorType[SensorID] == 'DHTxx_T' or SensorType[SensorID] == 'DHTxx_H' or SensorType[SensorID] == 'Vi' or SensorType[SensorID] == 'Hwmon':
+		measurement = read_sysfs(SensorID)
 
 	if SensorType[SensorID] == 'T1w':
 		measurement = read_temp_T1w(SensorID)
@@ -611,6 +914,9 @@ def read_sensor(SensorID):
 	if SensorType[SensorID] == 'TPin':
 		measurement = read_temp_TPin(SensorID)
 
+	if SensorType[SensorID] == 'LDRPin':
+		measurement = read_LDRPin(SensorID)
+
 	if SensorType[SensorID] == 'Throttle_Level':
 		measurement = read_throttle(1)
 
@@ -652,6 +958,9 @@ def read_sensor(SensorID):
 		
 	if SensorType[SensorID] == 'Dist_m':
 		measurement = read_Dist_m(SensorID)
+
+	if SensorType[SensorID] == 'TrigN' or SensorType[SensorID] == 'TrigP':
+		measurement = read_Trig(SensorID)
 		
 	# RPICT3V1_MainsElectricityVoltage must be read before any other RPICT3V1 sensors as it is the only function that reads the data set from the device
 	if SensorType[SensorID] == 'RPICT3V1_MainsElectricityVoltage':
@@ -669,52 +978,154 @@ def read_sensor(SensorID):
 	if SensorType[SensorID] == 'RPICT3V1_PowerFactor':
 		measurement = read_RPICT3V1_PowerFactor(SensorID)
 
-	#Apply gain / offset calculation
-	measurement = float(Sensor_A[SensorID]) * (measurement)**2 + float(Sensor_B[SensorID]) * measurement + float(Sensor_C[SensorID])
+	if SensorType[SensorID] == 'RPICT3V1_Whrs_import_today':
+		measurement = read_RPICT3V1_Whrs_import_today(SensorID)
 
-	return measurement
+	if SensorType[SensorID] == 'RPICT3V1_Whrs_export_today':
+		measurement = read_RPICT3V1_Whrs_export_today(SensorID)
 
+	if SensorType[SensorID] == 'RPICT3V1_PeakImport':
+		measurement = read_RPICT3V1_PeakImport(SensorID)
 
-# 1-wire config...
-if 'T1w' in SensorType:
-	if DebugLevel > 0: print("Using 1-Wire Temperature Sensor(s)")
-	os.system('modprobe w1-gpio')
-	os.system('modprobe w1-therm')
-	base_dir = '/sys/bus/w1/devices/'
+	if SensorType[SensorID] == 'RPICT3V1_MinImport':
+		measurement = read_RPICT3V1_MinImport(SensorID)
 
-# LM75 config...
-if 'LM75' in SensorType:
-	if DebugLevel > 0: print("Using LM75 Temperature Sensor(s)")
-	sensor = LM75.LM75()
+	if SensorType[SensorID] == 'RPICT3V1_AvgPowerFactor':
+		measurement = read_RPICT3V1_AvgPowerFactor(SensorID)
 
-# TrigN config...
-if 'TrigN' in SensorType:
-	if DebugLevel > 0: print("Using Negative-Edge trigger on pin")
+	#Apply gain / offset calculation
+	measurement = float(Sensor_A[SensorID]) * (measurement)**2 + float(Sensor_B[SensorID]) * measurement + float(Sensor_C[SensorID])
 
-# SolarPV config...
-# Assumes the I/O pin is connected directly to the output of the photo detector stuck to the front of the electricity meter
-# and that the output is pulled up to around 3.3V within the sensor monitoring module.
-# Recommend a resistor (say, 1kR) is connected in-line with the connection to the GPIO pin to protect the Pi
-if 'Electric_Whrs_import_today' in SensorType:
-	for x in range(0, ActiveSensors):
-		if SensorType[x] == 'Electric_Whrs_import_today':
-			if DebugLevel > 0: print("Using Electricity strobe monitor on pin ",SensorLoc[x])
-			GPIO.setup(int(SensorLoc[x],10), GPIO.IN, pull_up_down=GPIO.PUD_UP) # Add pull-up here only when testing without the photo-sensor attached
-			GPIO.add_event_detect(int(SensorLoc[x],10), GPIO.FALLING, callback=Electric_import_pulse, bouncetime=500)
+	return measurement
 
-if 'SolarPV_Whrs_gen_today' in SensorType:
-	for x in range(0, ActiveSensors):
-		if SensorType[x] == 'SolarPV_Whrs_gen_today':
-			if DebugLevel > 0: print("Using SolarPV strobe monitor on pin ",SensorLoc[x])
-			GPIO.setup(int(SensorLoc[x],10), GPIO.IN) #, pull_up_down=GPIO.PUD_UP) # Add pull-up here only when testing without the photo-sensor attached
-			GPIO.add_event_detect(int(SensorLoc[x],10), GPIO.FALLING, callback=SolarPV_gen_pulse, bouncetime=500)
 
-if 'RPM' in SensorType:
+# RPICT3V1 sensor types read from the frame integrators (SensorLoc is the frame field)
+RPICT3V1IntegratedTypes = ['RPICT3V1_Whrs_import_today', 'RPICT3V1_Whrs_export_today', 'RPICT3V1_PeakImport',
+	'RPICT3V1_MinImport', 'RPICT3V1_AvgPowerFactor']
+RPICT3V1Fields = [int(SensorLoc[x]) for x in range(0, ActiveSensors) if SensorType[x] in RPICT3V1IntegratedTypes]
+RPICT3V1Used = any(SensorType[x].startswith('RPICT3V1_') for x in range(0, ActiveSensors))
+
+# Sensor hardware config (not used in replay mode)...
+if Hardware:
+	# 1-wire config...
+	if 'T1w' in SensorType:
+		if DebugLevel > 0: print("Using 1-Wire Temperature Sensor(s)")
+		os.system('modprobe w1-gpio')
+		os.system('modprobe w1-therm')
+		base_dir = '/sys/bus/w1/devices/'
+
+	# LM75 config...
+	if 'LM75' in SensorType:
+		if DebugLevel > 0: print("Using LM75 Temperature Sensor(s)")
+		import LM75
+		sensor = LM75.LM75()
+
+	# CPU temperature config...
+	if 'CPU_Temp' in SensorType:
+		if DebugLevel > 0: print("Using CPU temperature (thermal zone 0)")
+		CPUTempChannel = sysfs.ThermalZone(0)
+
+	# Sysfs channel config...
+	# DHTxx_T / DHTxx_H: SensorLoc is the IIO device of the kernel dht11 driver ('dht11' or 'iio:deviceN')
+	# Vi: SensorLoc is '<IIO device>/<channel>' for an ADC channel, e.g. 'mcp3008/in_voltage0'
+	# Hwmon: SensorLoc is '<hwmon name>/<attribute>', e.g. 'rpi_volt/in0_input'
+	SensorChannels = [None] * len(SensorReading)
+	for x in range(0, ActiveSensors):
+		if SensorType[x] == 'DHTxx_T':
+			SensorChannels[x] = sysfs.IIOChannel(SensorLoc[x], 'in_temp')
+		elif SensorType[x] == 'DHTxx_H':
+			SensorChannels[x] = sysfs.IIOChannel(SensorLoc[x], 'in_humidityrelative')
+		elif SensorType[x] == 'Vi':
+			SensorChannels[x] = sysfs.IIOChannel(*SensorLoc[x].split('/'))
+		elif SensorType[x] == 'Hwmon':
+			SensorChannels[x] = sysfs.Hwmon(*SensorLoc[x].split('/'))
+		if SensorChannels[x] is not None:
+			if DebugLevel > 0: print("Using sysfs channel ", SensorChannels[x].Path)
+
+	# RPICT3V1 config...
+	# A background thread reads every frame; the fields of the integrated sensor types are integrated
+	# The thread is started once the consumer processes have been forked (see multi-process mode)
+	if RPICT3V1Used:
+		if DebugLevel > 0: print("Using RPICT3V1 frame reader, integrating fields ", RPICT3V1Fields)
+		RPICT3V1Board = RPICT3V1.FrameReader(ser, RPICT3V1Fields)
+
+	# Analogue sensor config (TPin thermistor, LDRPin light dependent resistor)...
+	# SensorLoc is either an IIO ADC channel ('<device>/<channel>', sensor on the low side of a divider
+	# with SeriesResistor to the ADC reference) or a GPIO pin number (RC timing with TimingCapacitor)
+	AnalogSensors = [None] * len(SensorReading)
+	if 'TPin' in SensorType[0:ActiveSensors] or 'LDRPin' in SensorType[0:ActiveSensors]:
+		# Import analogue front-end (thermistors, LDRs) - only needed (with numpy) for these sensors
+		import analog
 	for x in range(0, ActiveSensors):
-		if SensorType[x] == 'RPM':
-			if DebugLevel > 0: print("Using active low edge on pin ",SensorLoc[x])
-			GPIO.setup(int(SensorLoc[x],10), GPIO.IN) #, pull_up_down=GPIO.PUD_UP) # Add pull-up here only when testing without the photo-sensor attached
-			GPIO.add_event_detect(int(SensorLoc[x],10), GPIO.FALLING, callback=RPM_pulse, bouncetime=500)
+		if SensorType[x] == 'TPin' or SensorType[x] == 'LDRPin':
+			if SensorType[x] == 'TPin':
+				Function = analog.ThermistorFunction(Thermistor_R0[x], Thermistor_T0[x], Thermistor_Beta[x], Thermistor_SH[x])
+			else:
+				Function = analog.LDRFunction(LDR_R10[x], LDR_Gamma[x])
+			if '/' in SensorLoc[x]:
+				if DebugLevel > 0: print("Using analogue sensor on ADC channel ", SensorLoc[x])
+				FrontEnd = analog.ADCFrontEnd(sysfs.IIORawChannel(*SensorLoc[x].split('/')), ADC_FullScale[x])
+				Table = analog.DividerTable(Function, SeriesResistor[x])
+			else:
+				if DebugLevel > 0: print("Using analogue sensor (RC timing) on pin ", SensorLoc[x])
+				FrontEnd = analog.RCFrontEnd(GPIO, int(SensorLoc[x], 10))
+				Table = analog.RCTable(Function, TimingCapacitor[x])
+			AnalogSensors[x] = analog.AnalogSensor(FrontEnd, Table)
+
+# Define function to attach a pulse callback to a GPIO pin (or to the replayed pulses)...
+PulseCallbacks = {}
+def AddPulseInput(Pin, Callback, PullUp=False, Edge=counters.FALLING, Debounce=0.5):
+	if not Hardware:
+		PulseCallbacks[Pin] = Callback
+	else:
+		if PullUp:
+			GPIO.setup(Pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+		else:
+			GPIO.setup(Pin, GPIO.IN)
+		GPIOEdges = {counters.FALLING: GPIO.FALLING, counters.RISING: GPIO.RISING, counters.BOTH: GPIO.BOTH}
+		GPIO.add_event_detect(Pin, GPIOEdges[Edge], callback=Callback, bouncetime=int(Debounce * 1000))
+
+# Replayed pulses go to the same callbacks (the counters debounce them like GPIO.add_event_detect)
+def ReplayPulse(Pin):
+	if Pin in PulseCallbacks:
+		PulseCallbacks[Pin](Pin)
+
+# Interrupt callback routine for all the pulse counters
+def CounterPulse(channel):
+	if Counters.pulse(channel):
+		DebugLog ("Pulse detected on pin ", 1, 1, channel)
+
+# Pulse counter config...
+# Every sensor of a counting type (see counters.PRESETS: Electric_Whrs_import_today, SolarPV_Whrs_gen_today,
+# RPM, TrigN, TrigP) gets its own counter on its SensorLoc pin, set up from the preset and the pin's
+# entry in sensors.Counters. The other pulse types (kW, totals, Dist_m...) read the counter of their
+# family on their own SensorLoc pin, or else the first one.
+# The meter inputs assume the I/O pin is connected directly to the output of the photo detector stuck to
+# the front of the meter and that the output is pulled up to around 3.3V within the sensor monitoring module.
+# Recommend a resistor (say, 1kR) is connected in-line with the connection to the GPIO pin to protect the Pi
+for x in range(0, ActiveSensors):
+	if SensorType[x] in counters.PRESETS:
+		Pin = int(SensorLoc[x], 10)
+		Config = dict(counters.PRESETS[SensorType[x]])
+		Config.update(sensors.Counters.get(Pin, {}))
+		Counter = Counters.add(Pin, **Config)
+		if DebugLevel > 0: print("Using " + Counters.describe(Counter))
+		AddPulseInput(Pin, CounterPulse, Config['PullUp'], Config['Edge'], Config['Debounce'])
+SensorCounters = [None] * ActiveSensors
+for x in range(0, ActiveSensors):
+	if SensorType[x] in counters.TYPES:
+		SensorCounters[x] = Counters.find(SensorLoc[x], counters.TYPES[SensorType[x]])
+
+if Replay != '' and ReplayPulses != '':
+	Clock.add_source((PulseTime, ReplayPulse, Pin) for PulseTime, Pin in replay.ReadPulses(ReplayPulses))
+
+# Replayed RPICT3V1 frames go to a frame reader on the virtual clock, without its serial thread
+def ReplayFrame(line):
+	RPICT3V1Board.feed(Clock.time(), line)
+
+if Replay != '' and ReplayRPICT3V1 != '':
+	RPICT3V1Board = RPICT3V1.FrameReader(None, RPICT3V1Fields, Clock=Clock)
+	Clock.add_source((FrameTime, ReplayFrame, line) for FrameTime, line in replay.ReadFrames(ReplayRPICT3V1))
 
 # Update LogTitlesString with description of all sensors...
 logTitleString = ""
@@ -723,6 +1134,198 @@ for x in range(0, ActiveSensors):
 
 DebugLog (logTitleString, 1, 1)
 
+############################################################
+# Adaptive sampling
+# Each sensor has its own interval between MinInterval and MaxInterval, driven by the
+# activity of its readings. The main loop then ticks at the shortest MinInterval and only
+# reads the sensors that are due; the others keep their last reading.
+Samplers = []
+if Adaptive > 0:
+	for x in range(0, ActiveSensors):
+		Samplers.append(adaptive.AdaptiveInterval(MeasurementInterval, MinInterval[x], MaxInterval[x], AdaptiveThreshold[x]))
+	MeasurementInterval = min(MinInterval[0:ActiveSensors])
+	DebugLog ("Adaptive sampling: tick " + str(MeasurementInterval) + "s", 0, 1)
+
+# Per-cycle sensor state, allocated once and updated in place every cycle
+Due = [True] * ActiveSensors
+Allowed = [True] * ActiveSensors
+Failed = [False] * ActiveSensors
+RPICT3V1Sensors = [x for x in range(0, ActiveSensors) if SensorType[x].startswith('RPICT3V1_')]
+
+# Define function to select the sensors to read this cycle...
+def SensorsDue(TimeNow, Due):
+	if Adaptive == 0:
+		return Due
+	for x in range(0, ActiveSensors):
+		Due[x] = Samplers[x].Due(TimeNow, MeasurementInterval / 2.0)
+	# All RPICT3V1 sensors share one data set, read by RPICT3V1_MainsElectricityVoltage, so
+	# they are read together whenever any of them is due
+	if any(Due[x] for x in RPICT3V1Sensors):
+		for x in RPICT3V1Sensors:
+			Due[x] = True
+	return Due
+
+############################################################
+# Sensor health
+# Every sensor is read through its own circuit breaker (see health.py), so a sensor that
+# keeps failing is skipped and retried on a backoff rather than costing time every cycle.
+# Failed or skipped sensors report their last good reading, or NaN, and aren't uploaded.
+Health = [health.SensorHealth(LogTitles[x], FailureThreshold, FailureBackoff, MaxFailureBackoff, StaleAge) for x in range(0, ActiveSensors)]
+
+# Define function to apply the circuit breakers to the sensors due this cycle...
+# All RPICT3V1 sensors depend on the data set read by RPICT3V1_MainsElectricityVoltage so they are skipped with it
+def SensorsAllowed(TimeNow, Due, Allowed):
+	for x in range(0, ActiveSensors):
+		Allowed[x] = Due[x] and Health[x].allow(TimeNow)
+	for x in RPICT3V1Sensors:
+		if SensorType[x] == 'RPICT3V1_MainsElectricityVoltage' and Due[x] and not Allowed[x]:
+			for y in RPICT3V1Sensors:
+				Allowed[y] = False
+	return Allowed
+
+# Define function to read a sensor through its circuit breaker...
+# Returns None if the read failed
+def ReadSensor(SensorID, TimeNow):
+	measurement = health.Read(Health[SensorID], TimeNow, lambda: read_sensor(SensorID))
+	if measurement is None:
+		logString = LogTitles[SensorID] + " read failed: " + Health[SensorID].LastError
+		DebugLog (logString, 1, 1)
+		if Health[SensorID].State == health.OPEN:
+			logString = LogTitles[SensorID] + " skipped for " + str(int(Health[SensorID].Backoff)) + "s after " + str(Health[SensorID].Failures) + " failures"
+			DebugLog (logString, 0, 1)
+	return measurement
+
+# Define function to write the sensor health snapshot...
+def WriteHealth(NextHealthTime, TimeNow):
+	if HealthFile != '' and TimeNow >= NextHealthTime:
+		NextHealthTime = TimeNow + max(LogInterval, MeasurementInterval)
+		try:
+			health.WriteSnapshot(HealthFile, Health, TimeNow, MemoryUsage)
+		except OSError as e:
+			DebugLog ("Health snapshot write error: " + str(e), 1, 1)
+	return NextHealthTime
+
+############################################################
+# Memory self-report
+# Every MemoryReport seconds the logger's RSS (and Python heap, with -TraceMalloc 1) is
+# logged and added to the health snapshot (and -MemoryLog), with a warning if RSS exceeds MemoryBudget.
+# In replay the reports only go to -MemoryLog: they depend on the host, not on the replayed inputs.
+MemoryBudget = sensors.MemoryBudget
+MemoryUsage = None
+if TraceMalloc > 0:
+	tracemalloc.start()
+
+# Define function to report memory use...
+def ReportMemory(NextMemoryTime, TimeNow):
+	global MemoryUsage
+	if MemoryReport > 0 and TimeNow >= NextMemoryTime:
+		NextMemoryTime = TimeNow + MemoryReport
+		MemoryUsage = memory.Usage()
+		if MemoryLog != '':
+			memory.Append(MemoryLog, TimeNow, MemoryUsage)
+		if Replay != '':
+			return NextMemoryTime
+		DebugLog ("Memory: ", 1, 1, memory.Describe(MemoryUsage))
+		if MemoryUsage['rss_kb'] > MemoryBudget * 1024:
+			DebugLog ("Warning: memory use over budget (" + str(MemoryBudget) + " MB): " + memory.Describe(MemoryUsage), 0, 1)
+	return NextMemoryTime
+
+############################################################
+# Multi-process mode
+# The sampler (this process) writes each set of readings into a shared-memory ring and
+# the consumers below run in their own processes, reading the ring at their own pace.
+# A slow or crashed consumer never delays sampling; crashed consumers are restarted.
+
+# Uploader: output backend (and webhook) logging every LogInterval (see LogDue)
+def UploaderConsumer():
+	NextTime = [0]
+	Pending = [0]
+	def Handler(TimeNow, Reading, SensorVal, Updated, Stale):
+		Pending[0] = Pending[0] | Updated
+		if NextTime[0] == 0:
+			NextTime[0] = TimeNow + LogInterval
+		Due, NextTime[0] = LogDue(TimeNow, NextTime[0], Pending[0])
+		if Due:
+			Held = HeldMask(SensorVal, Pending[0], Stale)
+			UploadData(logTitleString, LogString(TimeNow, Reading, SensorVal, Stale, Held), SensorVal, Pending[0], Stale)
+			Pending[0] = 0
+	return Handler
+
+# Storage: log file every LogInterval (see LogDue)
+def StorageConsumer():
+	NextTime = [0]
+	Pending = [0]
+	def Handler(TimeNow, Reading, SensorVal, Updated, Stale):
+		Pending[0] = Pending[0] | Updated
+		if NextTime[0] == 0:
+			NextTime[0] = TimeNow + LogInterval
+		Due, NextTime[0] = LogDue(TimeNow, NextTime[0], Pending[0])
+		if Due:
+			Held = HeldMask(SensorVal, Pending[0], Stale)
+			StoreData(TimeNow, LogString(TimeNow, Reading, SensorVal, Stale, Held), SensorVal, Stale, Held)
+			Pending[0] = 0
+	return Handler
+
+# Display: MicroDot pHAT every DisplayInterval
+def DisplayConsumer():
+	NextTime = [0]
+	def Handler(TimeNow, Reading, SensorVal, Updated, Stale):
+		if NextTime[0] == 0:
+			NextTime[0] = TimeNow + DisplayInterval
+		NextTime[0] = DisplayData(NextTime[0], SensorVal[DisplaySensor1], "c ")
+	return Handler
+
+# Alerting: warning thresholds on every set of readings
+def AlertingConsumer():
+	def Handler(TimeNow, Reading, SensorVal, Updated, Stale):
+		if DebugLevel > 0: print(LogString(TimeNow, Reading, SensorVal, Stale))
+		CheckWarnings(SensorVal)
+	return Handler
+
+def ConsumerOverrun(Name):
+	def OnOverrun(Lost):
+		DebugLog (Name + " consumer overrun - " + str(Lost) + " readings skipped", 0, 1)
+	return OnOverrun
+
+def StartConsumer(Name):
+	process = MPContext.Process(target=ringbuffer.RunConsumer, name=Name,
+		args=(Ring, Consumers[Name](), 0.1, ConsumerOverrun(Name), ConsumerExit.get(Name)), daemon=True)
+	process.start()
+	return process
+
+# Restart any consumer process that has died
+# A restarted consumer is forked while the RPICT3V1 frame reader thread runs; that thread only
+# takes its own lock, which the consumers never use
+def SuperviseConsumers():
+	for Name in ConsumerProcesses:
+		if not ConsumerProcesses[Name].is_alive():
+			DebugLog ("Restarting " + Name + " consumer (exit code " + str(ConsumerProcesses[Name].exitcode) + ")", 0, 1)
+			ConsumerProcesses[Name] = StartConsumer(Name)
+
+Consumers = {}
+ConsumerExit = {'storage': CloseStorage}
+ConsumerProcesses = {}
+if MultiProcess > 0:
+	# The consumers are forked (they run this script's functions and state) before the RPICT3V1
+	# frame reader thread is started, so none of them inherits a lock held by it
+	MPContext = multiprocessing.get_context('fork')
+	Ring = ringbuffer.SampleRing(Capacity=1024, NumValues=len(SensorReading))
+	LogName = MPContext.Array('c', 256)
+	LogName.value = timestr.encode()
+	logger.addFilter(FollowLog)
+	Consumers['alerting'] = AlertingConsumer
+	if LogInterval > 0:
+		Consumers['uploader'] = UploaderConsumer
+		Consumers['storage'] = StorageConsumer
+	if DisplayInterval > 0 and DisplaySensor1 >= 0:
+		Consumers['display'] = DisplayConsumer
+	for Name in Consumers:
+		ConsumerProcesses[Name] = StartConsumer(Name)
+	DebugLog ("Multi-process mode: " + str(len(Consumers)) + " consumer processes", 0, 1)
+
+if Hardware and RPICT3V1Board is not None:
+	RPICT3V1Board.start()
+
 ############################################################
 # Main program loop
 try:
@@ -735,90 +1338,120 @@ try:
 	DebugLog("Multi-function data logger running...",0,0)
 
 	# Set first LogTime
-	NextLogTime = time.time() + LogInterval
+	NextLogTime = Clock.time() + LogInterval
 	
 	# Set first DisplayTime
-	NextDisplayTime = time.time() + DisplayInterval
+	NextDisplayTime = Clock.time() + DisplayInterval
 	
 	# Set first MeasurementTime
-	NextMeasurementTime = time.time()
+	NextMeasurementTime = Clock.time()
 	
+	# Write the first health snapshot and memory report after the first reading
+	NextHealthTime = 0
+	NextMemoryTime = 0
+
 	# First reading...
 	Reading = 0
-	prev_TimeNow = time.time()
+	prev_TimeNow = Clock.time()
 	
-	while Reading < NumReadings or NumReadings < 1:
-		TimeNow = time.time()
+	while (Reading < NumReadings or NumReadings < 1) and not (Replay != '' and Trace.finished()):
+		TimeNow = Clock.time()
 		
 		# Pause between measurements
 		while TimeNow < NextMeasurementTime:
 			# Check CPU throttle status while waiting...
-			DebugLog("Reading throttle...",3,999)
-			ThrottleMonitor()
-			time.sleep(0.2)
-			TimeNow = time.time()
+			if Hardware:
+				DebugLog("Reading throttle...",3,999)
+				ThrottleMonitor()
+				Clock.sleep(min(0.2, NextMeasurementTime - TimeNow))
+			else:
+				Clock.sleep(NextMeasurementTime - TimeNow)
+			TimeNow = Clock.time()
 
 		NextMeasurementTime = NextMeasurementTime + MeasurementInterval
 
+		# Replay: apply the traced readings up to now
+		if Replay != '':
+			Trace.advance(TimeNow)
+
+		# Select the sensors to read, skipping those whose circuit breaker is open
+		SensorsDue(TimeNow, Due)
+		SensorsAllowed(TimeNow, Due, Allowed)
+		for x in range(0, ActiveSensors):
+			Failed[x] = False
+
 		# Reset average measurements
 		# Note: Averaging is only supported for some types of sensors
 		for x in range(0, ActiveSensors):
-			if SensorType[x] == 'T1w' or SensorType[x] == 'LM75' or SensorType[x] == 'CPU_Temp' or SensorType[x] == 'TPin':
+			if Allowed[x] and (SensorType[x] == 'T1w' or SensorType[x] == 'LM75' or SensorType[x] == 'CPU_Temp'):
 				SensorReading[x] = 0.0
 
 		# Measurement loop
 		# Note: Averaging is only supported for some types of sensors
+		# A sensor that fails a read isn't read again this cycle
 		for i in range (0, NumAverages):
 			for x in range(0, ActiveSensors):
-				if SensorType[x] == 'T1w' or SensorType[x] == 'LM75' or SensorType[x] == 'CPU_Temp' or SensorType[x] == 'TPin':
-					SensorReading[x] = SensorReading[x] + read_sensor(x)
+				if not Allowed[x] or Failed[x]:
+					continue
+				if SensorType[x] == 'TPin' or SensorType[x] == 'LDRPin' or SensorType[x].startswith('RPICT3V1_'):
+					# Analogue sensors average a burst of NumAverages samples in a single read, and the
+					# RPICT3V1 data set (with the statistics of every frame since the last cycle) is taken once
+					if i > 0:
+						continue
+				measurement = ReadSensor(x, TimeNow)
+				if measurement is None:
+					Failed[x] = True
+				elif SensorType[x] == 'T1w' or SensorType[x] == 'LM75' or SensorType[x] == 'CPU_Temp':
+					SensorReading[x] = SensorReading[x] + measurement
 				else:
-					SensorReading[x] = read_sensor(x)
+					SensorReading[x] = measurement
 				
 
 		# Calculate average
 		# Note: Averaging is only supported for some types of sensors
 		for x in range(0, ActiveSensors):
-			if SensorType[x] == 'T1w' or SensorType[x] == 'LM75' or SensorType[x] == 'CPU_Temp' or SensorType[x] == 'TPin':
+			if Allowed[x] and not Failed[x] and (SensorType[x] == 'T1w' or SensorType[x] == 'LM75' or SensorType[x] == 'CPU_Temp'):
 				SensorReading[x] = SensorReading[x] / NumAverages
 
-		# Check for warnings...
-		for x in range(0, ActiveSensors):
-			# Check for low warning
-			if SensorReading[x] < LowWarning[x]:
-				if LowWarningIssued[x] == False:
-					DebugLog("Low warning!",999,1)
-					# Issue Warning via IFTTT...
-					#r = requests.post('https://maker.ifttt.com/trigger/Water_low_temp/with/key/' + IFTTT_KEY, params={"value1":"none","value2":"none","value3":"none"})
-					LowWarningIssued[x] = True
-			if SensorReading[x] > LowReset[x]:
-				LowWarningIssued[x] = False
-			# Check for high warning
-			if SensorReading[x] > HighWarning[x]:
-				if HighWarningIssued[x] == False:
-					DebugLog("High warning!",999,1)
-					# Issue Warning via IFTTT...
-					#r = requests.post('https://maker.ifttt.com/trigger/Water_low_temp/with/key/' + IFTTT_KEY, params={"value1":"none","value2":"none","value3":"none"})
-					HighWarningIssued[x] = True
-			if SensorReading[x] < HighReset[x]:
-				HighWarningIssued[x] = False
-
-		# update logString with current temperature(s)
-		logTime = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(TimeNow))
-		logString = logTime + ";" + str(Reading) + ";"
+		# Flag the sensors read and schedule their next reading
+		# Failed or skipped sensors report their last good reading (flagged stale) or NaN
+		Updated = 0
+		Stale = 0
 		for x in range(0, ActiveSensors):
-			logString = logString + str(SensorReading[x]) + ";"
-
-		# Print the result
-		if DebugLevel > 0: print(logString)
-		
-		# Write to log...
-		if LogInterval > 0:
-			NextLogTime = LogData(NextLogTime, logTitleString, logString, SensorReading)
-		
-		# Write to display...
-		if DisplayInterval > 0 and DisplaySensor1 >= 0:
-			NextDisplayTime = DisplayData(NextDisplayTime, SensorReading[DisplaySensor1], "c ")
+			if Allowed[x] and not Failed[x]:
+				Health[x].success(TimeNow, SensorReading[x])
+				Updated = Updated | (1 << x)
+				if Adaptive > 0:
+					Samplers[x].Update(TimeNow, SensorReading[x])
+			elif Due[x]:
+				SensorReading[x] = Health[x].fallback(TimeNow)
+			if Health[x].Quality == health.STALE:
+				Stale = Stale | (1 << x)
+		SensorUpdated = SensorUpdated | Updated
+		SensorStale = Stale
+		NextMemoryTime = ReportMemory(NextMemoryTime, TimeNow)
+		NextHealthTime = WriteHealth(NextHealthTime, TimeNow)
+
+		# Hand the readings over to the consumer processes...
+		if MultiProcess > 0:
+			Ring.write(TimeNow, Reading, SensorReading, Updated, Stale)
+			SuperviseConsumers()
+			RotateLog()
+
+		else:
+			# Check for warnings...
+			CheckWarnings(SensorReading)
+
+			# Print the result
+			if DebugLevel > 0: print(LogString(TimeNow, Reading, SensorReading, Stale))
+			
+			# Write to log...
+			if LogInterval > 0:
+				NextLogTime = LogData(NextLogTime, logTitleString, Reading, SensorReading)
+			
+			# Write to display...
+			if DisplayInterval > 0 and DisplaySensor1 >= 0:
+				NextDisplayTime = DisplayData(NextDisplayTime, SensorReading[DisplaySensor1], "c ")
 		
 		# NumReadings countdown...
 		if Reading < NumReadings:
@@ -834,6 +1467,17 @@ except KeyboardInterrupt:
 
 finally:
 	DebugLog ("Closing data logger", 0, 1)
+	if Outputs is not None:
+		for Output in Outputs:
+			Output.Close()
+	CloseStorage()
+	if RPICT3V1Board is not None:
+		RPICT3V1Board.close()
+	if MultiProcess > 0:
+		Ring.close()
+		for Name in ConsumerProcesses:
+			ConsumerProcesses[Name].join(5)
+		Ring.release()
 
 	
 	
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# RPICT3V1 frame reader and energy integrator
+# The RPICT3V1 streams a frame of space separated fields (NodeID first) several times a
+# second. A background thread reads every frame as it arrives, keeps the latest one for the
+# logger's readers and feeds the selected fields into integrators, so energy (Wh) is the
+# trapezoidal integral of every frame rather than one sample per MeasurementInterval.
+# Power fields are signed: positive is import, negative is export. An interval between two
+# frames where the power changes sign is split at the (interpolated) zero crossing.
+import argparse
+import threading
+import time
+
+class Channel(object):
+    # Gaps between frames longer than MaxGap seconds (e.g. a serial dropout) are not integrated
+    def __init__(self, Field, MaxGap=5.0):
+        self.Field = Field
+        self.MaxGap = MaxGap
+        self.ImportWh = 0.0     # running totals
+        self.ExportWh = 0.0
+        self._t = None
+        self._v = 0.0
+        self._reset()
+
+    def _reset(self):
+        self.Frames = 0
+        self.Duration = 0.0
+        self.Integral = 0.0     # value x seconds
+        self.Positive = 0.0     # W x seconds imported
+        self.Negative = 0.0     # W x seconds exported
+        self.Min = float('nan')
+        self.Max = float('nan')
+
+    def add(self, t, v):
+        if self._t is not None:
+            dt = t - self._t
+            if 0 < dt <= self.MaxGap:
+                v0 = self._v
+                if (v0 >= 0) == (v >= 0):
+                    area = (v0 + v) * 0.5 * dt
+                    if area >= 0:
+                        self.Positive = self.Positive + area
+                    else:
+                        self.Negative = self.Negative - area
+                else:
+                    tz = dt * v0 / (v0 - v)
+                    first = v0 * tz * 0.5
+                    second = v * (dt - tz) * 0.5
+                    self.Positive = self.Positive + max(first, second)
+                    self.Negative = self.Negative - min(first, second)
+                self.Integral = self.Integral + (v0 + v) * 0.5 * dt
+                self.Duration = self.Duration + dt
+        self._t = t
+        self._v = v
+        self.Frames = self.Frames + 1
+        if not self.Min <= v:
+            self.Min = v
+        if not self.Max >= v:
+            self.Max = v
+
+    # Statistics since the last snapshot, then start a new interval
+    def snapshot(self):
+        importWh = self.Positive / 3600.0
+        exportWh = self.Negative / 3600.0
+        self.ImportWh = self.ImportWh + importWh
+        self.ExportWh = self.ExportWh + exportWh
+        stats = {'frames': self.Frames, 'duration': self.Duration,
+                 'import_wh': importWh, 'export_wh': exportWh,
+                 'mean': self.Integral / self.Duration if self.Duration > 0 else self._v,
+                 'min': self.Min, 'max': self.Max,
+                 'peak_import': max(self.Max, 0.0) if self.Frames else float('nan'),
+                 'min_import': max(self.Min, 0.0) if self.Frames else float('nan')}
+        self._reset()
+        return stats
+
+# Parse one frame (bytes, with or without the line ending) into its fields, or None
+def ParseFrame(line, NodeID='11', NumFields=16):
+    fields = line.strip().decode(errors='replace').split(' ')
+    if len(fields) != NumFields or fields[0] != NodeID:
+        return None
+    return fields
+
+class FrameReader(object):
+    # Port is an open serial port (with a read timeout); Fields are the frame fields to integrate
+    # Clock provides time() (the wall clock, or the replay clock with frames fed in by feed())
+    def __init__(self, Port, Fields=(), NodeID='11', NumFields=16, MaxGap=5.0, MaxAge=5.0, Clock=time):
+        self.Port = Port
+        self.Clock = Clock
+        self.NodeID = NodeID
+        self.NumFields = NumFields
+        self.MaxAge = MaxAge
+        self.Channels = [Channel(field, MaxGap) for field in sorted(set(Fields))]
+        self.Frames = 0
+        self.Errors = 0
+        self._latest = None
+        self._latestTime = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='RPICT3V1', daemon=True)
+        self._thread.start()
+
+    # Nothing here logs or prints: the logger's consumer processes are restarted by forking
+    # while this thread runs, and would inherit any lock it held
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                line = self.Port.readline()
+            except Exception:
+                # Serial port gone (e.g. unplugged) - keep trying
+                self.Errors = self.Errors + 1
+                self._stop.wait(1.0)
+                continue
+            if line:
+                self.feed(self.Clock.time(), line)
+
+    # Process one frame line (bytes) received at time t
+    def feed(self, t, line):
+        fields = ParseFrame(line, self.NodeID, self.NumFields)
+        if fields is None:
+            self.Errors = self.Errors + 1
+            return
+        self.add(t, fields)
+
+    # Process one frame received at time t
+    def add(self, t, fields):
+        try:
+            values = [float(fields[channel.Field]) for channel in self.Channels]
+        except ValueError:
+            self.Errors = self.Errors + 1
+            return
+        with self._lock:
+            for x in range(0, len(self.Channels)):
+                self.Channels[x].add(t, values[x])
+            self._latest = fields
+            self._latestTime = t
+            self.Frames = self.Frames + 1
+
+    # Fields of the latest frame, or None if there hasn't been one for MaxAge seconds
+    def latest(self):
+        with self._lock:
+            if self._latest is None or self.Clock.time() - self._latestTime > self.MaxAge:
+                return None
+            return self._latest
+
+    # Statistics of every integrated field since the last call, by field
+    def interval(self):
+        with self._lock:
+            return dict((channel.Field, channel.snapshot()) for channel in self.Channels)
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(2.0)
+
+# Print the integrated statistics of the given fields every Interval seconds
+if __name__ == '__main__':
+    import serial
+
+    parser = argparse.ArgumentParser(description='Monitor RPICT3V1 frames and integrated energy')
+    parser.add_argument('-Port', action='store', dest='Port', default='/dev/ttyAMA0',
+                        help='Serial port')
+    parser.add_argument('-Fields', action='store', dest='Fields', default='1',
+                        help='Comma separated frame fields to integrate (e.g. active power fields)')
+    parser.add_argument('-Interval', action='store', dest='Interval', default=10,
+                        help='Report interval in seconds')
+    arguments = parser.parse_args()
+
+    reader = FrameReader(serial.Serial(arguments.Port, 38400, timeout=1),
+                         [int(field) for field in arguments.Fields.split(',')])
+    reader.start()
+    try:
+        while True:
+            time.sleep(float(arguments.Interval))
+            for field, stats in sorted(reader.interval().items()):
+                print("Field %d: %d frames, import %.3f Wh, export %.3f Wh, mean %.1f, min %.1f, max %.1f" %
+                      (field, stats['frames'], stats['import_wh'], stats['export_wh'],
+                       stats['mean'], stats['min'], stats['max']))
+            print("Frames %d, errors %d" % (reader.Frames, reader.Errors))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        reader.close()
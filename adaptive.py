@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# Adaptive per-sensor sampling intervals
+# Each sensor's interval is halved (down to MinInterval) while its recent readings are
+# active - the last change or the spread of the recent window exceeds Threshold - and grows
+# by half again (up to MaxInterval) once the readings have been quiet for a whole window.
+import math
+from collections import deque
+
+class AdaptiveInterval(object):
+    def __init__(self, Interval, MinInterval, MaxInterval, Threshold, Window=6):
+        self.MinInterval = float(MinInterval)
+        self.MaxInterval = float(MaxInterval)
+        self.Threshold = float(Threshold)
+        self.Interval = min(max(float(Interval), self.MinInterval), self.MaxInterval)
+        self.NextTime = 0.0
+        self.Reads = 0
+        self._values = deque(maxlen=Window)
+
+    # Check if the sensor should be read now. Slack allows for a late main loop tick.
+    def Due(self, TimeNow, Slack=0.0):
+        return TimeNow + Slack >= self.NextTime
+
+    # Activity of the recent readings: the larger of the last change and the standard deviation
+    def Activity(self):
+        if len(self._values) < 2:
+            return 0.0
+        mean = sum(self._values) / len(self._values)
+        spread = math.sqrt(sum((v - mean) ** 2 for v in self._values) / len(self._values))
+        return max(abs(self._values[-1] - self._values[-2]), spread)
+
+    # Record a new reading and schedule the next one
+    def Update(self, TimeNow, Value):
+        self.Reads = self.Reads + 1
+        if math.isnan(Value):
+            # A failed reading is retried at the fastest rate
+            self.Interval = self.MinInterval
+        elif self.Threshold > 0:
+            self._values.append(Value)
+            activity = self.Activity()
+            if activity > self.Threshold:
+                self.Interval = max(self.MinInterval, self.Interval / 2)
+            elif activity < self.Threshold / 2 and len(self._values) == self._values.maxlen:
+                self.Interval = min(self.MaxInterval, self.Interval * 1.5)
+        self.NextTime = TimeNow + self.Interval
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# Analogue front-end for thermistors and light dependent resistors (LDRs)
+# The sensor resistance is measured either through an ADC channel (sensor on the low side of
+# a voltage divider) or by RC timing on a GPIO pin (time for the timing capacitor to charge
+# through the sensor up to the pin's logic threshold).
+# Conversion to temperature / light level uses a lookup table precomputed from the Beta or
+# Steinhart-Hart equation (or the LDR power law) and linear interpolation, so a burst of
+# NumAverages samples is converted and averaged with one array operation and no per-sample
+# log() math.
+import time
+
+import numpy as np
+
+KELVIN = 273.15
+
+# Temperature (C) of a thermistor of resistance R from the Beta equation
+def BetaTemperature(R, R0, T0, Beta):
+    return 1.0 / (1.0 / (T0 + KELVIN) + np.log(R / R0) / Beta) - KELVIN
+
+# Temperature (C) of a thermistor of resistance R from the Steinhart-Hart equation
+def SteinhartHartTemperature(R, A, B, C):
+    lnR = np.log(R)
+    return 1.0 / (A + B * lnR + C * lnR ** 3) - KELVIN
+
+# Light level (lux) of an LDR of resistance R, from its resistance at 10 lux and gamma
+def LDRLux(R, R10, Gamma):
+    return 10.0 * (R10 / R) ** (1.0 / Gamma)
+
+class ConversionTable(object):
+    # X must be increasing
+    def __init__(self, X, Y):
+        self.X = np.asarray(X, dtype=float)
+        self.Y = np.asarray(Y, dtype=float)
+
+    # Convert a scalar or array of measurements
+    def convert(self, samples):
+        return np.interp(samples, self.X, self.Y)
+
+    # Convert a burst of samples and return their average
+    def average(self, samples):
+        return float(np.mean(np.interp(samples, self.X, self.Y)))
+
+# Table indexed by ADC ratio (code / full scale) for a sensor on the low side of a divider
+# with SeriesR to the reference: R = SeriesR * ratio / (1 - ratio)
+def DividerTable(Function, SeriesR, Points=1024):
+    ratio = np.linspace(0.5 / Points, 1.0 - 0.5 / Points, Points)
+    return ConversionTable(ratio, Function(SeriesR * ratio / (1.0 - ratio)))
+
+# Table indexed by RC charge time: t = R * C * ln(1 / (1 - Threshold)), where Threshold is the
+# pin's logic-high threshold as a fraction of the supply. Covers RMin..RMax log-spaced.
+def RCTable(Function, Capacitance, Threshold=0.4, RMin=100.0, RMax=1e7, Points=1024):
+    R = np.logspace(np.log10(RMin), np.log10(RMax), Points)
+    return ConversionTable(R * Capacitance * np.log(1.0 / (1.0 - Threshold)), Function(R))
+
+def ThermistorFunction(R0=10000.0, T0=25.0, Beta=3950.0, SteinhartHart=None):
+    if SteinhartHart:
+        A, B, C = SteinhartHart
+        return lambda R: SteinhartHartTemperature(R, A, B, C)
+    return lambda R: BetaTemperature(R, R0, T0, Beta)
+
+def LDRFunction(R10=20000.0, Gamma=0.7):
+    return lambda R: LDRLux(R, R10, Gamma)
+
+# ADC channel front-end (a sysfs.IIORawChannel, read as raw ADC codes)
+class ADCFrontEnd(object):
+    def __init__(self, Channel, FullScale=1023):
+        self.Channel = Channel
+        self.FullScale = float(FullScale)
+
+    # Burst of samples as ADC ratios
+    def burst(self, NumSamples):
+        codes = np.fromiter((self.Channel.read_raw() for x in range(0, NumSamples)), dtype=float, count=NumSamples)
+        return codes / self.FullScale
+
+# RC timing front-end on a GPIO pin (RPi.GPIO module passed in)
+class RCFrontEnd(object):
+    def __init__(self, GPIO, Pin, Discharge=0.005, Timeout=0.1):
+        self.GPIO = GPIO
+        self.Pin = Pin
+        self.Discharge = Discharge
+        self.Timeout = Timeout
+
+    # Charge time of one sample in seconds
+    # Raises IOError if the pin never goes high (an open or dark sensor), so the read fails
+    # instead of the table clamping it to a plausible reading
+    def sample(self):
+        GPIO = self.GPIO
+        GPIO.setup(self.Pin, GPIO.OUT)
+        GPIO.output(self.Pin, GPIO.LOW)
+        time.sleep(self.Discharge)
+        start = time.perf_counter()
+        GPIO.setup(self.Pin, GPIO.IN)
+        while GPIO.input(self.Pin) == GPIO.LOW:
+            if time.perf_counter() - start > self.Timeout:
+                raise IOError("RC charge timeout (" + str(self.Timeout) + "s) on pin " + str(self.Pin))
+        return time.perf_counter() - start
+
+    # Burst of samples as charge times
+    def burst(self, NumSamples):
+        return np.fromiter((self.sample() for x in range(0, NumSamples)), dtype=float, count=NumSamples)
+
+class AnalogSensor(object):
+    def __init__(self, FrontEnd, Table):
+        self.FrontEnd = FrontEnd
+        self.Table = Table
+
+    # Average of a burst of NumSamples, converted in one array operation
+    def read(self, NumSamples=1):
+        return self.Table.average(self.FrontEnd.burst(max(NumSamples, 1)))
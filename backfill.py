@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+# Bulk backfill / replay of logged history to a Domoticz server
+# Streams the existing history files, maps each logged column to its DomoticzIDX and
+# uploads the values in concurrent, rate-limited batches.
+# Progress is saved after every batch that was fully uploaded, so an interrupted run can be
+# resumed. Failed requests are retried with a backoff; if a batch still fails the run stops
+# at the last saved position rather than skipping the batch.
+#
+# Note: by default values are uploaded as "now" values. -Date appends the logged date to
+# the svalue ("VALUE;DATE"), which Domoticz only stores as history for devices that accept
+# a dated svalue (e.g. managed counters) - every backfilled device must be of such a type.
+import argparse
+import http.client
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Import Domoticz logging functions
+import domoticz
+
+# Import history reader
+import logreader
+
+# Import sensor configurations
+import sensors
+
+parser = argparse.ArgumentParser(description='Backfill logged history to Domoticz')
+
+parser.add_argument('Files', nargs='*',
+                    help='History files to upload (default: all logs, oldest first)')
+
+parser.add_argument('-Workers', action='store', dest='Workers', default=8,
+                    help='Number of concurrent upload connections')
+
+parser.add_argument('-Rate', action='store', dest='Rate', default=200,
+                    help='Maximum requests per second (0 = unlimited)')
+
+parser.add_argument('-BatchSize', action='store', dest='BatchSize', default=1000,
+                    help='Number of requests per batch')
+
+parser.add_argument('-State', action='store', dest='State', default='logs/backfill.state',
+                    help='Resume state file')
+
+parser.add_argument('-Restart', action='store_true', dest='Restart',
+                    help='Ignore any saved resume state')
+
+parser.add_argument('-Date', action='store_true', dest='Date',
+                    help='Upload values with their logged date (all devices must accept a dated svalue)')
+
+parser.add_argument('-Retries', action='store', dest='Retries', default=5,
+                    help='Number of retries of the failed requests of a batch before stopping')
+
+parser.add_argument('-RetryDelay', action='store', dest='RetryDelay', default=2,
+                    help='Delay before the first retry in seconds, doubling with every retry')
+
+parser.add_argument('-DryRun', action='store_true', dest='DryRun',
+                    help='Parse and count requests without uploading')
+
+parser.add_argument('-DebugLevel', action='store', dest='DebugLevel', default=0,
+                    help='Configures debug functions (0 = no debug)')
+
+# Simple token bucket shared by all upload threads
+class RateLimiter(object):
+    def __init__(self, rate):
+        self._rate = float(rate)
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def wait(self):
+        if self._rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next, now)
+            self._next = slot + 1.0 / self._rate
+        if slot > now:
+            time.sleep(slot - now)
+
+# Uploads requests over one persistent HTTP connection per worker thread
+class Uploader(object):
+    def __init__(self, Workers, Rate, DryRun=False):
+        self._local = threading.local()
+        self._limiter = RateLimiter(Rate)
+        self._pool = ThreadPoolExecutor(max_workers=Workers)
+        self._dryrun = DryRun
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = http.client.HTTPConnection(domoticz.IP_Address, int(domoticz.port), timeout=10)
+            self._local.conn = conn
+        return conn
+
+    def _send(self, request):
+        idx, value, date = request
+        if self._dryrun:
+            return True
+        self._limiter.wait()
+        path = domoticz.UpdatePath(idx, value, date)
+        # Retry once on a fresh connection if the server dropped the old one
+        for attempt in range(0, 2):
+            conn = self._connection()
+            try:
+                conn.request('GET', path)
+                response = conn.getresponse()
+                response.read()
+                return response.status == 200
+            except (http.client.HTTPException, OSError):
+                conn.close()
+                self._local.conn = None
+        return False
+
+    # Upload a batch, returning the failed requests
+    def upload(self, batch):
+        return [request for request, ok in zip(batch, self._pool.map(self._send, batch)) if not ok]
+
+    def close(self):
+        self._pool.shutdown()
+
+# Map the columns of a history file to Domoticz IDX values
+# Columns are matched by sensor title where the file has one, otherwise by position
+def ColumnIDX(Titles, NumColumns):
+    idx = []
+    for x in range(0, NumColumns):
+        if x < len(Titles) and Titles[x] in sensors.SensorName:
+            sensor = sensors.SensorName.index(Titles[x])
+        else:
+            sensor = x
+        if sensor < len(sensors.DomoticzIDX) and sensors.DomoticzIDX[sensor] != 'x':
+            idx.append(sensors.DomoticzIDX[sensor])
+        else:
+            idx.append(None)
+    return idx
+
+def LoadState(filename):
+    try:
+        with open(filename, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+# Write the resume state atomically so a crash never leaves a truncated file
+def SaveState(filename, state):
+    tmpname = filename + '.tmp'
+    with open(tmpname, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmpname, filename)
+
+# Generate batches of (Position, requests) from one history file
+def Batches(filename, Offset, BatchSize, Date):
+    batch = []
+    columns = None
+    titles = None
+    for position, Titles, TimeStamp, Values in logreader.ReadHistory(filename, Offset):
+        if columns is None or Titles is not titles or len(Values) != len(columns):
+            columns = ColumnIDX(Titles, len(Values))
+            titles = Titles
+        date = None if not Date else time.strftime(logreader.LogTimeFormat, time.localtime(TimeStamp))
+        for x in range(0, len(Values)):
+            if columns[x] is not None and Values[x] == Values[x]:
+                batch.append((columns[x], Values[x], date))
+        if len(batch) >= BatchSize:
+            yield position, batch
+            batch = []
+    if batch:
+        yield position, batch
+
+# Upload a batch, retrying the failed requests with a doubling delay
+# Returns the requests that still failed after Retries retries
+def UploadBatch(uploader, batch, Retries, RetryDelay, DebugLevel=0):
+    failed = uploader.upload(batch)
+    delay = RetryDelay
+    for retry in range(0, Retries):
+        if not failed:
+            break
+        if DebugLevel > 0: print(len(failed), "requests failed, retrying in", delay, "s")
+        time.sleep(delay)
+        delay = delay * 2
+        failed = uploader.upload(failed)
+    return failed
+
+def Backfill(Files, Workers, Rate, BatchSize, StateFile, Date=False, DryRun=False, DebugLevel=0, Retries=5, RetryDelay=2.0):
+    state = LoadState(StateFile)
+    totalBytes = sum(logreader.SourceSize(f) for f in Files)
+    doneBytes = sum(min(state.get(os.path.abspath(f), 0), logreader.SourceSize(f)) for f in Files)
+    uploader = Uploader(Workers, Rate, DryRun)
+    sent = 0
+    errors = 0
+    startTime = time.time()
+
+    try:
+        for filename in Files:
+            key = os.path.abspath(filename)
+            offset = state.get(key, 0)
+            if offset >= logreader.SourceSize(filename):
+                continue
+            if DebugLevel > 0: print("Backfilling", filename, "from offset", offset)
+
+            for position, batch in Batches(filename, offset, BatchSize, Date):
+                failed = UploadBatch(uploader, batch, Retries, RetryDelay, DebugLevel)
+                if failed:
+                    # Keep the previous resume point so the batch is uploaded again next time
+                    errors = len(failed)
+                    print("Backfill stopped:", len(failed), "requests of a batch failed after", Retries,
+                          "retries - resume from offset", offset, "of", filename)
+                    return sent, errors
+                sent = sent + len(batch)
+                doneBytes = doneBytes + position - offset
+                offset = position
+                state[key] = position
+                if not DryRun:
+                    SaveState(StateFile, state)
+
+                elapsed = max(time.time() - startTime, 1e-6)
+                print("%5.1f%% %d requests %.0f req/s" %
+                      (100.0 * doneBytes / max(totalBytes, 1), sent, sent / elapsed))
+    finally:
+        uploader.close()
+
+    return sent, errors
+
+if __name__ == '__main__':
+    arguments = parser.parse_args()
+    Files = arguments.Files or logreader.HistoryFiles()
+    if arguments.Restart and os.path.exists(arguments.State):
+        os.remove(arguments.State)
+
+    try:
+        sent, errors = Backfill(Files, int(arguments.Workers), float(arguments.Rate),
+                                int(arguments.BatchSize), arguments.State,
+                                arguments.Date, arguments.DryRun, int(arguments.DebugLevel),
+                                int(arguments.Retries), float(arguments.RetryDelay))
+        if errors:
+            sys.exit(1)
+        print("Backfill completed:", sent, "requests")
+    except KeyboardInterrupt:
+        print("Keyboard Interrupt (ctrl-c) detected - progress saved to", arguments.State)
+        sys.exit(1)
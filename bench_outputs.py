@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# Benchmark of the output backends
+# Compares messages/s and client CPU time of the Domoticz HTTP path (one request per sensor
+# value) against the batched MQTT path, using a local stub HTTP server and the stub MQTT
+# broker, each running in its own process so only the logger side is measured.
+import argparse
+import http.server
+import multiprocessing
+import time
+
+import domoticz
+import mqtt
+import mqttbroker
+
+class StubDomoticzHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = b'{"status" : "OK", "title" : "Update Device"}'
+        self.wfile.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: ' +
+                         str(len(body)).encode() + b'\r\n\r\n' + body)
+
+    def log_message(self, format, *args):
+        pass
+
+def ServeHTTP(Port):
+    http.server.ThreadingHTTPServer(('127.0.0.1', Port), StubDomoticzHandler).serve_forever()
+
+def ServeMQTT(Port):
+    mqttbroker.StubBroker('127.0.0.1', Port).serve_forever()
+
+def StartServer(target, Port):
+    process = multiprocessing.Process(target=target, args=(Port,), daemon=True)
+    process.start()
+    time.sleep(0.5)
+    return process
+
+def Measure(name, function, NumMessages):
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    function()
+    wall = time.perf_counter() - wall
+    cpu = time.process_time() - cpu
+    print("%-10s %8d msgs %10.0f msgs/s %8.1f us CPU/msg" % (name, NumMessages, NumMessages / wall, 1e6 * cpu / NumMessages))
+
+def BenchHTTP(Port, NumCycles, NumSensors):
+    domoticz.IP_Address = '127.0.0.1'
+    domoticz.port = str(Port)
+    def run():
+        for cycle in range(0, NumCycles):
+            for x in range(0, NumSensors):
+                domoticz.LogToDomoticz(str(x), 20.0 + cycle % 10)
+    Measure('HTTP', run, NumCycles * NumSensors)
+
+def BenchMQTT(Port, NumCycles, NumSensors, MaxInflight):
+    client = mqtt.MQTTClient('bench', '127.0.0.1', Port, MaxInflight=MaxInflight)
+    topics = ['MultiLogger/Sensor_' + str(x) for x in range(0, NumSensors)]
+    # The logger publishes one cycle per interval, so wait for the acknowledgements of every
+    # cycle (publishing never waits; messages beyond the in-flight window would be spooled)
+    def run():
+        for cycle in range(0, NumCycles):
+            client.publish_many([(topic, 20.0 + cycle % 10) for topic in topics])
+            client.flush()
+    Measure('MQTT', run, NumCycles * NumSensors)
+    if client.Spooled or client.Dropped:
+        print("MQTT: %d spooled, %d dropped (in-flight window too small)" % (client.Spooled, client.Dropped))
+    client.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Output backend benchmark')
+    parser.add_argument('-Cycles', action='store', dest='Cycles', default=500,
+                        help='Number of log cycles')
+    parser.add_argument('-Sensors', action='store', dest='Sensors', default=16,
+                        help='Number of sensors per cycle')
+    parser.add_argument('-MaxInflight', action='store', dest='MaxInflight', default=20,
+                        help='MQTT in-flight window')
+    arguments = parser.parse_args()
+
+    httpServer = StartServer(ServeHTTP, 18085)
+    mqttServer = StartServer(ServeMQTT, 18883)
+    try:
+        BenchHTTP(18085, int(arguments.Cycles), int(arguments.Sensors))
+        BenchMQTT(18883, int(arguments.Cycles), int(arguments.Sensors), int(arguments.MaxInflight))
+    finally:
+        httpServer.terminate()
+        mqttServer.terminate()
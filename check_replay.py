@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+# Regression checks of the logger, replayed on the virtual clock
+# Each check writes a synthetic trace (replay.py) and a sensor configuration into a temporary
+# directory, runs MultiLogger.py on them in replay mode with a fixed time zone and compares
+# the log it writes against the values expected from the inputs:
+#   dst  - 2 days over the end of summer time (Europe/London): evenly spaced log timing in
+#          UTC, local log timestamps with the repeated hour, and the daily pulse count
+#          (1 Wh per pulse) reset at each local midnight, and the same log from a second run
+#   rpict  - 2 hours of RPICT3V1 frames (one a second, the power swinging between import and
+#            export) read with -NumAverages 2: the peak and minimum import of every frame in
+#            each cycle, and the imported and exported energy integrated over the frames
+#   adaptive - -Adaptive 1 on a trace that is quiet, then active with a one-sample spike:
+#            every reading taken is logged as read (the spike included) and the sensor's
+#            value is marked held on the log lines where it wasn't read
+# Exits with code 1 if any check fails.
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import adaptive
+import logreader
+import replay
+
+Directory = os.path.dirname(os.path.abspath(__file__))
+TZ = 'Europe/London'
+
+Failures = []
+
+def Check(name, passed, detail=''):
+    if passed:
+        print("ok   %-52s %s" % (name, detail))
+    else:
+        Failures.append(name)
+        print("FAIL %-52s %s" % (name, detail))
+
+# Write a -Config file for the given sensors (name, type, location)
+def WriteConfig(filename, Sensors, Settings={}):
+    n = len(Sensors)
+    config = {'SensorName': [s[0] for s in Sensors], 'SensorType': [s[1] for s in Sensors],
+              'SensorLoc': [s[2] for s in Sensors], 'SensorUnits': [''] * n,
+              'Sensor_A': [0.0] * n, 'Sensor_B': [1.0] * n, 'Sensor_C': [0.0] * n,
+              'HighWarning': [0] * n, 'HighReset': [0] * n, 'LowWarning': [0] * n, 'LowReset': [0] * n,
+              'DomoticzIDX': ['x'] * n, 'MQTT_Topic': ['x'] * n, 'OutputBackends': [],
+              'MinInterval': [10] * n, 'MaxInterval': [600] * n, 'AdaptiveThreshold': [0.2] * n,
+              'Counters': {}, 'DisplaySensor1': -1}
+    config.update(Settings)
+    with open(filename, 'w') as f:
+        for name in sorted(config):
+            f.write(name + ' = ' + repr(config[name]) + '\n')
+
+# Replay a trace and return the data lines of the log as (local timestamp, UTC timestamp,
+# values, logged value fields), held values read back as their value
+def RunReplay(directory, Trace, Pulses, Config, Arguments=[]):
+    output = os.path.join(directory, 'replay.log')
+    command = [sys.executable, os.path.join(Directory, 'MultiLogger.py'), '-Config', Config, '-TZ', TZ,
+               '-Replay', Trace, '-ReplayOutput', output, '-LogLevel', '1', '-HealthFile', ''] + Arguments
+    if Pulses:
+        command = command + ['-ReplayPulses', Pulses]
+    result = subprocess.run(command, cwd=directory, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    if result.returncode != 0:
+        print(result.stdout.decode(errors='replace'))
+        raise RuntimeError("MultiLogger.py exited with code " + str(result.returncode))
+    lines = []
+    with open(output, 'r') as f:
+        for line in f:
+            kind, data = logreader.ParseLine(line, Held=True)
+            if kind == 'data':
+                lines.append((line[0:19], data[0], data[2], logreader.LogMessage(line).split(';')[2:-1]))
+    return lines
+
+def LocalTime(t):
+    return time.strftime(logreader.LogTimeFormat, time.localtime(t))
+
+# Expected daily count at time t: pulses are debounced like counters.CounterBank.pulse and
+# the count restarts with the first pulse of a new local day
+def DailyCounts(Pulses, Debounce=0.5):
+    counted = []
+    last = None
+    for t, pin in replay.ReadPulses(Pulses):
+        if last is None or t - last >= Debounce:
+            counted.append(t)
+            last = t
+    x = 0
+    count = 0
+    day = None
+    def today(t):
+        nonlocal x, count, day
+        while x < len(counted) and counted[x] <= t:
+            if time.localtime(counted[x])[0:3] != day:
+                day = time.localtime(counted[x])[0:3]
+                count = 0
+            count = count + 1
+            x = x + 1
+        return count
+    return today
+
+def CheckDST(directory):
+    start = logreader.LogTimeToEpoch('2022-10-29 12:00:00')
+    trace = os.path.join(directory, 'dst.log')
+    pulses = os.path.join(directory, 'dst.pulses')
+    config = os.path.join(directory, 'dst.py')
+    replay.Synthesize(trace, pulses, start, 2, 60, ['Outside Temperature'], 17, 0.5)
+    WriteConfig(config, [('Outside Temperature', 'T1w', '28-0000'), ('Electric Today', 'Electric_Whrs_import_today', '17'),
+                         ('Electric Power', 'Electric_kW', '17')], {'MeasurementInterval': 60})
+    lines = RunReplay(directory, trace, pulses, config)
+
+    steps = set(lines[x + 1][1] - lines[x][1] for x in range(0, len(lines) - 1))
+    Check("dst: log every 60 s (UTC) across the change", steps == {60}, "steps " + str(sorted(steps)))
+    Check("dst: readings over 2 days", len(lines) >= 2 * 1440 - 2, str(len(lines)) + " lines")
+    wrong = [line for line in lines if line[0] != LocalTime(line[1])]
+    Check("dst: log timestamps in local time", not wrong, wrong[0][0] + " at " + str(wrong[0][1]) if wrong else '')
+    repeated = [line for line in lines if line[0].startswith('2022-10-30 01:')]
+    Check("dst: 01:00-02:00 local logged twice on 2022-10-30", len(repeated) == 120, str(len(repeated)) + " lines")
+
+    today = DailyCounts(pulses)
+    wrong = [line for line in lines if line[2][1] != today(line[1])]
+    Check("dst: daily count matches the pulses", not wrong,
+          "%s: logged %r, expected %d" % (wrong[0][0], wrong[0][2][1], today(wrong[0][1])) if wrong else '')
+    resets = [lines[x + 1][0] for x in range(0, len(lines) - 1) if lines[x + 1][2][1] < lines[x][2][1]]
+    Check("dst: daily count reset at each local midnight", [r[0:10] for r in resets] == ['2022-10-30', '2022-10-31']
+          and all(r[11:13] == '00' for r in resets), ', '.join(resets))
+    with open(os.path.join(directory, 'replay.log'), 'r') as f:
+        first = f.read()
+    RunReplay(directory, trace, pulses, config)
+    with open(os.path.join(directory, 'replay.log'), 'r') as f:
+        second = f.read()
+    Check("dst: same inputs give the same log", first == second)
+    totals = ["%s %d Wh" % (lines[x][0][0:10], lines[x][2][1]) for x in range(0, len(lines) - 1) if lines[x + 1][0][0:10] != lines[x][0][0:10]]
+    print("     daily totals: " + ', '.join(totals))
+
+# RPICT3V1 frame: signed power (W), current (A), power factor and voltage in fields 1-4
+def Frame(power):
+    return ' '.join(['11', '%.1f' % power, '%.2f' % (abs(power) / 240.0), '0.95', '240.0'] + ['0'] * 11)
+
+# Imported and exported Wh between two frames, split where the power changes sign
+def FrameWh(t0, v0, t1, v1):
+    dt = t1 - t0
+    if (v0 >= 0) == (v1 >= 0):
+        area = (v0 + v1) * 0.5 * dt
+        return max(area, 0.0) / 3600.0, max(-area, 0.0) / 3600.0
+    tz = dt * v0 / (v0 - v1)
+    first = v0 * tz * 0.5
+    second = v1 * (dt - tz) * 0.5
+    return max(first, second) / 3600.0, -min(first, second) / 3600.0
+
+def CheckRPICT3V1(directory):
+    start = logreader.LogTimeToEpoch('2022-06-01 10:00:00')
+    trace = os.path.join(directory, 'rpict.log')
+    pulses = os.path.join(directory, 'rpict.pulses')
+    frames = os.path.join(directory, 'rpict.frames')
+    config = os.path.join(directory, 'rpict.py')
+    replay.Synthesize(trace, pulses, start, 2 / 24.0, 60, ['Outside Temperature'], 17, 0.5)
+    # Frames start a second after the trace, so the first (unlogged) cycle has no data set
+    rng = random.Random(1)
+    received = []
+    with open(frames, 'w') as f:
+        for x in range(1, 2 * 3600):
+            power = round(300 + 600 * math.sin(2 * math.pi * x / 1800.0) + rng.gauss(0, 50), 1)
+            received.append((start + x, power))
+            f.write("%d;%s\n" % (start + x, Frame(power)))
+    WriteConfig(config, [('Outside Temperature', 'T1w', '28-0000'), ('Voltage', 'RPICT3V1_MainsElectricityVoltage', '4'),
+                         ('Import', 'RPICT3V1_ActiveImport', '1'), ('Peak Import', 'RPICT3V1_PeakImport', '1'),
+                         ('Min Import', 'RPICT3V1_MinImport', '1'), ('Imported Today', 'RPICT3V1_Whrs_import_today', '1'),
+                         ('Exported Today', 'RPICT3V1_Whrs_export_today', '1'), ('Power Factor', 'RPICT3V1_AvgPowerFactor', '3')],
+                {'MeasurementInterval': 60})
+    lines = RunReplay(directory, trace, None, config, ['-ReplayRPICT3V1', frames, '-NumAverages', '2'])
+
+    nan = [line for line in lines if any(math.isnan(v) for v in line[2][1:])]
+    Check("rpict: no NaN readings with -NumAverages 2", not nan, nan[0][0] + ' ' + str(nan[0][2]) if nan else '')
+    wrongPeak = []
+    wrongEnergy = []
+    importWh = 0.0
+    exportWh = 0.0
+    previous = lines[0][1] - 60
+    for line in lines:
+        cycle = [x for x in range(0, len(received)) if previous < received[x][0] <= line[1]]
+        for x in cycle:
+            if x > 0:
+                wh = FrameWh(received[x - 1][0], received[x - 1][1], received[x][0], received[x][1])
+                importWh = importWh + wh[0]
+                exportWh = exportWh + wh[1]
+        powers = [received[x][1] for x in cycle]
+        if line[2][3] != max(max(powers), 0.0) or line[2][4] != max(min(powers), 0.0):
+            wrongPeak.append("%s: logged %r/%r, expected %r/%r" % (line[0], line[2][3], line[2][4], max(max(powers), 0.0), max(min(powers), 0.0)))
+        if abs(line[2][5] - importWh) > 0.051 or abs(line[2][6] - exportWh) > 0.051:
+            wrongEnergy.append("%s: logged %r/%r, expected %.2f/%.2f" % (line[0], line[2][5], line[2][6], importWh, exportWh))
+        previous = line[1]
+    Check("rpict: peak and minimum import over each cycle's frames", lines and not wrongPeak,
+          wrongPeak[0] if wrongPeak else str(len(lines)) + " cycles")
+    Check("rpict: imported and exported Wh integrated over the frames", lines and not wrongEnergy,
+          wrongEnergy[0] if wrongEnergy else "%.1f/%.1f Wh" % (importWh, exportWh))
+
+def CheckAdaptive(directory):
+    start = logreader.LogTimeToEpoch('2022-06-01 00:00:00')
+    trace = os.path.join(directory, 'adaptive.log')
+    config = os.path.join(directory, 'adaptive.py')
+    # 10 s samples: flat, a ramp from 02:00 to 03:00 with a spike at 02:30:20, flat again
+    traced = {}
+    with open(trace, 'w') as f:
+        f.write("2022-06-01 00:00:00,000 INFO Water Temperature;\n")
+        for x in range(0, 6 * 360):
+            t = start + 10 * x
+            value = 20.0 + (x - 720) * 0.5 if 720 <= x < 1080 else 20.0
+            if t == start + 9020:
+                value = 99.0
+            traced[t] = value
+            logTime = time.strftime(logreader.LogTimeFormat, time.gmtime(t))
+            f.write("%s,000 INFO %s;%d;%s;\n" % (logTime, logTime, x, value))
+    WriteConfig(config, [('Water Temperature', 'T1w', '28-0000')],
+                {'MeasurementInterval': 60, 'LogInterval': 300, 'MinInterval': [10], 'MaxInterval': [600],
+                 'AdaptiveThreshold': [0.2]})
+    lines = RunReplay(directory, trace, None, config, ['-Adaptive', '1'])
+
+    read = [line for line in lines if not line[3][0].endswith(logreader.HeldMark)]
+    held = [line for line in lines if line[3][0].endswith(logreader.HeldMark)]
+    wrong = [line for line in read if line[2][0] != traced[line[1]]]
+    Check("adaptive: logged readings are the traced values", read and not wrong,
+          "%s: logged %r, traced %r" % (wrong[0][0], wrong[0][2][0], traced[wrong[0][1]]) if wrong else str(len(read)) + " readings")
+    Check("adaptive: spike at 02:30:20 logged", any(line[2][0] == 99.0 for line in read))
+    # The sensor's reads, from its sampler on the main loop ticks (every MinInterval)
+    sampler = adaptive.AdaptiveInterval(60, 10, 600, 0.2)
+    reads = []
+    for t in sorted(traced):
+        if sampler.Due(t, 5):
+            sampler.Update(t, traced[t])
+            reads.append(t)
+    fast = [t for t in reads if start + 7200 <= t < start + 10800]
+    Check("adaptive: every reading taken is logged", [line[1] for line in read] == reads,
+          "%d of %d readings, %d from 02:00 to 03:00" % (len(read), len(reads), len(fast)))
+    last = {}
+    previous = None
+    for line in lines:
+        if not line[3][0].endswith(logreader.HeldMark):
+            previous = line[2][0]
+        elif line[2][0] != previous:
+            last = line
+            break
+    Check("adaptive: held values marked, repeating the last reading", held and not last,
+          "%s: held %r after %r" % (last[0], last[2][0], previous) if last else str(len(held)) + " held")
+
+if __name__ == '__main__':
+    os.environ['TZ'] = TZ
+    time.tzset()
+    with tempfile.TemporaryDirectory() as directory:
+        CheckDST(directory)
+    with tempfile.TemporaryDirectory() as directory:
+        CheckRPICT3V1(directory)
+    with tempfile.TemporaryDirectory() as directory:
+        CheckAdaptive(directory)
+
+    if Failures:
+        print(len(Failures), "checks failed")
+        sys.exit(1)
+    print("All checks passed")
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# Check of the sysfs sensor backend against a fake sysfs tree
+# Builds thermal zone, hwmon and IIO devices in a temporary directory and checks the
+# lookups and the scaling of every channel type, including processed (_input) against
+# (_raw + _offset) * _scale IIO channels and re-reading a channel after its value changes.
+# Exits with code 1 if any check fails.
+import os
+import sys
+import tempfile
+
+import sysfs
+
+Failures = []
+
+def Check(name, value, expected):
+    if abs(value - expected) > 1e-9 * max(abs(expected), 1.0):
+        Failures.append(name)
+        print("FAIL %-44s %r (expected %r)" % (name, value, expected))
+    else:
+        print("ok   %-44s %r" % (name, value))
+
+def Write(root, path, value):
+    path = os.path.join(root, path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(str(value) + '\n')
+
+def BuildTree(root):
+    Write(root, 'class/thermal/thermal_zone0/type', 'cpu-thermal')
+    Write(root, 'class/thermal/thermal_zone0/temp', 45678)
+    Write(root, 'class/thermal/thermal_zone1/type', 'gpu-thermal')
+    Write(root, 'class/thermal/thermal_zone1/temp', 51000)
+
+    Write(root, 'class/hwmon/hwmon0/name', 'cpu_thermal')
+    Write(root, 'class/hwmon/hwmon0/temp1_input', 47250)
+    Write(root, 'class/hwmon/hwmon1/name', 'rpi_volt')
+    Write(root, 'class/hwmon/hwmon1/in0_input', 1200)
+    Write(root, 'class/hwmon/hwmon1/power1_input', 2500000)
+    Write(root, 'class/hwmon/hwmon1/fan1_input', 1500)
+
+    # dht11: processed channels, with a _raw file that must not be used
+    Write(root, 'bus/iio/devices/iio:device0/name', 'dht11')
+    Write(root, 'bus/iio/devices/iio:device0/in_temp_input', 23400)
+    Write(root, 'bus/iio/devices/iio:device0/in_temp_raw', 999)
+    Write(root, 'bus/iio/devices/iio:device0/in_humidityrelative_input', 56700)
+
+    # mcp3008: raw channels with a scale shared by the channel type, one channel overriding it
+    Write(root, 'bus/iio/devices/iio:device1/name', 'mcp3008')
+    Write(root, 'bus/iio/devices/iio:device1/in_voltage0_raw', 512)
+    Write(root, 'bus/iio/devices/iio:device1/in_voltage1_raw', 100)
+    Write(root, 'bus/iio/devices/iio:device1/in_voltage_scale', 3.22265625)
+    Write(root, 'bus/iio/devices/iio:device1/in_voltage1_scale', 2.0)
+
+    # Raw channel with an offset: (raw + offset) * scale
+    Write(root, 'bus/iio/devices/iio:device2/name', 'tmp')
+    Write(root, 'bus/iio/devices/iio:device2/in_temp_raw', 1100)
+    Write(root, 'bus/iio/devices/iio:device2/in_temp_offset', -100)
+    Write(root, 'bus/iio/devices/iio:device2/in_temp_scale', 25)
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as root:
+        BuildTree(root)
+
+        Check("thermal zone 0 (C)", sysfs.ThermalZone(0, root).read(), 45.678)
+        Check("thermal zone 'gpu-thermal' (C)", sysfs.FindThermalZone('gpu-thermal', root).read(), 51.0)
+
+        Check("hwmon cpu_thermal temp1 (C)", sysfs.Hwmon('cpu_thermal', 'temp1_input', root).read(), 47.25)
+        Check("hwmon rpi_volt in0 (V)", sysfs.Hwmon('rpi_volt', 'in0_input', root).read(), 1.2)
+        Check("hwmon rpi_volt power1 (W)", sysfs.Hwmon('rpi_volt', 'power1_input', root).read(), 2.5)
+        Check("hwmon rpi_volt fan1 (RPM, unscaled)", sysfs.Hwmon('rpi_volt', 'fan1_input', root).read(), 1500)
+
+        Check("IIO dht11 in_temp (_input, C)", sysfs.IIOChannel('dht11', 'in_temp', root).read(), 23.4)
+        Check("IIO iio:device0 in_humidityrelative", sysfs.IIOChannel('iio:device0', 'in_humidityrelative', root).read(), 56.7)
+        Check("IIO mcp3008 in_voltage0 (shared scale, V)", sysfs.IIOChannel('mcp3008', 'in_voltage0', root).read(), 1.65)
+        Check("IIO mcp3008 in_voltage1 (own scale, V)", sysfs.IIOChannel('mcp3008', 'in_voltage1', root).read(), 0.2)
+        Check("IIO mcp3008 in_voltage0 raw counts", sysfs.IIOChannel('mcp3008', 'in_voltage0', root).read_raw(), 512)
+        Check("IIO dht11 in_temp raw channel (_raw)", sysfs.IIORawChannel('dht11', 'in_temp', root).read_raw(), 999)
+        Check("IIO tmp in_temp (_raw + _offset) * _scale", sysfs.IIOChannel('tmp', 'in_temp', root).read(), 25.0)
+
+        # A channel keeps its file open and must see new values
+        channel = sysfs.ThermalZone(0, root)
+        Write(root, 'class/thermal/thermal_zone0/temp', 50125)
+        Check("thermal zone 0 re-read (C)", channel.read(), 50.125)
+        channel.close()
+
+        for name, lookup in (("missing hwmon device", lambda: sysfs.Hwmon('none', 'temp1_input', root)),
+                             ("missing IIO device", lambda: sysfs.IIOChannel('none', 'in_temp', root))):
+            try:
+                lookup()
+                Failures.append(name)
+                print("FAIL %-44s no error" % name)
+            except IOError:
+                print("ok   %-44s IOError" % name)
+
+    if Failures:
+        print(len(Failures), "checks failed")
+        sys.exit(1)
+    print("All checks passed")
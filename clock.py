@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# Clocks for the logger main loop
+# Clock is the wall clock. VirtualClock only advances when the logger sleeps, so a replay
+# runs as fast as the pipeline allows and always produces the same output.
+import heapq
+import time
+
+class Clock(object):
+    def time(self):
+        return time.time()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def localtime(self, t=None):
+        return time.localtime(self.time() if t is None else t)
+
+class VirtualClock(Clock):
+    def __init__(self, Start):
+        self.Now = float(Start)
+        self._events = []
+        self._seq = 0
+
+    def time(self):
+        return self.Now
+
+    # Call Callback(Arg) when the clock passes time t
+    def schedule(self, t, Callback, Arg=None):
+        heapq.heappush(self._events, (t, self._seq, Callback, Arg, None))
+        self._seq = self._seq + 1
+
+    # Add a time-ordered stream of (t, Callback, Arg) events; only the next one is held
+    def add_source(self, Events):
+        Events = iter(Events)
+        for t, Callback, Arg in Events:
+            heapq.heappush(self._events, (t, self._seq, Callback, Arg, Events))
+            self._seq = self._seq + 1
+            break
+
+    # Advance the clock, firing the events passed on the way with the clock set to each
+    # event's own time (as a GPIO callback would see it)
+    def sleep(self, seconds):
+        end = self.Now + seconds
+        while self._events and self._events[0][0] <= end:
+            t, seq, Callback, Arg, Events = heapq.heappop(self._events)
+            self.Now = max(self.Now, t)
+            if Events is not None:
+                self.add_source(Events)
+            Callback(Arg)
+        self.Now = end
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# GPIO pulse counters
+# Every counted GPIO pin has its own counter in a CounterBank. The counter state is held in
+# arrays (one slot per counter) so a pulse only updates a few array elements, and dozens of
+# pins cost little more than one. Each counter counts one edge, ignores pulses within
+# Debounce seconds of the last one, scales its count (e.g. 0.001 kWh per impulse for a 1000
+# imp/kWh meter) and derives a rate from the time between its last two pulses. The daily
+# count resets on the first pulse of a new local day.
+from array import array
+
+# Edges
+FALLING = 'falling'
+RISING = 'rising'
+BOTH = 'both'
+
+# Counter presets, by the sensor type that configures a counter on its SensorLoc pin
+# Scale is the value of one pulse, RateScale the rate of one pulse per second (e.g. 3.6 kW
+# for 0.001 kWh per pulse, 60 RPM for one pulse per revolution), Offset the initial total
+PRESETS = {
+    # Electricity meter strobe (1000 imp/kWh), photo-detector output pulled up in the sensor module
+    # The pull-up is only needed when testing without the photo-sensor attached
+    'Electric_Whrs_import_today': {'Family': 'Electric', 'Scale': 0.001, 'RateScale': 3.6, 'Edge': FALLING,
+                                   'Debounce': 0.5, 'PullUp': True, 'Offset': 0.0},
+    # Solar PV generation meter strobe (1000 imp/kWh)
+    'SolarPV_Whrs_gen_today': {'Family': 'SolarPV', 'Scale': 0.001, 'RateScale': 3.6, 'Edge': FALLING,
+                               'Debounce': 0.5, 'PullUp': False, 'Offset': 56.0},
+    # Wheel sensor, active low, one pulse per revolution (Scale is metres per pulse)
+    'RPM': {'Family': 'RPM', 'Scale': 1.0, 'RateScale': 60.0, 'Edge': FALLING,
+            'Debounce': 0.5, 'PullUp': False, 'Offset': 0.0},
+    # Trigger inputs: negative / positive edge, count of triggers today (rate per minute)
+    'TrigN': {'Family': 'TrigN', 'Scale': 1.0, 'RateScale': 60.0, 'Edge': FALLING,
+              'Debounce': 0.5, 'PullUp': True, 'Offset': 0.0},
+    'TrigP': {'Family': 'TrigP', 'Scale': 1.0, 'RateScale': 60.0, 'Edge': RISING,
+              'Debounce': 0.5, 'PullUp': False, 'Offset': 0.0},
+}
+
+# All the sensor types read from a counter, by counter family
+TYPES = {
+    'Electric_Whrs_import_today': 'Electric', 'Electric_kWhrs_import_today': 'Electric',
+    'Electric_kWhrs_import_total': 'Electric', 'Electric_Whrs_import_T1': 'Electric', 'Electric_kW': 'Electric',
+    'SolarPV_Whrs_gen_today': 'SolarPV', 'SolarPV_kWhrs_gen_today': 'SolarPV',
+    'SolarPV_kWhrs_gen_total': 'SolarPV', 'SolarPV_W': 'SolarPV',
+    'RPM': 'RPM', 'Dist_m': 'RPM',
+    'TrigN': 'TrigN', 'TrigP': 'TrigP',
+}
+
+class CounterBank(object):
+    # Clock provides time() and localtime() (the wall clock or the replay clock); the T1
+    # count is the part of the daily count before T1Hour (local time)
+    def __init__(self, Clock, T1Hour=6):
+        self.Clock = Clock
+        self.T1Hour = T1Hour
+        self.Index = {}             # pin -> counter
+        self.Families = []
+        self.Edges = []
+        self.PullUps = []
+        self.Pins = array('i')
+        self.Scale = array('d')
+        self.RateScale = array('d')
+        self.Offset = array('d')
+        self.Debounce = array('d')
+        self.Total = array('q')     # pulses
+        self.Today = array('q')
+        self.T1 = array('q')
+        self.RateTotal = array('q') # Total when the rate was last read
+        self.LastTime = array('d')  # time of the last pulse
+        self.Interval = array('d')  # time between the last two pulses
+
+    def __len__(self):
+        return len(self.Pins)
+
+    # Add a counter on Pin, returns its index
+    def add(self, Pin, Family, Scale=1.0, RateScale=60.0, Edge=FALLING, Debounce=0.5, PullUp=False, Offset=0.0):
+        if Pin in self.Index:
+            raise ValueError("Pin " + str(Pin) + " is already counted")
+        if Edge not in (FALLING, RISING, BOTH):
+            raise ValueError("Unknown edge " + str(Edge))
+        x = len(self.Pins)
+        self.Index[Pin] = x
+        self.Families.append(Family)
+        self.Edges.append(Edge)
+        self.PullUps.append(PullUp)
+        self.Pins.append(Pin)
+        self.Scale.append(Scale)
+        self.RateScale.append(RateScale)
+        self.Offset.append(Offset)
+        self.Debounce.append(Debounce)
+        for counts in (self.Total, self.Today, self.T1, self.RateTotal):
+            counts.append(0)
+        self.LastTime.append(0.0)
+        self.Interval.append(0.0)
+        return x
+
+    # Counter of a sensor: the counter on its own pin (Loc) if that is of the right family,
+    # otherwise the first counter of the family, or None
+    def find(self, Loc, Family):
+        try:
+            x = self.Index.get(int(Loc, 10))
+        except (TypeError, ValueError):
+            x = None
+        if x is not None and self.Families[x] == Family:
+            return x
+        if Family in self.Families:
+            return self.Families.index(Family)
+        return None
+
+    # GPIO event callback (channel is the pin). Returns True if the pulse was counted
+    def pulse(self, channel):
+        x = self.Index.get(channel)
+        if x is None:
+            return False
+        TimeNow = self.Clock.time()
+        last = self.LastTime[x]
+        if last > 0:
+            if TimeNow - last < self.Debounce[x]:
+                return False
+            # Compare local dates so that the DST change back an hour doesn't reset the count
+            if self.Clock.localtime(TimeNow)[0:3] != self.Clock.localtime(last)[0:3]:
+                self.Today[x] = 0
+                self.T1[x] = 0
+            self.Interval[x] = TimeNow - last
+        self.Total[x] = self.Total[x] + 1
+        self.Today[x] = self.Today[x] + 1
+        if self.Clock.localtime(TimeNow).tm_hour < self.T1Hour:
+            self.T1[x] = self.Today[x]
+        self.LastTime[x] = TimeNow
+        return True
+
+    def today(self, x):
+        return self.Today[x] * self.Scale[x]
+
+    def t1(self, x):
+        return self.T1[x] * self.Scale[x]
+
+    def total(self, x):
+        return self.Offset[x] + self.Total[x] * self.Scale[x]
+
+    def reset_today(self, x):
+        self.Today[x] = 0
+        self.T1[x] = 0
+
+    # Rate from the time between the last two pulses, or 0 if there hasn't been a pulse
+    # since the rate was last read
+    def rate(self, x):
+        if self.Total[x] == self.RateTotal[x] or self.Interval[x] <= 0:
+            self.RateTotal[x] = self.Total[x]
+            return 0.0
+        self.RateTotal[x] = self.Total[x]
+        return self.RateScale[x] / self.Interval[x]
+
+    def describe(self, x):
+        return (self.Families[x] + " counter on pin " + str(self.Pins[x]) + " (" + self.Edges[x] + " edge, "
+                + str(self.Scale[x]) + " per pulse, " + str(self.Debounce[x]) + "s debounce)")
@@ -1,13 +1,31 @@
 #!/usr/bin/env python
 # General-purpose library for communicating with a Domoticz Server
-import urllib.request, urllib.error
+import urllib.request, urllib.error, urllib.parse
 
 IP_Address = '192.168.1.32'
 port = '8085'
 
+# Function to build the request path for a device update...
+# Date is optional and is appended to the svalue as "VALUE;DATE". Domoticz uses this form
+# to insert history for devices that support it (e.g. managed counters), where DATE is
+# either '%Y-%m-%d' (day history) or '%Y-%m-%d %H:%M:%S' (short log history)
+def UpdatePath(idx, SensorVal, Date=None):
+    svalue = str(SensorVal)
+    if Date:
+        svalue = svalue + ';' + Date
+    return '/json.htm?type=command&param=udevice&nvalue=0&idx='+idx+'&svalue='+urllib.parse.quote(svalue, safe=';:.-')
+
 # Function to log data to Domoticz server...
-def LogToDomoticz(idx, SensorVal):
-    url = 'http://' + IP_Address + ':' + port + '/json.htm?type=command&param=udevice&nvalue=0&idx='+idx+'&svalue='+str(SensorVal)
+def LogToDomoticz(idx, SensorVal, Date=None):
+    return Request(UpdatePath(idx, SensorVal, Date))
+
+# Function to add a message to the Domoticz log...
+def LogMessage(message):
+    return Request('/json.htm?type=command&param=addlogmessage&message=' + urllib.parse.quote(message))
+
+# Function to send a request to the Domoticz server...
+def Request(path):
+    url = 'http://' + IP_Address + ':' + port + path
 
     try:
         request = urllib.request.Request(url)
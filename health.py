@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# Per-sensor health tracking and circuit breakers
+# A sensor that fails Threshold reads in a row is taken out of the measurement cycle (the
+# breaker opens) and only probed again after a backoff that doubles, up to MaxBackoff, with
+# every failed probe. A successful read closes the breaker. While a sensor is failing its
+# last good value is reported for up to StaleAge seconds, then NaN, with a quality flag.
+import json
+import math
+import os
+import time
+
+# Quality flags
+GOOD = 'good'       # read this cycle
+STALE = 'stale'     # last good value, sensor failing or skipped
+BAD = 'bad'         # no recent good value (NaN)
+
+# Breaker states
+CLOSED = 'closed'   # read every cycle
+OPEN = 'open'       # skipped until the backoff expires
+PROBING = 'probing' # backoff expired, next read decides
+
+class SensorHealth(object):
+    def __init__(self, Name, Threshold=3, Backoff=60, MaxBackoff=3600, StaleAge=600):
+        self.Name = Name
+        self.Threshold = Threshold
+        self.BaseBackoff = float(Backoff)
+        self.MaxBackoff = float(MaxBackoff)
+        self.StaleAge = float(StaleAge)
+        self.State = CLOSED
+        self.Backoff = self.BaseBackoff
+        self.RetryTime = 0.0
+        self.Failures = 0           # consecutive
+        self.TotalFailures = 0
+        self.Reads = 0
+        self.Skipped = 0
+        self.LastGood = float('nan')
+        self.LastGoodTime = 0.0
+        self.LastError = ''
+        self.ReadTime = 0.0         # seconds spent in the last read
+        self.MaxReadTime = 0.0
+        self.Quality = BAD
+
+    # Check if the sensor should be read now
+    def allow(self, TimeNow):
+        if self.State == OPEN:
+            if TimeNow < self.RetryTime:
+                self.Skipped = self.Skipped + 1
+                return False
+            self.State = PROBING
+        return True
+
+    def success(self, TimeNow, Value):
+        self.Reads = self.Reads + 1
+        self.State = CLOSED
+        self.Backoff = self.BaseBackoff
+        self.Failures = 0
+        self.LastGood = Value
+        self.LastGoodTime = TimeNow
+        self.Quality = GOOD
+
+    def failure(self, TimeNow, Error):
+        self.Reads = self.Reads + 1
+        self.Failures = self.Failures + 1
+        self.TotalFailures = self.TotalFailures + 1
+        self.LastError = str(Error)
+        if self.State == PROBING:
+            self.Backoff = min(self.Backoff * 2, self.MaxBackoff)
+            self.State = OPEN
+            self.RetryTime = TimeNow + self.Backoff
+        elif self.Failures >= self.Threshold:
+            self.State = OPEN
+            self.RetryTime = TimeNow + self.Backoff
+
+    # Value to report for a failed or skipped sensor: the last good value while it is
+    # recent enough, otherwise NaN
+    def fallback(self, TimeNow):
+        if self.LastGoodTime > 0 and TimeNow - self.LastGoodTime <= self.StaleAge:
+            self.Quality = STALE
+            return self.LastGood
+        self.Quality = BAD
+        return float('nan')
+
+    def timed(self, ReadTime):
+        self.ReadTime = ReadTime
+        self.MaxReadTime = max(self.MaxReadTime, ReadTime)
+
+    def snapshot(self):
+        return {'name': self.Name, 'state': self.State, 'quality': self.Quality,
+                'failures': self.Failures, 'total_failures': self.TotalFailures,
+                'reads': self.Reads, 'skipped': self.Skipped,
+                'last_good': None if math.isnan(self.LastGood) else self.LastGood,
+                'last_good_time': self.LastGoodTime or None,
+                'retry_time': self.RetryTime if self.State == OPEN else None,
+                'last_error': self.LastError,
+                'read_time': round(self.ReadTime, 6), 'max_read_time': round(self.MaxReadTime, 6)}
+
+# Read Reader() through the breaker of Sensor, timing the read. Exceptions and NaN readings
+# count as failures. Returns the reading, or None if the read failed.
+def Read(Sensor, TimeNow, Reader):
+    start = time.perf_counter()
+    try:
+        value = Reader()
+        if math.isnan(value):
+            raise ValueError("NaN reading")
+    except Exception as e:
+        Sensor.failure(TimeNow, e)
+        value = None
+    Sensor.timed(time.perf_counter() - start)
+    return value
+
+# Write the health of all sensors (and the latest memory report, if any) as a JSON
+# snapshot (replaced atomically)
+def WriteSnapshot(filename, Sensors, TimeNow, Memory=None):
+    snapshot = {'time': TimeNow, 'sensors': [s.snapshot() for s in Sensors]}
+    if Memory is not None:
+        snapshot['memory'] = Memory
+    tmp = filename + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(snapshot, f, indent=1)
+    os.replace(tmp, filename)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# Stream reader for logged MultiLogger history
+# Parses the ';'-separated data lines written to the logs/ files one line at a time, so
+# that long histories can be processed without loading whole files into memory
+import calendar
+import glob
+import os
+import re
+import time
+
+# Data lines are written by MultiLogger.LogData() as:
+#   <asctime> INFO YYYY-mm-dd HH:MM:SS;<Reading>;<value>;<value>;...;
+# where the timestamp is UTC. The sensor title line is written once at start-up as:
+#   <asctime> INFO <title>;<title>;...;
+# A failing sensor's last good value (quality stale, see health.py) is logged with StaleMark
+# appended, e.g. "21.5?", and a sensor with no recent good value as "nan". In adaptive mode
+# a sensor not read since the last log point is logged with its last reading and HeldMark,
+# e.g. "21.5=". All are read back as NaN - they are not new measurements - except that held
+# readings can be read back as their value (Held=True, e.g. for a replay trace).
+DataLine = re.compile(r'(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d);(\d+);(.*);\s*$')
+LogTimeFormat = "%Y-%m-%d %H:%M:%S"
+StaleMark = '?'
+HeldMark = '='
+
+# Split a log line into its message, dropping the "<date> <time> <level> " prefix
+def LogMessage(line):
+    fields = line.split(' ', 3)
+    if len(fields) < 4:
+        return ''
+    return fields[3].rstrip('\r\n')
+
+# Convert a logged (UTC) timestamp to seconds since the epoch
+def LogTimeToEpoch(logTime):
+    return calendar.timegm(time.strptime(logTime, LogTimeFormat))
+
+def ParseValue(value, Held=False):
+    if value.endswith(StaleMark):
+        return float('nan')
+    if value.endswith(HeldMark):
+        if not Held:
+            return float('nan')
+        value = value[:-1]
+    try:
+        return float(value)
+    except ValueError:
+        return float('nan')
+
+# Parse one line of a log file
+# Returns ('data', (TimeStamp, Reading, Values)), ('title', Titles) or (None, None)
+def ParseLine(line, Held=False):
+    message = LogMessage(line)
+    match = DataLine.match(message)
+    if match:
+        values = [ParseValue(v, Held) for v in match.group(3).split(';')]
+        return 'data', (LogTimeToEpoch(match.group(1)), int(match.group(2)), values)
+    if message.endswith(';'):
+        return 'title', message[:-1].split(';')
+    return None, None
+
+# Scan a log file up to Offset for the most recent sensor title line
+def TitlesBefore(filename, Offset):
+    titles = []
+    position = 0
+    with open(filename, 'rb') as f:
+        for raw in f:
+            position = position + len(raw)
+            if position > Offset:
+                break
+            kind, result = ParseLine(raw.decode('utf-8', 'replace'))
+            if kind == 'title':
+                titles = result
+    return titles
+
+# Stream data records from a text log file, starting at byte Offset
+# Yields (Position, Titles, TimeStamp, Values) where Position is the byte offset just past
+# the record and can be passed back in as Offset to resume
+def ReadLog(filename, Offset=0, Held=False):
+    titles = TitlesBefore(filename, Offset) if Offset > 0 else []
+    position = Offset
+    with open(filename, 'rb') as f:
+        f.seek(Offset)
+        for raw in f:
+            position = position + len(raw)
+            kind, result = ParseLine(raw.decode('utf-8', 'replace'), Held)
+            if kind == 'data':
+                yield position, titles, result[0], result[2]
+            elif kind == 'title':
+                titles = result
+
+# Size of a history file, used for progress reporting
+def SourceSize(filename):
+    return os.path.getsize(filename)
+
+# Open any supported history file (text log or compressed segment) for streaming
+# Segment files store held readings as NaN, so Held only applies to text logs
+def ReadHistory(filename, Offset=0, Held=False):
+    if filename.endswith('.seg'):
+        # segment.py uses this module, so import it here rather than at the top
+        import segment
+        return segment.ReadSegment(filename, Offset)
+    return ReadLog(filename, Offset, Held)
+
+# Default set of history files, oldest first
+def HistoryFiles(Directory='logs'):
+    files = glob.glob(os.path.join(Directory, '*.log')) + glob.glob(os.path.join(Directory, '*.seg'))
+    files.sort(key=os.path.getmtime)
+    return files
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# Memory self-reporting
+# RSS comes from /proc/self/statm (one read, no parsing of /proc/self/status), the peak from
+# getrusage. If tracemalloc is tracing, the Python heap in use and its peak are reported too.
+# A full garbage collection runs first, so the figures don't depend on when the last one ran.
+# Reports can also be appended to a log, one JSON line per report, to follow memory use
+# over a long run (soak.py reads it back).
+import gc
+import json
+import os
+import resource
+import tracemalloc
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+# Resident set size in kB
+def RSS():
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            return int(f.read().split()[1]) * PAGE_SIZE // 1024
+    except (OSError, IndexError, ValueError):
+        return PeakRSS()
+
+# Peak resident set size in kB
+def PeakRSS():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def Usage():
+    gc.collect()
+    rss = RSS()
+    usage = {'rss_kb': rss, 'peak_rss_kb': max(PeakRSS(), rss), 'gc_objects': len(gc.get_objects())}
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        usage['traced_kb'] = current // 1024
+        usage['traced_peak_kb'] = peak // 1024
+    return usage
+
+def Describe(usage):
+    text = "RSS " + str(usage['rss_kb']) + " kB (peak " + str(usage['peak_rss_kb']) + " kB), " + str(usage['gc_objects']) + " objects"
+    if 'traced_kb' in usage:
+        text = text + ", Python heap " + str(usage['traced_kb']) + " kB (peak " + str(usage['traced_peak_kb']) + " kB)"
+    return text
+
+# Append a report, with the time it was taken, to a memory log
+def Append(filename, TimeNow, usage):
+    with open(filename, 'a') as f:
+        f.write(json.dumps(dict(usage, time=TimeNow)) + '\n')
+
+# Stream the reports of a memory log
+def ReadLog(filename):
+    with open(filename, 'r') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
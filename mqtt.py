@@ -0,0 +1,383 @@
+#!/usr/bin/env python
+# General-purpose library for publishing data to an MQTT broker (MQTT 3.1.1)
+# Keeps one persistent connection, pipelines QoS1 publishes with a bounded number of
+# unacknowledged (in-flight) messages and spools messages to a local file while the
+# broker is unreachable, replaying them once the connection is restored.
+# Publishing never waits: messages that don't fit in the in-flight window are spooled, and
+# messages left unacknowledged for Timeout seconds are spooled and the connection dropped.
+# The spool file is only appended to: replay moves a read offset along it (saved next to it
+# in <SpoolFile>.offset) and the file is only rewritten once it has been replayed.
+import json
+import os
+import socket
+import struct
+import threading
+import time
+
+IP_Address = '192.168.1.32'
+port = '1883'
+
+# Control packet types
+CONNECT = 1
+CONNACK = 2
+PUBLISH = 3
+PUBACK = 4
+PINGREQ = 12
+PINGRESP = 13
+DISCONNECT = 14
+
+PINGREQ_PACKET = b'\xc0\x00'
+PINGRESP_PACKET = b'\xd0\x00'
+DISCONNECT_PACKET = b'\xe0\x00'
+
+# Packet encoding helpers (shared with the stub broker)
+def EncodeLength(length):
+    encoded = bytearray()
+    while True:
+        digit = length % 128
+        length = length // 128
+        if length > 0:
+            digit = digit | 0x80
+        encoded.append(digit)
+        if length == 0:
+            return bytes(encoded)
+
+def EncodeString(string):
+    data = string.encode('utf-8')
+    return struct.pack('!H', len(data)) + data
+
+def Packet(header, body):
+    return bytes([header]) + EncodeLength(len(body)) + body
+
+def ConnectPacket(ClientID, KeepAlive, CleanSession=False):
+    flags = 0x02 if CleanSession else 0x00
+    body = EncodeString('MQTT') + struct.pack('!BBH', 4, flags, KeepAlive) + EncodeString(ClientID)
+    return Packet(CONNECT << 4, body)
+
+def PublishPacket(topic, payload, PacketID=0, qos=1, retain=False, dup=False):
+    header = (PUBLISH << 4) | (qos << 1) | (0x08 if dup else 0) | (0x01 if retain else 0)
+    body = EncodeString(topic)
+    if qos > 0:
+        body = body + struct.pack('!H', PacketID)
+    return Packet(header, body + payload)
+
+def PubackPacket(PacketID):
+    return struct.pack('!BBH', PUBACK << 4, 2, PacketID)
+
+def ReadExact(sock, length):
+    data = b''
+    while len(data) < length:
+        chunk = sock.recv(length - len(data))
+        if not chunk:
+            raise ConnectionError("Connection closed")
+        data = data + chunk
+    return data
+
+# Read one control packet, returning (header byte, body)
+def ReadPacket(sock):
+    header = ReadExact(sock, 1)[0]
+    length = 0
+    multiplier = 1
+    while True:
+        digit = ReadExact(sock, 1)[0]
+        length = length + (digit & 0x7f) * multiplier
+        multiplier = multiplier * 128
+        if not digit & 0x80:
+            break
+    return header, ReadExact(sock, length) if length else b''
+
+# Decode the body of a PUBLISH packet into (topic, PacketID, payload)
+def DecodePublish(header, body):
+    topiclen = struct.unpack_from('!H', body, 0)[0]
+    topic = body[2:2 + topiclen].decode('utf-8')
+    offset = 2 + topiclen
+    PacketID = 0
+    if (header >> 1) & 0x03:
+        PacketID = struct.unpack_from('!H', body, offset)[0]
+        offset = offset + 2
+    return topic, PacketID, body[offset:]
+
+class MQTTClient(object):
+    def __init__(self, ClientID, Host=None, Port=None, KeepAlive=60, MaxInflight=20,
+                 SpoolFile=None, SpoolLimit=10000, Timeout=10):
+        self.ClientID = ClientID
+        self.Host = Host or IP_Address
+        self.Port = int(Port or port)
+        self.KeepAlive = KeepAlive
+        self.MaxInflight = MaxInflight
+        self.SpoolFile = SpoolFile
+        self.SpoolLimit = SpoolLimit
+        self.Timeout = Timeout
+
+        self.Connected = False
+        self.Published = 0
+        self.Spooled = 0
+        self.Dropped = 0
+
+        self._sock = None
+        self._cond = threading.Condition()
+        self._sendlock = threading.Lock()   # socket writes, so the state lock isn't held during I/O
+        self._inflight = {}                 # PacketID -> (topic, payload, retain, time sent, spool position)
+        self._nextid = 1
+        self._retry = 0
+        self._backoff = 1
+        self._spoolread = (0, 0)            # (offset, line) of the next spooled message to replay
+        self._spoollines = 0                # lines in the spool file, counted from the same line
+        self._spoolcount = self._loadSpool()
+
+    # (Re)connect to the broker, resending unacknowledged and spooled messages
+    def connect(self):
+        if time.time() < self._retry:
+            return False
+        try:
+            sock = socket.create_connection((self.Host, self.Port), timeout=self.Timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.sendall(ConnectPacket(self.ClientID, self.KeepAlive))
+            header, body = ReadPacket(sock)
+            if header >> 4 != CONNACK or len(body) < 2 or body[1] != 0:
+                raise ConnectionError("Connection refused")
+        except (OSError, ConnectionError):
+            self._retry = time.time() + self._backoff
+            self._backoff = min(self._backoff * 2, 300)
+            return False
+
+        sock.settimeout(self.KeepAlive / 2.0)
+        self._backoff = 1
+        now = time.time()
+        with self._cond:
+            self._sock = sock
+            self.Connected = True
+            resend = []
+            for i, (t, p, r, sent, position) in list(self._inflight.items()):
+                self._inflight[i] = (t, p, r, now, position)
+                resend.append(PublishPacket(t, p, i, 1, r, True))
+        threading.Thread(target=self._reader, args=(sock,), daemon=True).start()
+        if resend and not self._send(sock, resend):
+            return False
+        self._replaySpool()
+        return self.Connected
+
+    # Receive acknowledgements and keep the connection alive
+    def _reader(self, sock):
+        try:
+            while True:
+                try:
+                    header, body = ReadPacket(sock)
+                except socket.timeout:
+                    with self._sendlock:
+                        sock.sendall(PINGREQ_PACKET)
+                    continue
+                if header >> 4 == PUBACK:
+                    PacketID = struct.unpack('!H', body)[0]
+                    with self._cond:
+                        self._inflight.pop(PacketID, None)
+                        self._cond.notify_all()
+        except (OSError, ConnectionError):
+            self._disconnected(sock)
+
+    def _disconnected(self, sock):
+        with self._cond:
+            if self._sock is sock:
+                self._sock = None
+                self.Connected = False
+            self._cond.notify_all()
+        try:
+            sock.close()
+        except OSError:
+            pass
+
+    # Publish a list of (topic, payload) messages as QoS1, keeping at most MaxInflight
+    # unacknowledged. Packets are written in batches rather than one system call per message.
+    def publish_many(self, messages, retain=True):
+        if not self.Connected:
+            self.connect()
+        elif self._spoolcount or self._spoolread[0]:
+            self._replaySpool()
+        self._publish([(topic, payload, retain, None) for topic, payload in messages])
+
+    # Messages are (topic, payload, retain, spool position), the position None unless the
+    # message is replayed from the spool. New messages are spooled behind any already spooled
+    # ones (unless Ordered is off, for the replay itself) so the retained values reach the
+    # broker in order; a replayed message that can't be sent goes back to the head of the spool.
+    def _publish(self, messages, Ordered=True):
+        pending = []
+        with self._cond:
+            sock = self._expire(time.time())
+            for topic, payload, retain, position in messages:
+                if not isinstance(payload, bytes):
+                    payload = str(payload).encode('utf-8')
+                # Never wait for the window: a full window means the broker is behind
+                if not self.Connected or len(self._inflight) >= self.MaxInflight or (Ordered and self._spoolcount):
+                    self._unsent(topic, payload, retain, position)
+                    continue
+                PacketID = self._nextid
+                self._nextid = self._nextid % 65535 + 1
+                self._inflight[PacketID] = (topic, payload, retain, time.time(), position)
+                pending.append(PublishPacket(topic, payload, PacketID, 1, retain))
+                self.Published = self.Published + 1
+            current = self._sock
+        if sock is not None:
+            self._close(sock)
+        if pending:
+            self._send(current, pending)
+
+    # Spool the messages unacknowledged for more than Timeout seconds and drop the connection
+    # (the broker has stopped acknowledging); the next publish reconnects after a backoff.
+    # Called with the lock held, returns the socket to close (if any)
+    def _expire(self, TimeNow):
+        expired = [i for i, (t, p, r, sent, position) in self._inflight.items() if TimeNow - sent > self.Timeout]
+        if not expired:
+            return None
+        for PacketID in expired:
+            topic, payload, retain, sent, position = self._inflight.pop(PacketID)
+            self._unsent(topic, payload, retain, position)
+        sock = self._sock
+        self._sock = None
+        self.Connected = False
+        self._retry = TimeNow + self._backoff
+        self._backoff = min(self._backoff * 2, 300)
+        self._cond.notify_all()
+        return sock
+
+    def publish(self, topic, payload, retain=True):
+        self.publish_many([(topic, payload)], retain)
+
+    # Write packets to the socket (without the state lock held), returns False on error
+    def _send(self, sock, packets):
+        if sock is None:
+            return False
+        try:
+            with self._sendlock:
+                sock.sendall(b''.join(packets))
+            return True
+        except OSError:
+            self._disconnected(sock)
+            return False
+
+    def _close(self, sock):
+        try:
+            sock.close()
+        except OSError:
+            pass
+
+    # Wait until every in-flight message has been acknowledged
+    def flush(self, timeout=None):
+        deadline = time.time() + (self.Timeout if timeout is None else timeout)
+        with self._cond:
+            while self._inflight and self.Connected and time.time() < deadline:
+                self._cond.wait(max(deadline - time.time(), 0))
+            return not self._inflight
+
+    def close(self):
+        self.flush()
+        with self._cond:
+            sock = self._sock
+            self._sock = None
+            self.Connected = False
+            # Anything still unacknowledged is kept for the next run
+            for topic, payload, retain, sent, position in self._inflight.values():
+                self._unsent(topic, payload, retain, position)
+            self._inflight = {}
+            self._saveOffset()
+        if sock is not None:
+            try:
+                with self._sendlock:
+                    sock.sendall(DISCONNECT_PACKET)
+            except OSError:
+                pass
+            sock.close()
+
+    # Local spool for messages that could not be sent
+    # All spool access is made with the lock held. Returns the number of messages to replay.
+    def _loadSpool(self):
+        if self.SpoolFile is None or not os.path.exists(self.SpoolFile):
+            return 0
+        offset = 0
+        try:
+            with open(self.SpoolFile + '.offset', 'r') as f:
+                offset = int(f.read())
+        except (OSError, ValueError):
+            pass
+        with open(self.SpoolFile, 'rb') as f:
+            f.seek(offset)
+            self._spoolread = (offset, 0)
+            self._spoollines = sum(1 for line in f)
+        return self._spoollines
+
+    def _spool(self, topic, payload, retain):
+        if self.SpoolFile is None or self._spoolcount >= self.SpoolLimit:
+            self.Dropped = self.Dropped + 1
+            return
+        with open(self.SpoolFile, 'a') as f:
+            f.write(json.dumps([topic, payload.decode('utf-8'), retain]) + '\n')
+        self._spoollines = self._spoollines + 1
+        self._spoolcount = self._spoollines - self._spoolread[1]
+        self.Spooled = self.Spooled + 1
+
+    # A message that could not be sent: a new one is spooled, a replayed one goes back to
+    # the head of the spool (the messages replayed after it are replayed again; QoS1 allows
+    # duplicates)
+    def _unsent(self, topic, payload, retain, position):
+        if position is None:
+            self._spool(topic, payload, retain)
+        elif position < self._spoolread:
+            self._spoolread = position
+            self._spoolcount = self._spoollines - position[1]
+
+    # Save the offset of the oldest spooled message not yet acknowledged
+    def _saveOffset(self):
+        if self.SpoolFile is None or not os.path.exists(self.SpoolFile):
+            return
+        positions = [position for t, p, r, sent, position in self._inflight.values() if position is not None]
+        with open(self.SpoolFile + '.offset', 'w') as f:
+            f.write(str(min(positions + [self._spoolread])[0]))
+
+    # Start a new spool file once every spooled message has been acknowledged, or once
+    # SpoolLimit replayed messages are in front of the rest, so the file stays bounded
+    def _compactSpool(self):
+        if any(position is not None for t, p, r, sent, position in self._inflight.values()):
+            return
+        if self._spoolcount == 0:
+            for filename in (self.SpoolFile, self.SpoolFile + '.offset'):
+                if os.path.exists(filename):
+                    os.remove(filename)
+        elif self._spoolread[1] >= self.SpoolLimit:
+            # The offset goes first: if interrupted, the old file is replayed again from the start
+            if os.path.exists(self.SpoolFile + '.offset'):
+                os.remove(self.SpoolFile + '.offset')
+            compactname = self.SpoolFile + '.compact'
+            with open(self.SpoolFile, 'rb') as f, open(compactname, 'wb') as out:
+                f.seek(self._spoolread[0])
+                out.write(f.read())
+            os.replace(compactname, self.SpoolFile)
+        else:
+            return
+        self._spoolread = (0, 0)
+        self._spoollines = self._spoolcount
+
+    # Publish as many spooled messages as fit in the in-flight window, oldest first; the
+    # rest stay spooled for the next publish
+    def _replaySpool(self):
+        if self.SpoolFile is None:
+            return
+        messages = []
+        with self._cond:
+            self._compactSpool()
+            room = self.MaxInflight - len(self._inflight) if self.Connected else 0
+            if room <= 0 or not self._spoolcount:
+                return
+            self._saveOffset()
+            offset, line = self._spoolread
+            with open(self.SpoolFile, 'rb') as f:
+                f.seek(offset)
+                while len(messages) < room:
+                    raw = f.readline()
+                    if not raw:
+                        break
+                    topic, payload, retain = json.loads(raw.decode('utf-8'))
+                    messages.append((topic, payload, retain, (offset, line)))
+                    offset = offset + len(raw)
+                    line = line + 1
+            self._spoolread = (offset, line)
+            self._spoolcount = self._spoollines - line
+        self._publish(messages, False)
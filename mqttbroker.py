@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# Minimal stub MQTT broker for testing and benchmarking the MQTT output backend
+# Accepts connections, acknowledges QoS1 publishes, answers pings and keeps the retained
+# last value of every topic. It does not support subscriptions. With Ack off it never
+# acknowledges publishes, like a broker that has stopped working.
+import argparse
+import socket
+import socketserver
+import threading
+
+import mqtt
+
+class BrokerState(object):
+    def __init__(self, Ack=True):
+        self.Ack = Ack
+        self.Lock = threading.Lock()
+        self.Received = 0
+        self.Retained = {}
+
+class BrokerHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        state = self.server.State
+        sock = self.request
+        # Acknowledgements are small writes; don't let Nagle hold them back behind the client's delayed ACK
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            while True:
+                header, body = mqtt.ReadPacket(sock)
+                kind = header >> 4
+                if kind == mqtt.CONNECT:
+                    sock.sendall(b'\x20\x02\x00\x00')
+                elif kind == mqtt.PUBLISH:
+                    topic, PacketID, payload = mqtt.DecodePublish(header, body)
+                    with state.Lock:
+                        state.Received = state.Received + 1
+                        if header & 0x01:
+                            state.Retained[topic] = payload
+                    if PacketID and state.Ack:
+                        sock.sendall(mqtt.PubackPacket(PacketID))
+                elif kind == mqtt.PINGREQ:
+                    sock.sendall(mqtt.PINGRESP_PACKET)
+                elif kind == mqtt.DISCONNECT:
+                    break
+        except (OSError, ConnectionError):
+            pass
+
+class StubBroker(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, Address='127.0.0.1', Port=1883, Ack=True):
+        socketserver.ThreadingTCPServer.__init__(self, (Address, Port), BrokerHandler)
+        self.State = BrokerState(Ack)
+
+    # Start serving on a background thread
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self.server_address[1]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stub MQTT broker')
+    parser.add_argument('-Address', action='store', dest='Address', default='127.0.0.1',
+                        help='Address to listen on')
+    parser.add_argument('-Port', action='store', dest='Port', default=1883,
+                        help='Port to listen on')
+    parser.add_argument('-NoAck', action='store_true', dest='NoAck',
+                        help='Never acknowledge publishes (test a stalled broker)')
+    arguments = parser.parse_args()
+
+    broker = StubBroker(arguments.Address, int(arguments.Port), not arguments.NoAck)
+    print("Stub MQTT broker listening on", broker.server_address)
+    try:
+        broker.serve_forever()
+    except KeyboardInterrupt:
+        print("Received", broker.State.Received, "messages,", len(broker.State.Retained), "retained topics")
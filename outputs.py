@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# Output backends for logged sensor data
+# Each backend takes one set of readings at a time through Log(SensorVal, Updated, Stale),
+# where Updated is an optional bit mask of the sensors that have new readings to send and
+# Stale the bit mask of the sensors reporting their last good reading (see health.py).
+# Only good readings are sent as values: stale and NaN (bad) readings never are. Instead
+# each backend reports a change in a sensor's quality (good / stale / bad).
+# The backends used are selected by sensors.OutputBackends.
+import math
+
+import domoticz
+import health
+import mqtt
+import sensors
+
+def Quality(SensorVal, Stale, SensorID):
+    if math.isnan(SensorVal[SensorID]):
+        return health.BAD
+    if (Stale >> SensorID) & 1:
+        return health.STALE
+    return health.GOOD
+
+def Selected(Updated, SensorVal, SensorID, Stale=0):
+    return (Updated is None or (Updated >> SensorID) & 1) and Quality(SensorVal, Stale, SensorID) == health.GOOD
+
+# One HTTP request per sensor to a Domoticz server
+# Domoticz devices have no quality field, so a change of quality is written to the Domoticz
+# log; a device that stops getting values is also shown as timed out by Domoticz itself
+class DomoticzOutput(object):
+    def __init__(self):
+        self.Quality = [health.GOOD] * sensors.ActiveSensors
+
+    def Log(self, SensorVal, Updated=None, Stale=0):
+        for x in range(0, sensors.ActiveSensors):
+            if sensors.DomoticzIDX[x] == 'x':
+                continue
+            quality = Quality(SensorVal, Stale, x)
+            if quality != self.Quality[x]:
+                self.Quality[x] = quality
+                domoticz.LogMessage(sensors.ModuleName + ' ' + sensors.SensorName[x] + ' (idx ' + sensors.DomoticzIDX[x] + '): ' + quality)
+            if Selected(Updated, SensorVal, x, Stale):
+                domoticz.LogToDomoticz(sensors.DomoticzIDX[x], SensorVal[x])
+
+    def Close(self):
+        pass
+
+# One retained QoS1 message per sensor, all sensors published as a single batch over a
+# persistent connection. Messages are spooled to disk while the broker is unreachable.
+# The quality of each sensor is published (retained) to <topic>/quality when it changes
+# and with the first readings, so a subscriber can tell that a retained value is stale.
+class MQTTOutput(object):
+    def __init__(self):
+        self.Client = mqtt.MQTTClient(sensors.ModuleName + '-' + sensors.ModuleLoc, SpoolFile='logs/mqtt.spool')
+        self.Quality = [None] * sensors.ActiveSensors
+
+    def Log(self, SensorVal, Updated=None, Stale=0):
+        messages = []
+        for x in range(0, sensors.ActiveSensors):
+            if sensors.MQTT_Topic[x] == 'x':
+                continue
+            if Selected(Updated, SensorVal, x, Stale):
+                messages.append((sensors.MQTT_Topic[x], SensorVal[x]))
+            quality = Quality(SensorVal, Stale, x)
+            if quality != self.Quality[x]:
+                self.Quality[x] = quality
+                messages.append((sensors.MQTT_Topic[x] + '/quality', quality))
+        self.Client.publish_many(messages, retain=True)
+
+    def Close(self):
+        self.Client.close()
+
+Backends = {
+    'domoticz': DomoticzOutput,
+    'mqtt': MQTTOutput,
+}
+
+def Open(Names):
+    return [Backends[Name]() for Name in Names]
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# Replay sources for running the logger on a virtual clock (MultiLogger -Replay)
+# A trace is any history file (text log or segment file): at each virtual time a sensor
+# reads the latest traced value of the same title (a held reading in an adaptive text log
+# counts as traced; a failed or stale one replays as a failed read). Pulse files list GPIO
+# pulse times as "<time>;<pin>" lines, where <time> is epoch seconds or
+# "YYYY-mm-dd HH:MM:SS[.fff]" (UTC).
+# RPICT3V1 frame files list the frames received as "<time>;<frame>" lines.
+# All are streamed, so long replays run in bounded memory.
+import argparse
+import math
+import random
+import time
+
+import logreader
+
+class Trace(object):
+    def __init__(self, filename, Titles):
+        self.Titles = list(Titles)
+        self.Values = [-999] * len(self.Titles)
+        self._records = logreader.ReadHistory(filename, Held=True)
+        self._mapping = None
+        self._mappingTitles = None
+        self._next = next(self._records, None)
+        if self._next is None:
+            raise ValueError("No readings in trace: " + filename)
+        self.Start = self._next[2]
+
+    # Apply all traced readings up to TimeNow
+    def advance(self, TimeNow):
+        while self._next is not None and self._next[2] <= TimeNow:
+            position, Titles, TimeStamp, Values = self._next
+            if self._mapping is None or Titles is not self._mappingTitles:
+                self._mappingTitles = Titles
+                if len(Titles) == len(Values):
+                    self._mapping = [self.Titles.index(t) if t in self.Titles else -1 for t in Titles]
+                else:
+                    self._mapping = list(range(0, len(Values)))
+            for x in range(0, min(len(Values), len(self._mapping))):
+                if 0 <= self._mapping[x] < len(self.Values):
+                    self.Values[self._mapping[x]] = Values[x]
+            self._next = next(self._records, None)
+
+    def value(self, SensorID):
+        return self.Values[SensorID]
+
+    def finished(self):
+        return self._next is None
+
+def PulseTime(field):
+    if '-' in field:
+        seconds, dot, fraction = field.partition('.')
+        return logreader.LogTimeToEpoch(seconds) + (float('0.' + fraction) if fraction else 0.0)
+    return float(field)
+
+# Stream (time, pin) from a pulse file
+def ReadPulses(filename):
+    with open(filename, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            fields = line.split(';')
+            yield PulseTime(fields[0]), int(fields[1])
+
+# Stream (time, frame) from an RPICT3V1 frame file, the frame as the bytes received
+def ReadFrames(filename):
+    with open(filename, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            fields = line.split(';', 1)
+            yield PulseTime(fields[0]), fields[1].encode('utf-8')
+
+# Write a synthetic trace and pulse file
+# Temperature follows a daily cycle; the meter pulses (1000 imp/kWh) at a power that also
+# follows a daily cycle. If OutageHour is given the first sensor fails (reads NaN) for that
+# hour (UTC) of every day. Output is fully determined by the arguments and Seed.
+def Synthesize(TraceFile, PulseFile, Start, Days, Interval, Titles, Pin, MeanPower, Seed=1, OutageHour=None):
+    rng = random.Random(Seed)
+    end = Start + Days * 86400
+    with open(TraceFile, 'w') as f:
+        f.write(time.strftime(logreader.LogTimeFormat, time.gmtime(Start)) + ",000 INFO " + ';'.join(Titles) + ';\n')
+        t = Start
+        reading = 0
+        while t < end:
+            logTime = time.strftime(logreader.LogTimeFormat, time.gmtime(t))
+            phase = 2 * math.pi * ((t % 86400) / 86400.0)
+            values = [round(10 + 5 * math.sin(phase) + rng.gauss(0, 0.1), 1) for title in Titles]
+            if OutageHour is not None and (t % 86400) // 3600 == OutageHour:
+                values[0] = float('nan')
+            f.write(logTime + ",000 INFO " + logTime + ";" + str(reading) + ";" + ''.join(str(v) + ';' for v in values) + '\n')
+            t = t + Interval
+            reading = reading + 1
+
+    with open(PulseFile, 'w') as f:
+        t = Start
+        while True:
+            phase = 2 * math.pi * ((t % 86400) / 86400.0)
+            power = max(0.05, MeanPower * (1 + 0.8 * math.sin(phase - math.pi / 2)))
+            t = t + rng.expovariate(power / 3.6)
+            if t >= end:
+                break
+            f.write("%.3f;%d\n" % (t, Pin))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write a synthetic replay trace and pulse file')
+    parser.add_argument('-Trace', action='store', dest='Trace', default='logs/synthetic.log',
+                        help='Trace file to write')
+    parser.add_argument('-Pulses', action='store', dest='Pulses', default='logs/synthetic.pulses',
+                        help='Pulse file to write')
+    parser.add_argument('-Start', action='store', dest='Start', default='2022-10-29 12:00:00',
+                        help='Start time (YYYY-mm-dd HH:MM:SS, UTC)')
+    parser.add_argument('-Days', action='store', dest='Days', default=2,
+                        help='Length of the trace in days')
+    parser.add_argument('-Interval', action='store', dest='Interval', default=60,
+                        help='Trace interval in seconds')
+    parser.add_argument('-Titles', action='store', dest='Titles', default='Outside Temperature',
+                        help='Semicolon separated sensor titles')
+    parser.add_argument('-Pin', action='store', dest='Pin', default=17,
+                        help='GPIO pin of the pulses')
+    parser.add_argument('-MeanPower', action='store', dest='MeanPower', default=0.5,
+                        help='Mean metered power (kW)')
+    parser.add_argument('-Seed', action='store', dest='Seed', default=1,
+                        help='Random seed')
+    parser.add_argument('-OutageHour', action='store', dest='OutageHour', default=-1,
+                        help='Hour (UTC) of every day in which the first sensor fails (-1 = none)')
+    arguments = parser.parse_args()
+
+    Synthesize(arguments.Trace, arguments.Pulses, logreader.LogTimeToEpoch(arguments.Start),
+               float(arguments.Days), float(arguments.Interval), arguments.Titles.split(';'),
+               int(arguments.Pin), float(arguments.MeanPower), int(arguments.Seed),
+               int(arguments.OutageHour) if int(arguments.OutageHour) >= 0 else None)
@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+# Energy & statistics reports over logged history
+# Streams the history files (text logs or segment files) in fixed-size chunks into NumPy
+# arrays and computes per-day (or per-week) statistics for every sensor, vectorized across
+# sensors: count, min, max, mean and percentiles, plus for power sensors (W) the energy (Wh)
+# integrated with the trapezoidal rule, split by tariff, and the peak power.
+# Only the current period is held in memory, so multi-year histories run in bounded memory.
+import argparse
+import csv
+import json
+import os
+import sys
+import tempfile
+import time
+import warnings
+
+import numpy as np
+
+import logreader
+
+parser = argparse.ArgumentParser(description='Energy & statistics report over logged history')
+
+parser.add_argument('Files', nargs='*',
+                    help='History files (default: all logs, oldest first)')
+
+parser.add_argument('-Period', action='store', dest='Period', default='day', choices=['day', 'week'],
+                    help='Reporting period (local time)')
+
+parser.add_argument('-Energy', action='store', dest='Energy', default='',
+                    help='Comma separated titles of power (W) sensors to integrate into Wh')
+
+parser.add_argument('-TariffHours', action='store', dest='TariffHours', default='0-6',
+                    help='Local hours of tariff T1 (e.g. 0-6 = midnight to 6AM); all other hours are T2')
+
+parser.add_argument('-Percentiles', action='store', dest='Percentiles', default='5,50,95',
+                    help='Comma separated percentiles')
+
+parser.add_argument('-MaxGap', action='store', dest='MaxGap', default=900,
+                    help='Gaps between readings longer than this (seconds) are not integrated')
+
+parser.add_argument('-ChunkSize', action='store', dest='ChunkSize', default=65536,
+                    help='Number of readings per chunk')
+
+parser.add_argument('-Format', action='store', dest='Format', default='csv', choices=['csv', 'json'],
+                    help='Output format')
+
+parser.add_argument('-Output', action='store', dest='Output', default='',
+                    help='Output file (default: stdout)')
+
+parser.add_argument('-Bench', action='store', dest='Bench', default=0,
+                    help='Run a throughput benchmark on this many synthetic readings instead')
+
+# Local time (seconds) for an array of epoch times, honouring DST
+# The UTC offset is looked up once per distinct hour rather than once per reading
+def LocalTime(times):
+    hours, inverse = np.unique(times // 3600, return_inverse=True)
+    offsets = np.array([time.localtime(h * 3600).tm_gmtoff for h in hours], dtype=float)
+    return times + offsets[inverse]
+
+def PeriodKey(localtimes, Period):
+    days = np.floor(localtimes / 86400.0).astype(np.int64)
+    if Period == 'week':
+        # Weeks start on Monday (epoch day 0 was a Thursday)
+        return (days + 3) // 7 * 7 - 3
+    return days
+
+def TariffMask(localtimes, TariffHours):
+    hours = np.floor((localtimes % 86400.0) / 3600.0)
+    start, end = TariffHours
+    if start <= end:
+        return (hours >= start) & (hours < end)
+    return (hours >= start) | (hours < end)
+
+class Report(object):
+    def __init__(self, Titles, Energy, Period='day', TariffHours=(0, 6), Percentiles=(5, 50, 95), MaxGap=900):
+        self.Titles = list(Titles)
+        missing = [t for t in Energy if t not in self.Titles]
+        if missing:
+            raise ValueError("Energy sensor(s) not in the log: " + ', '.join(missing) +
+                             "\nAvailable columns: " + ', '.join(self.Titles))
+        self.Energy = [self.Titles.index(t) for t in Energy]
+        self.Period = Period
+        self.TariffHours = TariffHours
+        self.Percentiles = list(Percentiles)
+        self.MaxGap = MaxGap
+        self.Rows = []
+        # Readings of the period in progress, carried between chunks
+        self._times = np.empty(0)
+        self._values = np.empty((0, len(self.Titles)))
+        # Last reading of the previous period, so energy is integrated across period boundaries
+        self._last = None
+
+    # Add a chunk of readings (times in epoch seconds, values: rows x columns)
+    def add(self, times, values):
+        times = np.concatenate((self._times, times))
+        values = np.concatenate((self._values, values))
+        periods = PeriodKey(LocalTime(times), self.Period)
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(periods)) + 1))
+        # Complete periods are reported; the last one may continue in the next chunk
+        for x in range(0, len(starts) - 1):
+            self._period(periods[starts[x]], times[starts[x]:starts[x + 1]], values[starts[x]:starts[x + 1]])
+        self._times = times[starts[-1]:]
+        self._values = values[starts[-1]:]
+
+    def finish(self):
+        if len(self._times):
+            periods = PeriodKey(LocalTime(self._times[:1]), self.Period)
+            self._period(periods[0], self._times, self._values)
+            self._times = np.empty(0)
+            self._values = np.empty((0, len(self.Titles)))
+        return self.Rows
+
+    def _period(self, period, times, values):
+        label = time.strftime('%Y-%m-%d', time.gmtime(int(period) * 86400))
+        valid = ~np.isnan(values)
+        count = valid.sum(axis=0)
+        with np.errstate(all='ignore'), warnings.catch_warnings():
+            # Sensors with no readings in the period are skipped below
+            warnings.simplefilter('ignore', RuntimeWarning)
+            minimum = np.min(np.where(valid, values, np.inf), axis=0)
+            maximum = np.max(np.where(valid, values, -np.inf), axis=0)
+            mean = np.nansum(values, axis=0) / count
+            percentiles = np.nanpercentile(values, self.Percentiles, axis=0)
+
+        energy = {}
+        if self.Energy:
+            energy = self._integrate(times, values)
+        self._last = (times[-1], values[-1])
+
+        for x in range(0, len(self.Titles)):
+            if count[x] == 0:
+                continue
+            row = {'period': label, 'sensor': self.Titles[x], 'count': int(count[x]),
+                   'min': float(minimum[x]), 'max': float(maximum[x]), 'mean': float(mean[x])}
+            for y in range(0, len(self.Percentiles)):
+                row['p' + str(self.Percentiles[y])] = float(percentiles[y][x])
+            if x in energy:
+                row.update(energy[x])
+            self.Rows.append(row)
+
+    # Trapezoidal integration of the power columns (W -> Wh), split by the tariff of the
+    # start of each interval
+    def _integrate(self, times, values):
+        columns = values[:, self.Energy]
+        if self._last is not None and 0 < times[0] - self._last[0] <= self.MaxGap:
+            times = np.concatenate(([self._last[0]], times))
+            columns = np.concatenate((self._last[1][self.Energy][np.newaxis, :], columns))
+        dt = np.diff(times)
+        dt = np.where((dt > 0) & (dt <= self.MaxGap), dt, 0.0)
+        area = np.nan_to_num((columns[1:] + columns[:-1]) * 0.5) * dt[:, np.newaxis] / 3600.0
+        t1 = TariffMask(LocalTime(times[:-1]), self.TariffHours)
+        result = {}
+        for y in range(0, len(self.Energy)):
+            result[self.Energy[y]] = {
+                'Wh': float(area[:, y].sum()),
+                'Wh_T1': float(area[t1, y].sum()),
+                'Wh_T2': float(area[~t1, y].sum()),
+                # fmax skips NaN readings (a period with none gives NaN, without a warning)
+                'peak_kW': float(np.fmax.reduce(columns[:, y]) / 1000.0) if len(columns) else 0.0,
+            }
+        return result
+
+# Stream the history files through a report in chunks of ChunkSize readings
+# Columns are matched by title; the first file with titles defines the report columns.
+# Columns of later files that aren't in the report are left out, with a warning.
+def Run(Files, Energy, Period, TariffHours, Percentiles, MaxGap, ChunkSize):
+    report = None
+    times = np.empty(ChunkSize)
+    values = None
+    n = 0
+    rows = 0
+    dropped = set()
+    for filename in Files:
+        mapping = None
+        mappingTitles = None
+        for position, Titles, TimeStamp, Values in logreader.ReadHistory(filename):
+            if report is None:
+                titles = Titles if len(Titles) == len(Values) else ['Sensor ' + str(x) for x in range(0, len(Values))]
+                report = Report(titles, Energy, Period, TariffHours, Percentiles, MaxGap)
+                values = np.empty((ChunkSize, len(titles)))
+            if mapping is None or Titles is not mappingTitles:
+                mappingTitles = Titles
+                mapping = [report.Titles.index(t) if t in report.Titles else -1 for t in Titles] \
+                    if len(Titles) == len(Values) else list(range(0, len(Values)))
+                for x in range(0, len(mapping)):
+                    if mapping[x] < 0 and Titles[x] not in dropped:
+                        dropped.add(Titles[x])
+                        sys.stderr.write("Warning: column '" + Titles[x] + "' of " + filename +
+                                         " is not in the report (columns are set by the first file)\n")
+            times[n] = TimeStamp
+            row = values[n]
+            row.fill(np.nan)
+            for x in range(0, min(len(Values), len(mapping))):
+                if 0 <= mapping[x] < len(row):
+                    row[mapping[x]] = Values[x]
+            n = n + 1
+            if n == ChunkSize:
+                report.add(times, values)
+                rows = rows + n
+                n = 0
+    if report is None:
+        return [], 0
+    report.add(times[:n], values[:n])
+    return report.finish(), rows + n
+
+def Write(rows, Format, Output):
+    f = open(Output, 'w', newline='') if Output else sys.stdout
+    try:
+        if Format == 'json':
+            json.dump(rows, f, indent=1)
+            f.write('\n')
+        else:
+            fields = []
+            for row in rows:
+                for key in row:
+                    if key not in fields:
+                        fields.append(key)
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(rows)
+    finally:
+        if Output:
+            f.close()
+
+# Throughput benchmark on a synthetic minute-rate log (temperature + import power)
+def Benchmark(NumReadings, ChunkSize):
+    rng = np.random.default_rng(1)
+    start = 1577836800
+    handle, filename = tempfile.mkstemp(suffix='.log')
+    with os.fdopen(handle, 'w') as f:
+        f.write("2020-01-01 00:00:00,000 INFO Temperature;Power;\n")
+        temperature = 10 + np.cumsum(rng.normal(0, 0.05, NumReadings))
+        power = np.abs(500 + np.cumsum(rng.normal(0, 20, NumReadings)))
+        for x in range(0, NumReadings):
+            logTime = time.strftime(logreader.LogTimeFormat, time.gmtime(start + 60 * x))
+            f.write("%s,000 INFO %s;%d;%.1f;%.1f;\n" % (logTime, logTime, x, temperature[x], power[x]))
+
+    try:
+        elapsed = time.perf_counter()
+        rows, readings = Run([filename], ['Power'], 'day', (0, 6), [5, 50, 95], 900, ChunkSize)
+        elapsed = time.perf_counter() - elapsed
+
+        # Aggregation alone, on readings already in memory
+        times = start + 60.0 * np.arange(NumReadings)
+        values = np.column_stack((temperature, power))
+        aggregate = time.perf_counter()
+        report = Report(['Temperature', 'Power'], ['Power'])
+        for x in range(0, NumReadings, ChunkSize):
+            report.add(times[x:x + ChunkSize], values[x:x + ChunkSize])
+        report.finish()
+        aggregate = time.perf_counter() - aggregate
+    finally:
+        os.remove(filename)
+
+    print("Readings: %d (%d days), %d report rows" % (readings, NumReadings // 1440, len(rows)))
+    print("End to end (parse + aggregate): %.2f s, %.0f readings/s" % (elapsed, readings / elapsed))
+    print("Aggregation only: %.3f s, %.0f readings/s" % (aggregate, NumReadings / aggregate))
+
+if __name__ == '__main__':
+    arguments = parser.parse_args()
+    if int(arguments.Bench) > 0:
+        Benchmark(int(arguments.Bench), int(arguments.ChunkSize))
+        sys.exit(0)
+
+    Files = arguments.Files or logreader.HistoryFiles()
+    Energy = [t for t in arguments.Energy.split(',') if t]
+    TariffHours = tuple(int(h) for h in arguments.TariffHours.split('-'))
+    Percentiles = [float(p) if '.' in p else int(p) for p in arguments.Percentiles.split(',') if p]
+    try:
+        rows, readings = Run(Files, Energy, arguments.Period, TariffHours, Percentiles,
+                             float(arguments.MaxGap), int(arguments.ChunkSize))
+    except ValueError as e:
+        sys.exit("report.py: " + str(e))
+    Write(rows, arguments.Format, arguments.Output)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# Shared-memory ring buffer of sample records
+# Used by the multi-process mode of MultiLogger: a single sampler process writes fixed-layout
+# records and any number of consumer processes read them from shared memory at their own pace.
+# The writer never waits for a reader; a reader that falls more than a full ring behind
+# detects the overrun, counts the lost records and skips ahead to the oldest record still held.
+import os
+import struct
+import time
+from multiprocessing import shared_memory, resource_tracker
+
+RING_MAGIC = b'MLRB'
+RING_VERSION = 3
+
+# Header: magic, version, capacity, number of values, record size, closed flag, head sequence
+HEADER = struct.Struct('<4sIIIII8xQ')
+HEADER_SIZE = 64
+HEAD_OFFSET = 32
+CLOSED_OFFSET = 20
+
+# Record: sequence number, timestamp, reading number, bit mask of the values updated in this
+# record, bit mask of the stale values (last good readings of failing sensors), then
+# NumValues float64 values
+# The sequence number is cleared while the record is being written and set last, so a reader
+# can detect a record that was being overwritten while it was copied
+# Records are copied out (one unpack of the values) rather than handed over as views of the
+# slot: the consumers keep values after the read, past the point where the sequence number
+# check covers them, and a record is only NumValues float64s
+RECORD_HEAD = struct.Struct('<QdqQQ')
+SEQ = struct.Struct('<Q')
+
+class SampleRing(object):
+    # Create a new ring (Name=None) or attach to an existing one by name
+    def __init__(self, Name=None, Capacity=1024, NumValues=16):
+        if Name is None:
+            recordSize = RECORD_HEAD.size + 8 * NumValues
+            self._shm = shared_memory.SharedMemory(create=True, size=HEADER_SIZE + Capacity * recordSize)
+            HEADER.pack_into(self._shm.buf, 0, RING_MAGIC, RING_VERSION, Capacity, NumValues, recordSize, 0, 0)
+            self._owner = True
+        else:
+            self._shm = shared_memory.SharedMemory(name=Name)
+            # Attaching processes must not unlink the segment when they exit
+            resource_tracker.unregister(self._shm._name, 'shared_memory')
+            self._owner = False
+
+        magic, version, self.Capacity, self.NumValues, self._recordSize, closed, head = HEADER.unpack_from(self._shm.buf, 0)
+        if magic != RING_MAGIC or version != RING_VERSION:
+            raise ValueError("Not a sample ring: " + self._shm.name)
+        self._values = struct.Struct('<%dd' % self.NumValues)
+        self.Name = self._shm.name
+
+    def _offset(self, seq):
+        return HEADER_SIZE + (seq % self.Capacity) * self._recordSize
+
+    def head(self):
+        return SEQ.unpack_from(self._shm.buf, HEAD_OFFSET)[0]
+
+    def closed(self):
+        return struct.unpack_from('<I', self._shm.buf, CLOSED_OFFSET)[0] != 0
+
+    # Append one record. Values shorter than NumValues are padded with NaN
+    def write(self, TimeStamp, Reading, Values, Updated=-1, Stale=0):
+        buf = self._shm.buf
+        seq = self.head() + 1
+        offset = self._offset(seq)
+        values = list(Values[:self.NumValues])
+        values.extend([float('nan')] * (self.NumValues - len(values)))
+        RECORD_HEAD.pack_into(buf, offset, 0, TimeStamp, Reading, Updated & 0xFFFFFFFFFFFFFFFF, Stale & 0xFFFFFFFFFFFFFFFF)
+        self._values.pack_into(buf, offset + RECORD_HEAD.size, *values)
+        SEQ.pack_into(buf, offset, seq)
+        SEQ.pack_into(buf, HEAD_OFFSET, seq)
+
+    # Read record seq, or None if it has been (or is being) overwritten
+    def read(self, seq):
+        buf = self._shm.buf
+        offset = self._offset(seq)
+        recseq, TimeStamp, Reading, Updated, Stale = RECORD_HEAD.unpack_from(buf, offset)
+        if recseq != seq:
+            return None
+        Values = self._values.unpack_from(buf, offset + RECORD_HEAD.size)
+        if SEQ.unpack_from(buf, offset)[0] != seq:
+            return None
+        return TimeStamp, Reading, Values, Updated, Stale
+
+    # Mark the ring as closed so that consumers exit
+    def close(self):
+        struct.pack_into('<I', self._shm.buf, CLOSED_OFFSET, 1)
+
+    def release(self):
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+# Independent read cursor into a ring
+class RingReader(object):
+    def __init__(self, Ring, FromStart=False):
+        self.Ring = Ring
+        self.Next = 1 if FromStart else Ring.head() + 1
+        self.Overruns = 0
+
+    # Return all records written since the last call as a list of (TimeStamp, Reading, Values, Updated, Stale)
+    def poll(self):
+        records = []
+        while True:
+            head = self.Ring.head()
+            if self.Next > head:
+                break
+            oldest = head - self.Ring.Capacity + 1
+            if self.Next < oldest:
+                self.Overruns = self.Overruns + oldest - self.Next
+                self.Next = oldest
+            record = self.Ring.read(self.Next)
+            if record is None:
+                # Overwritten while it was being copied
+                self.Overruns = self.Overruns + 1
+            else:
+                records.append(record)
+            self.Next = self.Next + 1
+        return records
+
+# Consumer process main loop
+# Calls Handler(TimeStamp, Reading, Values, Updated, Stale) for every record until the ring is closed or
+# the parent (sampler) process exits, then OnExit() if given
+def RunConsumer(Ring, Handler, PollInterval=0.1, OnOverrun=None, OnExit=None):
+    parent = os.getppid()
+    reader = RingReader(Ring)
+    overruns = 0
+    try:
+        while not Ring.closed() and os.getppid() == parent:
+            records = reader.poll()
+            if reader.Overruns != overruns:
+                if OnOverrun is not None:
+                    OnOverrun(reader.Overruns - overruns)
+                overruns = reader.Overruns
+            for TimeStamp, Reading, Values, Updated, Stale in records:
+                Handler(TimeStamp, Reading, Values, Updated, Stale)
+            if not records:
+                time.sleep(PollInterval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if OnExit is not None:
+            OnExit()
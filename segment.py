@@ -0,0 +1,428 @@
+#!/usr/bin/env python
+# Compressed columnar segment files for sensor history
+# Samples are grouped into blocks. Within a block the timestamps are stored as
+# delta-of-delta codes and each sensor is stored as its own column of XOR-encoded floats
+# (the Gorilla time-series encoding), so slowly changing readings take a few bits each.
+# An index of the time range of every block is written at the end of the file, so a range
+# read only decodes the blocks (and columns) it needs.
+#
+# File layout:
+#   header  : magic, version, number of columns, column titles
+#   blocks  : block header (sample count, first/last timestamp, byte length of each column)
+#             followed by the timestamp column and the value columns
+#   index   : (first timestamp, last timestamp, offset) for every block
+#   footer  : index offset, number of blocks, magic
+# A file that was not closed cleanly has no index; readers then scan the block headers.
+# A block is written when it holds BlockSize samples or spans FlushInterval seconds, so a
+# crash loses at most FlushInterval seconds of samples.
+import argparse
+import os
+import random
+import struct
+import sys
+import tempfile
+import time
+
+import logreader
+
+SEGMENT_MAGIC = b'MLSG'
+INDEX_MAGIC = b'MLSX'
+SEGMENT_VERSION = 1
+
+FILE_HEADER = struct.Struct('<4sHH')
+BLOCK_HEADER = struct.Struct('<Iqq')
+INDEX_ENTRY = struct.Struct('<qqQ')
+FOOTER = struct.Struct('<QI4s')
+COLUMN_LENGTH = struct.Struct('<I')
+FLOAT = struct.Struct('<d')
+BITS = struct.Struct('<Q')
+
+BlockSize = 256
+FlushInterval = 600
+
+# Bit stream writer/reader (most significant bit first)
+class BitWriter(object):
+    def __init__(self):
+        self._acc = 0
+        self._bits = 0
+
+    def write(self, value, nbits):
+        self._acc = (self._acc << nbits) | (value & ((1 << nbits) - 1))
+        self._bits = self._bits + nbits
+
+    def getvalue(self):
+        pad = -self._bits % 8
+        return (self._acc << pad).to_bytes((self._bits + pad) // 8, 'big')
+
+class BitReader(object):
+    def __init__(self, data):
+        self._acc = int.from_bytes(data, 'big')
+        self._left = len(data) * 8
+
+    def read(self, nbits):
+        self._left = self._left - nbits
+        return (self._acc >> self._left) & ((1 << nbits) - 1)
+
+def Signed(value, nbits):
+    if value >= 1 << (nbits - 1):
+        return value - (1 << nbits)
+    return value
+
+# Delta-of-delta timestamp encoding (whole seconds)
+# '0' = same interval as before, otherwise a prefix selects a 7, 9, 12 or 32 bit delta-of-delta
+DOD_BUCKETS = ((0b10, 2, 7), (0b110, 3, 9), (0b1110, 4, 12))
+
+def EncodeTimes(times):
+    writer = BitWriter()
+    delta = 0
+    for x in range(1, len(times)):
+        newdelta = times[x] - times[x - 1]
+        dod = newdelta - delta
+        delta = newdelta
+        if dod == 0:
+            writer.write(0, 1)
+            continue
+        for prefix, prefixbits, nbits in DOD_BUCKETS:
+            if -(1 << (nbits - 1)) <= dod < (1 << (nbits - 1)):
+                writer.write(prefix, prefixbits)
+                writer.write(dod, nbits)
+                break
+        else:
+            writer.write(0b1111, 4)
+            writer.write(dod, 32)
+    return writer.getvalue()
+
+def DecodeTimes(data, first, count):
+    reader = BitReader(data)
+    times = [first]
+    delta = 0
+    for x in range(1, count):
+        if reader.read(1) == 0:
+            dod = 0
+        elif reader.read(1) == 0:
+            dod = Signed(reader.read(7), 7)
+        elif reader.read(1) == 0:
+            dod = Signed(reader.read(9), 9)
+        elif reader.read(1) == 0:
+            dod = Signed(reader.read(12), 12)
+        else:
+            dod = Signed(reader.read(32), 32)
+        delta = delta + dod
+        times.append(times[-1] + delta)
+    return times
+
+def FloatBits(value):
+    return BITS.unpack(FLOAT.pack(value))[0]
+
+def BitsFloat(bits):
+    return FLOAT.unpack(BITS.pack(bits))[0]
+
+# XOR float encoding
+# The first value is stored in full. Each following value is XORed with the previous one:
+# '0' = identical, '10' = meaningful bits fit the previous leading/trailing zero window,
+# '11' = new window (5 bits leading zeros, 6 bits length) followed by the meaningful bits
+def EncodeValues(values):
+    writer = BitWriter()
+    previous = FloatBits(values[0])
+    writer.write(previous, 64)
+    leading = 65
+    trailing = 0
+    for value in values[1:]:
+        bits = FloatBits(value)
+        xor = bits ^ previous
+        previous = bits
+        if xor == 0:
+            writer.write(0, 1)
+            continue
+        newleading = min(64 - xor.bit_length(), 31)
+        newtrailing = (xor & -xor).bit_length() - 1
+        if newleading >= leading and newtrailing >= trailing:
+            writer.write(0b10, 2)
+            writer.write(xor >> trailing, 64 - leading - trailing)
+        else:
+            leading = newleading
+            trailing = newtrailing
+            length = 64 - leading - trailing
+            writer.write(0b11, 2)
+            writer.write(leading, 5)
+            writer.write(length - 1, 6)
+            writer.write(xor >> trailing, length)
+    return writer.getvalue()
+
+def DecodeValues(data, count):
+    reader = BitReader(data)
+    previous = reader.read(64)
+    values = [BitsFloat(previous)]
+    leading = 0
+    trailing = 0
+    for x in range(1, count):
+        if reader.read(1) == 1:
+            if reader.read(1) == 1:
+                leading = reader.read(5)
+                trailing = 64 - leading - (reader.read(6) + 1)
+            previous = previous ^ (reader.read(64 - leading - trailing) << trailing)
+        values.append(BitsFloat(previous))
+    return values
+
+class SegmentWriter(object):
+    # Open a segment file for writing. An existing file with the same titles is appended to.
+    def __init__(self, filename, Titles, BlockSize=BlockSize, FlushInterval=FlushInterval):
+        self.Titles = list(Titles)
+        self.BlockSize = BlockSize
+        self.FlushInterval = FlushInterval
+        self._times = []
+        self._columns = [[] for title in self.Titles]
+        self._index = []
+
+        if os.path.exists(filename) and os.path.getsize(filename) > 0:
+            reader = SegmentReader(filename)
+            if reader.Titles != self.Titles:
+                raise ValueError("Segment titles do not match: " + filename)
+            self._index = reader.Index
+            end = reader.DataEnd
+            reader.close()
+            self._file = open(filename, 'r+b')
+            self._file.seek(end)
+            self._file.truncate()
+        else:
+            self._file = open(filename, 'wb')
+            header = FILE_HEADER.pack(SEGMENT_MAGIC, SEGMENT_VERSION, len(self.Titles))
+            for title in self.Titles:
+                data = title.encode('utf-8')
+                header = header + struct.pack('<H', len(data)) + data
+            self._file.write(header)
+
+    def append(self, TimeStamp, Values):
+        self._times.append(int(round(TimeStamp)))
+        for x in range(0, len(self._columns)):
+            self._columns[x].append(float(Values[x]))
+        if len(self._times) >= self.BlockSize or \
+           (self.FlushInterval > 0 and self._times[-1] - self._times[0] >= self.FlushInterval):
+            self.flush()
+
+    # Write the samples held in memory as a block
+    def flush(self):
+        if not self._times:
+            return
+        data = [EncodeTimes(self._times)] + [EncodeValues(column) for column in self._columns]
+        offset = self._file.tell()
+        header = BLOCK_HEADER.pack(len(self._times), self._times[0], self._times[-1])
+        header = header + b''.join(COLUMN_LENGTH.pack(len(d)) for d in data)
+        self._file.write(header + b''.join(data))
+        self._file.flush()
+        self._index.append((self._times[0], self._times[-1], offset))
+        self._times = []
+        self._columns = [[] for title in self.Titles]
+
+    # Number of blocks written (the block index is held in memory until close)
+    def blocks(self):
+        return len(self._index)
+
+    def close(self):
+        self.flush()
+        offset = self._file.tell()
+        index = b''.join(INDEX_ENTRY.pack(*entry) for entry in self._index)
+        self._file.write(index + FOOTER.pack(offset, len(self._index), INDEX_MAGIC))
+        self._file.close()
+
+# Move a closed segment file aside as <name>-YYYYmmdd-HHMMSS.seg (UTC), so that writing
+# continues in a new file
+def Rollover(filename, TimeStamp):
+    name, ext = os.path.splitext(filename)
+    os.replace(filename, name + time.strftime('-%Y%m%d-%H%M%S', time.gmtime(TimeStamp)) + ext)
+
+class SegmentReader(object):
+    def __init__(self, filename):
+        self._file = open(filename, 'rb')
+        magic, version, numcolumns = FILE_HEADER.unpack(self._file.read(FILE_HEADER.size))
+        if magic != SEGMENT_MAGIC or version != SEGMENT_VERSION:
+            raise ValueError("Not a segment file: " + filename)
+        self.Titles = []
+        for x in range(0, numcolumns):
+            length = struct.unpack('<H', self._file.read(2))[0]
+            self.Titles.append(self._file.read(length).decode('utf-8'))
+        self.DataStart = self._file.tell()
+        self._readIndex()
+
+    def _readIndex(self):
+        size = self._file.seek(0, os.SEEK_END)
+        if size - self.DataStart >= FOOTER.size:
+            self._file.seek(size - FOOTER.size)
+            offset, numblocks, magic = FOOTER.unpack(self._file.read(FOOTER.size))
+            if magic == INDEX_MAGIC and offset + numblocks * INDEX_ENTRY.size + FOOTER.size == size:
+                self._file.seek(offset)
+                data = self._file.read(numblocks * INDEX_ENTRY.size)
+                self.Index = [INDEX_ENTRY.unpack_from(data, x * INDEX_ENTRY.size) for x in range(0, numblocks)]
+                self.DataEnd = offset
+                return
+
+        # No index (file not closed cleanly) - rebuild it from the block headers
+        self.Index = []
+        offset = self.DataStart
+        headersize = BLOCK_HEADER.size + COLUMN_LENGTH.size * (len(self.Titles) + 1)
+        while offset + headersize <= size:
+            self._file.seek(offset)
+            header = self._file.read(headersize)
+            count, first, last = BLOCK_HEADER.unpack_from(header, 0)
+            lengths = struct.unpack_from('<%dI' % (len(self.Titles) + 1), header, BLOCK_HEADER.size)
+            if offset + headersize + sum(lengths) > size:
+                break
+            self.Index.append((first, last, offset))
+            offset = offset + headersize + sum(lengths)
+        self.DataEnd = offset
+
+    # Decode one block, returning (times, columns) for the requested columns
+    def readBlock(self, offset, Columns=None):
+        numcolumns = len(self.Titles)
+        self._file.seek(offset)
+        count, first, last = BLOCK_HEADER.unpack(self._file.read(BLOCK_HEADER.size))
+        lengths = struct.unpack('<%dI' % (numcolumns + 1), self._file.read(COLUMN_LENGTH.size * (numcolumns + 1)))
+        times = DecodeTimes(self._file.read(lengths[0]), first, count)
+        columns = []
+        start = self._file.tell()
+        for x in range(0, numcolumns):
+            if Columns is None or x in Columns:
+                self._file.seek(start + sum(lengths[1:x + 1]))
+                columns.append(DecodeValues(self._file.read(lengths[x + 1]), count))
+        return times, columns
+
+    # Stream (Position, TimeStamp, Values) for samples in [Start, End], decoding only the
+    # blocks that overlap the range. Position is the offset of the block to resume from.
+    def read(self, Start=None, End=None, Columns=None, Offset=0):
+        for first, last, offset in self.Index:
+            if offset < Offset or (Start is not None and last < Start) or (End is not None and first > End):
+                continue
+            times, columns = self.readBlock(offset, Columns)
+            for x in range(0, len(times)):
+                if (Start is None or times[x] >= Start) and (End is None or times[x] <= End):
+                    yield offset, times[x], [column[x] for column in columns]
+
+    def close(self):
+        self._file.close()
+
+# Stream records from a segment file in the same form as logreader.ReadLog()
+# Positions are block offsets; the position after the last record of a block is the offset
+# of the next block, so a resumed read restarts at the first unfinished block
+def ReadSegment(filename, Offset=0):
+    reader = SegmentReader(filename)
+    try:
+        offsets = [entry[2] for entry in reader.Index] + [reader.DataEnd]
+        for x in range(0, len(offsets) - 1):
+            if offsets[x] < Offset:
+                continue
+            times, columns = reader.readBlock(offsets[x])
+            for y in range(0, len(times)):
+                position = offsets[x + 1] if y == len(times) - 1 else offsets[x]
+                yield position, reader.Titles, times[y], [column[y] for column in columns]
+    finally:
+        reader.close()
+
+# Convert a text log to a segment file, returning (text bytes, segment bytes, samples)
+def ConvertLog(logname, segname):
+    writer = None
+    samples = 0
+    for position, Titles, TimeStamp, Values in logreader.ReadLog(logname):
+        if writer is None:
+            titles = Titles if len(Titles) == len(Values) else ['Sensor ' + str(x) for x in range(0, len(Values))]
+            writer = SegmentWriter(segname, titles)
+        if len(Values) != len(writer.Titles):
+            continue
+        writer.append(TimeStamp, Values)
+        samples = samples + 1
+    if writer is None:
+        return os.path.getsize(logname), 0, 0
+    writer.close()
+    return os.path.getsize(logname), os.path.getsize(segname), samples
+
+# Encode / decode benchmark on a synthetic minute-rate dataset
+def Benchmark(NumSamples, NumColumns):
+    random.seed(1)
+    start = int(time.time())
+    times = [start + 60 * x + random.choice((0, 0, 0, 1, -1)) for x in range(0, NumSamples)]
+    values = []
+    level = [20.0] * NumColumns
+    for x in range(0, NumSamples):
+        level = [round(v + random.gauss(0, 0.05), 1) for v in level]
+        values.append(level)
+
+    handle, filename = tempfile.mkstemp(suffix='.seg')
+    os.close(handle)
+    try:
+        encode = time.perf_counter()
+        writer = SegmentWriter(filename, ['Sensor ' + str(x) for x in range(0, NumColumns)])
+        for x in range(0, NumSamples):
+            writer.append(times[x], values[x])
+        writer.close()
+        encode = time.perf_counter() - encode
+        size = os.path.getsize(filename)
+
+        decode = time.perf_counter()
+        reader = SegmentReader(filename)
+        count = sum(1 for record in reader.read())
+        decode = time.perf_counter() - decode
+
+        rangedecode = time.perf_counter()
+        middle = times[NumSamples // 2]
+        rangecount = sum(1 for record in reader.read(middle, middle + 3600))
+        rangedecode = time.perf_counter() - rangedecode
+        reader.close()
+    finally:
+        os.remove(filename)
+
+    textsize = sum(len(time.strftime(logreader.LogTimeFormat, time.gmtime(t))) + 8 +
+                   sum(len(str(v)) + 1 for v in vals) for t, vals in zip(times, values))
+    print("Samples: %d x %d columns" % (count, NumColumns))
+    print("Encode: %.1f us/sample (%.1f us/value)" % (1e6 * encode / NumSamples, 1e6 * encode / (NumSamples * NumColumns)))
+    print("Decode: %.0f samples/s (%.0f values/s)" % (count / decode, count * NumColumns / decode))
+    print("Range decode (1 hour, %d samples): %.2f ms" % (rangecount, 1e3 * rangedecode))
+    print("Size: %d bytes (%.2f bytes/value), text equivalent %d bytes, ratio %.1f:1" %
+          (size, size / float(NumSamples * NumColumns), textsize, textsize / float(size)))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compressed segment files for sensor history')
+    parser.add_argument('Command', choices=['convert', 'ratio', 'dump', 'bench'],
+                        help='convert: log files to .seg files, ratio: report compression of log files, '
+                             'dump: print a .seg file, bench: encode/decode benchmark')
+    parser.add_argument('Files', nargs='*', help='Files to process')
+    parser.add_argument('-Start', action='store', dest='Start', default=None,
+                        help='Dump from time (YYYY-mm-dd HH:MM:SS, UTC)')
+    parser.add_argument('-End', action='store', dest='End', default=None,
+                        help='Dump until time (YYYY-mm-dd HH:MM:SS, UTC)')
+    parser.add_argument('-Samples', action='store', dest='Samples', default=100000,
+                        help='Benchmark samples')
+    parser.add_argument('-Columns', action='store', dest='Columns', default=4,
+                        help='Benchmark columns')
+    arguments = parser.parse_args()
+
+    if arguments.Command == 'bench':
+        Benchmark(int(arguments.Samples), int(arguments.Columns))
+
+    elif arguments.Command in ('convert', 'ratio'):
+        totaltext = 0
+        totalseg = 0
+        for logname in arguments.Files:
+            segname = os.path.splitext(logname)[0] + '.seg'
+            if arguments.Command == 'ratio':
+                segname = segname + '.tmp'
+            textsize, segsize, samples = ConvertLog(logname, segname)
+            if arguments.Command == 'ratio' and os.path.exists(segname):
+                os.remove(segname)
+            totaltext = totaltext + textsize
+            totalseg = totalseg + segsize
+            if segsize:
+                print("%s: %d samples, %d -> %d bytes (%.1f:1)" % (logname, samples, textsize, segsize, textsize / float(segsize)))
+            else:
+                print("%s: no data" % logname)
+        if totalseg:
+            print("Total: %d -> %d bytes (%.1f:1)" % (totaltext, totalseg, totaltext / float(totalseg)))
+
+    elif arguments.Command == 'dump':
+        start = logreader.LogTimeToEpoch(arguments.Start) if arguments.Start else None
+        end = logreader.LogTimeToEpoch(arguments.End) if arguments.End else None
+        for segname in arguments.Files:
+            reader = SegmentReader(segname)
+            print(';'.join(reader.Titles) + ';')
+            for position, TimeStamp, Values in reader.read(start, end):
+                sys.stdout.write(time.strftime(logreader.LogTimeFormat, time.gmtime(TimeStamp)) + ';' +
+                                 ''.join(str(v) + ';' for v in Values) + '\n')
+            reader.close()
@@ -1,4 +1,5 @@
 #!/usr/bin/env python
+# -*- coding: latin-1 -*-
 
 # Sensor configuration...
 # Note - Each array below must be equal in length to len(SensorName)
@@ -10,9 +11,10 @@ SensorType = ['T1w']
 SensorUnits = ['C']
 # 'T1w' = One-Wire Temperature Sensor 
 # 'PIR' = Passive infra-red sensor
-# 'DHTxx_T' = DHT22 or DHT11 Temperature
-# 'DHTxx_H' = DHT22 or DHT11 Humidity
-# 'Vi' = Simple voltage measurement using internal ADC 
+# 'DHTxx_T' = DHT22 or DHT11 Temperature (kernel dht11 IIO driver, SensorLoc = 'dht11' or 'iio:deviceN')
+# 'DHTxx_H' = DHT22 or DHT11 Humidity (kernel dht11 IIO driver, SensorLoc = 'dht11' or 'iio:deviceN')
+# 'Vi' = Simple voltage measurement using an IIO ADC channel (SensorLoc = e.g. 'mcp3008/in_voltage0')
+# 'Hwmon' = Any hwmon attribute (SensorLoc = e.g. 'rpi_volt/in0_input')
 
 # 'Throttle_Status' = CPU Throttle status (Current throttle status)
 # 'Throttle_Level' = CPU Throttle level (% time throttled)
@@ -22,11 +24,19 @@ SensorUnits = ['
 # 'LM75' = LM75 I2C Temperature Sensor
 # 'TPin' = Analogue Thermistor
 # 'Ping' = network ping success (%)
-# 'LDRPin' = Analogue Light Dependant Resistor
+# 'LDRPin' = Analogue Light Dependant Resistor (lux)
 # 'Electric_Whrs_import_today' = Electricity usage meter (daily)
 # 'Electric_kW' = Electricity usage meter (Watts now)
 # 'SolarPV_Whrs_gen_today' = Solar PV generation meter (daily)
 # 'SolarPV_W' = Solar PV generation meter (Watts now)
+# 'RPM' = Revolutions per minute and 'Dist_m' = distance today (wheel sensor pulses)
+# 'TrigN' / 'TrigP' = Negative / positive edge trigger (count today)
+# 'RPICT3V1_MainsElectricityVoltage' = RPICT3V1 mains voltage (reads the RPICT3V1 data set, must come before the other RPICT3V1 sensors)
+# 'RPICT3V1_SCT013_100A_1', 'RPICT3V1_ActiveImport', 'RPICT3V1_ActiveExport', 'RPICT3V1_PowerFactor' = RPICT3V1 latest frame
+# 'RPICT3V1_Whrs_import_today' / 'RPICT3V1_Whrs_export_today' = RPICT3V1 energy (daily), integrated from every frame
+# 'RPICT3V1_PeakImport' / 'RPICT3V1_MinImport' = RPICT3V1 peak / minimum import power since the last reading
+# 'RPICT3V1_AvgPowerFactor' = RPICT3V1 power factor averaged over every frame since the last reading
+# For the RPICT3V1 sensors SensorLoc is the frame field (e.g. '1'); for the energy and import types it must be a signed power field
 
 SensorLoc = ['28-01191b9257fd']
 
@@ -36,6 +46,28 @@ Sensor_A = [0.0]
 Sensor_B = [1.0]
 Sensor_C = [0.0]
 
+# GPIO pulse counters ('Electric_Whrs_import_today', 'SolarPV_Whrs_gen_today', 'RPM', 'TrigN', 'TrigP')
+# SensorLoc is the GPIO pin. Each pin gets its own counter, set up from the preset of its type
+# (see counters.PRESETS) with any of Scale (value per pulse), RateScale (rate at one pulse per
+# second), Edge ('falling', 'rising' or 'both'), Debounce (seconds), PullUp and Offset (initial
+# total) overridden here by pin, e.g. a 500 imp/kWh meter on pin 17:
+# Counters = {17: {'Scale': 0.002, 'RateScale': 7.2}}
+Counters = {}
+
+# Analogue sensor front-end ('TPin' thermistor, 'LDRPin' light dependent resistor), one entry per sensor
+# SensorLoc is an IIO ADC channel (e.g. 'mcp3008/in_voltage0', sensor on the low side of a
+# divider with SeriesResistor to the ADC reference) or a GPIO pin number (RC timing, sensor in
+# series with TimingCapacitor). Entries of other sensor types are not used.
+Thermistor_R0 = [10000]     # Thermistor resistance (ohms) at Thermistor_T0
+Thermistor_T0 = [25.0]      # deg C
+Thermistor_Beta = [3950]
+Thermistor_SH = [[]]        # Optional Steinhart-Hart coefficients [A, B, C], used instead of Beta
+LDR_R10 = [20000]           # LDR resistance (ohms) at 10 lux
+LDR_Gamma = [0.7]
+SeriesResistor = [10000]    # ohms
+TimingCapacitor = [1e-6]    # farads
+ADC_FullScale = [1023]      # e.g. 10-bit MCP3008
+
 # Sensor Error & Warning thresholds
 # Set Warning and Reset thresholds to 0 to disable
 HighWarning = [0, 0, 0]
@@ -47,6 +79,12 @@ LowReset    = [0, 0, 0]
 Domoticz_En = True
 DomoticzIDX = ['63'] # Use 'x' to disable logging to Domoticz for each sensor
 
+# MQTT config
+MQTT_Topic = ['MultiLogger/Outside_Temperature'] # Use 'x' to disable publishing to MQTT for each sensor
+
+# Output backends used for logging ('domoticz', 'mqtt')
+OutputBackends = ['domoticz']
+
 # Other options
 
 # Number of active sensors
@@ -55,6 +93,26 @@ ActiveSensors = len(SensorName)
 # Measurement interval in seconds
 MeasurementInterval = 60
 
+# Adaptive sampling (MultiLogger -Adaptive 1)
+# Each sensor is read between MinInterval and MaxInterval seconds apart: more often while its
+# readings change (or spread) by more than AdaptiveThreshold, in sensor units, and less often
+# while they are quiet. Set AdaptiveThreshold to 0 to keep a sensor at MeasurementInterval.
+MinInterval = [10]
+MaxInterval = [600]
+AdaptiveThreshold = [0.2]
+
+# Sensor failure handling
+# A sensor that fails FailureThreshold reads in a row is skipped, then retried after
+# FailureBackoff seconds, doubling after every failed retry up to MaxFailureBackoff.
+# A failing sensor reports its last good reading for up to StaleAge seconds, then NaN.
+FailureThreshold = 3
+FailureBackoff = 60
+MaxFailureBackoff = 3600
+StaleAge = 600
+
+# Memory budget in MB - a warning is logged if the logger's RSS grows beyond this
+MemoryBudget = 48
+
 # Log interval in seconds
 LogInterval = 30
 
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# Soak test for memory growth
+# Runs the logger itself (MultiLogger.py, in replay mode on the virtual clock) for millions
+# of cycles under tracemalloc, so the real pipeline is soaked: sensor reads through the
+# circuit breakers (the trace has a daily sensor outage), adaptive sampling, pulse counters,
+# warnings, log strings and storage (text log or segment files with rollover) and uploads to
+# a stub MQTT broker or Domoticz server. The sensors are those configured in sensors.py.
+# The logger's memory self-report (-MemoryLog) gives the Python heap, its number of objects
+# and the RSS at checkpoints after a warm-up (each after a full garbage collection), and the
+# test fails (exit code 1) if the growth of any of them over the checkpoints, from a least
+# squares fit so one checkpoint doesn't decide it, is more than its tolerance.
+# A full run takes about 15 minutes; -Cycles 100000 (about 1.5 minutes) is enough for CI.
+import argparse
+import contextlib
+import os
+import runpy
+import sys
+import tempfile
+import time
+
+import bench_outputs
+import counters
+import domoticz
+import memory
+import mqtt
+import replay
+import sensors
+
+parser = argparse.ArgumentParser(description='Memory soak test of the logger pipeline')
+
+parser.add_argument('-Cycles', action='store', dest='Cycles', default=1000000,
+                    help='Number of measurement cycles')
+
+parser.add_argument('-Checkpoints', action='store', dest='Checkpoints', default=20,
+                    help='Number of memory checkpoints')
+
+parser.add_argument('-Warmup', action='store', dest='Warmup', default=0.1,
+                    help='Fraction of the cycles run before the first checkpoint')
+
+parser.add_argument('-Adaptive', action='store', dest='Adaptive', default=1,
+                    help='Run the logger with adaptive sampling (0 = fixed MeasurementInterval)')
+
+parser.add_argument('-Storage', action='store', dest='Storage', default='log', choices=['log', 'segment'],
+                    help='Store readings in the text log or in segment files')
+
+parser.add_argument('-Upload', action='store', dest='Upload', default='mqtt', choices=['mqtt', 'domoticz', 'none'],
+                    help='Output backend to upload to, served by a local stub server')
+
+parser.add_argument('-HeapTolerance', action='store', dest='HeapTolerance', default=64,
+                    help='Allowed Python heap growth (kB)')
+
+parser.add_argument('-ObjectTolerance', action='store', dest='ObjectTolerance', default=500,
+                    help='Allowed growth in the number of Python objects')
+
+parser.add_argument('-RSSTolerance', action='store', dest='RSSTolerance', default=1024,
+                    help='Allowed RSS growth (kB)')
+
+Directory = os.path.dirname(os.path.abspath(__file__))
+Start = 1577836800 # 2020-01-01 00:00:00 UTC
+MQTTPort = 18883
+HTTPPort = 18085
+
+# Measurement interval of the logger (the main loop tick)
+def Tick(Adaptive):
+    if Adaptive > 0:
+        return min(sensors.MinInterval[0:sensors.ActiveSensors])
+    return sensors.MeasurementInterval
+
+# Pin of the first configured pulse counter, if any
+def CounterPin():
+    for x in range(0, sensors.ActiveSensors):
+        if sensors.SensorType[x] in counters.PRESETS:
+            return int(sensors.SensorLoc[x], 10)
+    return 17
+
+# Growth of a memory figure over the checkpoints: the slope of its least squares line
+# times the time they span
+def Growth(reports, key):
+    n = len(reports)
+    t = sum(usage['time'] for usage in reports) / n
+    v = sum(usage[key] for usage in reports) / n
+    tt = sum((usage['time'] - t) ** 2 for usage in reports)
+    tv = sum((usage['time'] - t) * (usage[key] - v) for usage in reports)
+    return int(round(tv / tt * (reports[-1]['time'] - reports[0]['time']))) if tt > 0 else 0
+
+# Run MultiLogger.py in this process with the given arguments
+def RunLogger(Arguments):
+    argv = sys.argv
+    sys.argv = [os.path.join(Directory, 'MultiLogger.py')] + Arguments
+    try:
+        with open(os.devnull, 'w') as null, contextlib.redirect_stdout(null):
+            runpy.run_path(sys.argv[0], run_name='__main__')
+    finally:
+        sys.argv = argv
+
+def Soak(Cycles, Checkpoints, Warmup, Adaptive, Storage, Upload, HeapTolerance, ObjectTolerance, RSSTolerance):
+    tick = Tick(Adaptive)
+    duration = Cycles * tick
+    interval = 10 * tick
+    warmup = Start + Warmup * duration
+    report = max(int(duration * (1 - Warmup) / Checkpoints), 1)
+
+    cwd = os.getcwd()
+    server = None
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            os.mkdir('logs')
+            # One reading per trace interval, one meter pulse a minute or so, a failed sensor for an hour a day
+            replay.Synthesize('logs/trace.log', 'logs/trace.pulses', Start, (duration + 2 * interval) / 86400.0,
+                              interval, sensors.SensorName[0:sensors.ActiveSensors], CounterPin(), 3.6 / interval,
+                              OutageHour=3)
+
+            if Upload == 'mqtt':
+                server = bench_outputs.StartServer(bench_outputs.ServeMQTT, MQTTPort)
+                mqtt.IP_Address = '127.0.0.1'
+                mqtt.port = str(MQTTPort)
+            elif Upload == 'domoticz':
+                server = bench_outputs.StartServer(bench_outputs.ServeHTTP, HTTPPort)
+                domoticz.IP_Address = '127.0.0.1'
+                domoticz.port = str(HTTPPort)
+            sensors.OutputBackends = [] if Upload == 'none' else [Upload]
+
+            arguments = ['-Replay', 'logs/trace.log', '-ReplayPulses', 'logs/trace.pulses', '-ReplayUpload', '1',
+                         '-NumReadings', str(Cycles), '-Adaptive', str(Adaptive), '-LogLevel', '1',
+                         '-TraceMalloc', '1', '-MemoryReport', str(report), '-MemoryLog', 'logs/memory.log']
+            if Storage == 'segment':
+                arguments = arguments + ['-ReplayOutput', 'logs/replay.log', '-SegmentFile', 'logs/soak.seg']
+            else:
+                # Every reading is written to the text log; keep the disk use bounded
+                arguments = arguments + ['-ReplayOutput', os.devnull]
+
+            elapsed = time.perf_counter()
+            RunLogger(arguments)
+            elapsed = time.perf_counter() - elapsed
+            reports = [usage for usage in memory.ReadLog('logs/memory.log') if usage['time'] >= warmup]
+        finally:
+            if server is not None:
+                server.terminate()
+            os.chdir(cwd)
+
+    print("%12s %12s %10s %10s" % ('cycles', 'heap kB', 'objects', 'RSS kB'))
+    for usage in reports:
+        print("%12d %12d %10d %10d" % ((usage['time'] - Start) // tick, usage['traced_kb'], usage['gc_objects'], usage['rss_kb']))
+    print("%d cycles x %d sensors in %.1f s (%.1f us per cycle, traced)" % (Cycles, sensors.ActiveSensors, elapsed, 1e6 * elapsed / Cycles))
+    if len(reports) < 2:
+        print("FAIL: fewer than two memory checkpoints after the warm-up")
+        return False
+
+    failures = []
+    heap = Growth(reports, 'traced_kb')
+    objects = Growth(reports, 'gc_objects')
+    rss = Growth(reports, 'rss_kb')
+    print("growth over the checkpoints: Python heap %d kB, %d objects, RSS %d kB" % (heap, objects, rss))
+    if heap > HeapTolerance:
+        failures.append("Python heap grew by " + str(heap) + " kB")
+    if objects > ObjectTolerance:
+        failures.append("Python objects grew by " + str(objects))
+    if rss > RSSTolerance:
+        failures.append("RSS grew by " + str(rss) + " kB")
+    for failure in failures:
+        print("FAIL: " + failure)
+    if not failures:
+        print("PASS: no memory growth")
+    return not failures
+
+if __name__ == '__main__':
+    arguments = parser.parse_args()
+    passed = Soak(int(arguments.Cycles), int(arguments.Checkpoints), float(arguments.Warmup), int(arguments.Adaptive),
+                  arguments.Storage, arguments.Upload, int(arguments.HeapTolerance), int(arguments.ObjectTolerance),
+                  int(arguments.RSSTolerance))
+    sys.exit(0 if passed else 1)
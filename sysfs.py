@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# Sysfs sensor backend for thermal zones, hwmon and IIO devices
+# Each channel opens its sysfs attribute once and re-reads it with pread() at offset 0, so a
+# reading is a single system call with no file or sensor objects created per read.
+# Root, or the SysRoot argument of each lookup, can be pointed at a fake tree for testing.
+import glob
+import os
+
+Root = '/sys'
+
+def ReadAttr(path):
+    with open(path, 'r') as f:
+        return f.read().strip()
+
+class SysfsChannel(object):
+    # Reading = (raw + Offset) * Scale
+    def __init__(self, path, Scale=1.0, Offset=0.0):
+        self.Path = path
+        self.Scale = Scale
+        self.Offset = Offset
+        self._fd = os.open(path, os.O_RDONLY)
+
+    def read_raw(self):
+        return int(os.pread(self._fd, 32, 0))
+
+    def read(self):
+        return (float(os.pread(self._fd, 32, 0)) + self.Offset) * self.Scale
+
+    def close(self):
+        os.close(self._fd)
+
+# Thermal zones (e.g. the CPU temperature on zone 0), in degrees C
+def ThermalZone(Zone=0, SysRoot=None):
+    return SysfsChannel(os.path.join(SysRoot or Root, 'class/thermal/thermal_zone' + str(Zone), 'temp'), 0.001)
+
+# Find a thermal zone by its type (e.g. 'cpu-thermal')
+def FindThermalZone(Type, SysRoot=None):
+    for zone in sorted(glob.glob(os.path.join(SysRoot or Root, 'class/thermal/thermal_zone*'))):
+        if ReadAttr(os.path.join(zone, 'type')) == Type:
+            return SysfsChannel(os.path.join(zone, 'temp'), 0.001)
+    raise IOError("Thermal zone not found: " + Type)
+
+# Hwmon attributes use milli-units for temperature, voltage and current and micro-units for power
+HWMON_SCALE = {'temp': 0.001, 'in': 0.001, 'curr': 0.001, 'humidity': 0.001, 'power': 0.000001, 'energy': 0.000001}
+
+# Hwmon attribute of the device with the given name (e.g. 'cpu_thermal', 'temp1_input')
+def Hwmon(Name, Attribute, SysRoot=None):
+    for device in sorted(glob.glob(os.path.join(SysRoot or Root, 'class/hwmon/hwmon*'))):
+        if ReadAttr(os.path.join(device, 'name')) == Name:
+            kind = Attribute.split('_')[0].rstrip('0123456789')
+            return SysfsChannel(os.path.join(device, Attribute), HWMON_SCALE.get(kind, 1.0))
+    raise IOError("Hwmon device not found: " + Name)
+
+# Find an IIO device directory by 'iio:deviceN' or by driver name (e.g. 'dht11', 'mcp3008')
+def IIODevice(Device, SysRoot=None):
+    devices = os.path.join(SysRoot or Root, 'bus/iio/devices')
+    if Device.startswith('iio:device'):
+        return os.path.join(devices, Device)
+    for device in sorted(glob.glob(os.path.join(devices, 'iio:device*'))):
+        if ReadAttr(os.path.join(device, 'name')) == Device:
+            return device
+    raise IOError("IIO device not found: " + Device)
+
+# IIO channel (e.g. 'in_temp', 'in_humidityrelative', 'in_voltage0') in base units
+# (degrees C, %RH, V). Processed (_input) values are used where the driver provides them,
+# otherwise (_raw + _offset) * _scale, falling back to the scale shared by the channel type.
+def IIOChannel(Device, Channel, SysRoot=None):
+    device = IIODevice(Device, SysRoot)
+    path = os.path.join(device, Channel + '_input')
+    if os.path.exists(path):
+        return SysfsChannel(path, 0.001)
+
+    shared = Channel.rstrip('0123456789')
+    scale = 1.0
+    offset = 0.0
+    for name in (Channel, shared):
+        if os.path.exists(os.path.join(device, name + '_scale')):
+            scale = float(ReadAttr(os.path.join(device, name + '_scale')))
+            break
+    for name in (Channel, shared):
+        if os.path.exists(os.path.join(device, name + '_offset')):
+            offset = float(ReadAttr(os.path.join(device, name + '_offset')))
+            break
+    return SysfsChannel(os.path.join(device, Channel + '_raw'), scale * 0.001, offset)
+
+# Raw IIO channel (e.g. an ADC's 'in_voltage0'), for reading the raw codes with read_raw()
+# even where the driver also provides a processed _input value
+def IIORawChannel(Device, Channel, SysRoot=None):
+    return SysfsChannel(os.path.join(IIODevice(Device, SysRoot), Channel + '_raw'))